@@ -1,27 +1,181 @@
+import json
 import os
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
 
-from pyairtable import Api
+from providers import registry
 
-api = Api(os.environ["AIRTABLE_API_KEY"])
-table = api.table("appi0R6F1ckhy8JpZ", "table1")
+AIRTABLE_BASE_ID = "appi0R6F1ckhy8JpZ"
+AIRTABLE_TABLE_NAME = "table1"
 
+MEME_CATALOG_PATH = os.environ.get("MEME_CATALOG_PATH", ".cache/meme_catalog.json")
+# Snapshots younger than this are used without contacting Airtable
+MEME_CATALOG_TTL = int(os.environ.get("MEME_CATALOG_TTL", 60 * 60))
+# Incremental syncs can't see deleted records, so rescan the table this often
+MEME_CATALOG_FULL_SYNC = int(os.environ.get("MEME_CATALOG_FULL_SYNC", 24 * 60 * 60))
+# Airtable attachment URLs expire after about two hours, the URLs a run
+# uses are fetched again once they are older than this
+MEME_URL_TTL = int(os.environ.get("MEME_URL_TTL", 60 * 60))
+# Never contact Airtable, only use the snapshot
+MEME_CATALOG_OFFLINE = os.environ.get("MEME_CATALOG_OFFLINE") == "1"
 
-def get_formatted_meme_data():
-    records = table.all()
-    # Reformat the data
+# Allow for clock skew between us and Airtable when syncing incrementally
+SYNC_OVERLAP = 60
+
+
+def format_record(record, attachment_id: str = "") -> Dict[str, str]:
+    name = record["fields"].get("Name", "")
+    notes = record["fields"].get("Notes", "")
+    attachments = record["fields"].get("image") or []
+    # The attachment the snapshot already uses, otherwise the first one
+    attachment = next(
+        (a for a in attachments if attachment_id and a.get("id") == attachment_id),
+        attachments[0] if attachments else {},
+    )
+    return {
+        "name": name,
+        "notes": notes,
+        "image_url": attachment.get("url", ""),
+        "attachment_id": attachment.get("id", ""),
+        "url_fetched_at": time.time(),
+    }
+
+
+class MemeCatalog:
+    # Meme records from Airtable, loaded on first use and kept in a local
+    # snapshot that is refreshed incrementally once it is older than the TTL.
+    # Image URLs expire long before the snapshot does, so the ones a run
+    # picks are fetched again by image_urls when they have gone stale.
+
+    def __init__(
+        self,
+        snapshot_path: str = MEME_CATALOG_PATH,
+        ttl: int = MEME_CATALOG_TTL,
+        full_sync: int = MEME_CATALOG_FULL_SYNC,
+        offline: bool = MEME_CATALOG_OFFLINE,
+        url_ttl: int = MEME_URL_TTL,
+    ):
+        self.snapshot_path = snapshot_path
+        self.ttl = ttl
+        self.full_sync = full_sync
+        self.url_ttl = url_ttl
+        self.offline = offline
+        self._snapshot: Optional[dict] = None
+        self._table = None
+        self._lock = threading.Lock()
+
+    @property
+    def table(self):
+        if self._table is None:
+            api = registry.get("airtable")
+            self._table = api.table(AIRTABLE_BASE_ID, AIRTABLE_TABLE_NAME)
+        return self._table
+
+    def memes(self) -> Dict[str, Dict[str, str]]:
+        records = self.snapshot()["records"]
+        return {
+            record["name"]: {"notes": record["notes"], "image_url": record["image_url"]}
+            for record in records.values()
+        }
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            if self._snapshot is None:
+                self._snapshot = self._load()
 
-    # Reformat the data
-    reformatted_data = {}
+            age = time.time() - self._snapshot["synced_at"]
+            if not self.offline and age > self.ttl:
+                try:
+                    self._sync()
+                except Exception as e:
+                    if not self._snapshot["synced_at"]:
+                        raise
+                    print(f"Failed to sync meme catalog, using snapshot: {e}")
+            return self._snapshot
 
-    for record in records:
-        name = record["fields"].get("Name", "")
-        notes = record["fields"].get("Notes", "")
-        image_url = ""
+    def image_urls(self, names: List[str]) -> List[str]:
+        # Fetches the records of the given memes again when their attachment
+        # URLs are older than the URL TTL, in a single request
+        records = {
+            record["name"]: (record_id, record)
+            for record_id, record in self.snapshot()["records"].items()
+        }
+        now = time.time()
+        stale = {
+            records[name][0]: records[name][1]
+            for name in set(names)
+            if now - records[name][1].get("url_fetched_at", 0) > self.url_ttl
+        }
+        if stale and self.offline:
+            print(f"Offline meme catalog may hold {len(stale)} expired image URLs")
+        elif stale:
+            with self._lock:
+                try:
+                    self._refresh_urls(stale)
+                except Exception as e:
+                    print(f"Failed to refresh meme image URLs: {e}")
+        return [records[name][1]["image_url"] for name in names]
 
-        # Get the first image URL if available
-        if "image" in record["fields"] and record["fields"]["image"]:
-            image_url = record["fields"]["image"][0].get("url", "")
+    def _refresh_urls(self, stale: Dict[str, Dict[str, str]]):
+        ids = ",".join(f"RECORD_ID()='{record_id}'" for record_id in stale)
+        fetched = self.table.all(formula=f"OR({ids})")
+        print(f"Refreshed image URLs of {len(fetched)} memes")
+        for record in fetched:
+            previous = stale[record["id"]]
+            previous.update(format_record(record, previous.get("attachment_id", "")))
+        self._save()
 
-        reformatted_data[name] = {"notes": notes, "image_url": image_url}
+    def refresh(self, full: bool = False):
+        with self._lock:
+            if self._snapshot is None:
+                self._snapshot = self._load()
+            if full:
+                self._snapshot["full_synced_at"] = 0
+            self._sync()
 
-    return reformatted_data
+    def _load(self) -> dict:
+        try:
+            with open(self.snapshot_path) as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {"synced_at": 0, "full_synced_at": 0, "records": {}}
+
+    def _sync(self):
+        started_at = time.time()
+        snapshot = self._snapshot
+        if started_at - snapshot["full_synced_at"] > self.full_sync:
+            print("Loading full meme catalog from Airtable")
+            records = self.table.all()
+            snapshot["records"] = {}
+            snapshot["full_synced_at"] = started_at
+        else:
+            since = datetime.fromtimestamp(
+                snapshot["synced_at"] - SYNC_OVERLAP, tz=timezone.utc
+            ).strftime("%Y-%m-%dT%H:%M:%S.000Z")
+            records = self.table.all(
+                formula=f"IS_AFTER(LAST_MODIFIED_TIME(), '{since}')"
+            )
+            print(f"Fetched {len(records)} memes modified since {since}")
+
+        for record in records:
+            snapshot["records"][record["id"]] = format_record(record)
+        snapshot["synced_at"] = started_at
+        self._save()
+
+    def _save(self):
+        directory = os.path.dirname(self.snapshot_path) or "."
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=directory)
+        with os.fdopen(fd, "w") as f:
+            json.dump(self._snapshot, f)
+        os.replace(temp_path, self.snapshot_path)
+
+
+meme_catalog = MemeCatalog()
+
+
+def get_formatted_meme_data():
+    return meme_catalog.memes()
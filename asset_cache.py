@@ -0,0 +1,192 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from typing import Any, Dict, Optional
+
+ASSET_CACHE_DIR = os.environ.get("ASSET_CACHE_DIR", ".cache/assets")
+ASSET_CACHE_MAX_BYTES = int(os.environ.get("ASSET_CACHE_MAX_BYTES", 2 * 1024**3))
+# "on" reads and writes, "refresh" skips reads but stores new results, "off"
+# bypasses the cache entirely
+ASSET_CACHE_MODE = os.environ.get("ASSET_CACHE", "on")
+
+CACHE_MODES = ["on", "off", "refresh"]
+
+
+def normalize(value: Any) -> Any:
+    if isinstance(value, str):
+        return " ".join(value.split())
+    if isinstance(value, dict):
+        return {str(k): normalize(v) for k, v in sorted(value.items())}
+    if isinstance(value, (list, tuple)):
+        return [normalize(v) for v in value]
+    return value
+
+
+def cache_key(source: str, **params) -> str:
+    payload = json.dumps(
+        {"source": source, "params": normalize(params)}, sort_keys=True
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class AssetCache:
+    # Content-addressed store for generated assets. Each entry holds either a
+    # file, a JSON value or both, and the index tracks the metadata used for
+    # LRU eviction.
+
+    def __init__(
+        self,
+        root: str = ASSET_CACHE_DIR,
+        max_bytes: int = ASSET_CACHE_MAX_BYTES,
+        mode: str = ASSET_CACHE_MODE,
+    ):
+        if mode not in CACHE_MODES:
+            raise ValueError(
+                f"Unknown cache mode {mode}, expected one of {CACHE_MODES}"
+            )
+        self.root = root
+        self.max_bytes = max_bytes
+        self.mode = mode
+        self._entries: Optional[Dict[str, Dict[str, Any]]] = None
+        self._lock = threading.RLock()
+
+    @property
+    def index_path(self):
+        return os.path.join(self.root, "index.json")
+
+    @property
+    def entries(self) -> Dict[str, Dict[str, Any]]:
+        if self._entries is None:
+            try:
+                with open(self.index_path) as f:
+                    self._entries = json.load(f)
+            except (FileNotFoundError, json.JSONDecodeError):
+                self._entries = {}
+        return self._entries
+
+    def path(self, entry: Dict[str, Any]) -> Optional[str]:
+        if not entry.get("file"):
+            return None
+        return os.path.join(self.root, entry["file"])
+
+    def get(
+        self, key: str, max_age: Optional[float] = None
+    ) -> Optional[Dict[str, Any]]:
+        # max_age is for values that stop working, like temporary URLs
+        if self.mode != "on":
+            return None
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            path = self.path(entry)
+            expired = (
+                max_age is not None and time.time() - entry["created_at"] > max_age
+            )
+            if expired or (path and not os.path.exists(path)):
+                if path and os.path.exists(path):
+                    os.remove(path)
+                del self.entries[key]
+                self._save()
+                return None
+            entry["last_used"] = time.time()
+            self._save()
+            print(f"Asset cache hit for {entry['source']} ({key[:12]})")
+            return entry
+
+    def read_bytes(self, entry: Dict[str, Any]) -> bytes:
+        with open(self.path(entry), "rb") as f:
+            return f.read()
+
+    def copy_to(self, entry: Dict[str, Any], output_path: str) -> str:
+        os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+        shutil.copyfile(self.path(entry), output_path)
+        return output_path
+
+    def put(
+        self,
+        key: str,
+        source: str,
+        data: Optional[bytes] = None,
+        value: Any = None,
+        provider_id: Optional[str] = None,
+        suffix: str = "",
+    ) -> Optional[Dict[str, Any]]:
+        if self.mode == "off":
+            return None
+
+        now = time.time()
+        entry = {
+            "source": source,
+            "provider_id": provider_id,
+            "created_at": now,
+            "last_used": now,
+            "value": value,
+            "file": None,
+            "size": len(json.dumps(value)),
+        }
+
+        with self._lock:
+            if data is not None:
+                entry["file"] = os.path.join(key[:2], key + suffix)
+                entry["size"] += len(data)
+                self._write_atomic(self.path(entry), data)
+
+            self.entries[key] = entry
+            self._evict()
+            self._save()
+        return entry
+
+    def discard(self, source: str, provider_id: str):
+        # Drops entries whose provider result turned out to be unusable, so
+        # the next lookup creates a new one
+        if self.mode == "off":
+            return
+        with self._lock:
+            stale = [
+                key
+                for key, entry in self.entries.items()
+                if entry["source"] == source and entry["provider_id"] == provider_id
+            ]
+            for key in stale:
+                print(f"Discarding {source} ({key[:12]}) from asset cache")
+                path = self.path(self.entries[key])
+                if path and os.path.exists(path):
+                    os.remove(path)
+                del self.entries[key]
+            if stale:
+                self._save()
+
+    def total_size(self) -> int:
+        return sum(entry["size"] for entry in self.entries.values())
+
+    def _evict(self):
+        total = self.total_size()
+        for key, entry in sorted(
+            self.entries.items(), key=lambda kv: kv[1]["last_used"]
+        ):
+            if total <= self.max_bytes:
+                break
+            print(f"Evicting {entry['source']} ({key[:12]}) from asset cache")
+            path = self.path(entry)
+            if path and os.path.exists(path):
+                os.remove(path)
+            total -= entry["size"]
+            del self.entries[key]
+
+    def _save(self):
+        self._write_atomic(self.index_path, json.dumps(self.entries).encode())
+
+    def _write_atomic(self, path: str, data: bytes):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, path)
+
+
+asset_cache = AssetCache()
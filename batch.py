@@ -0,0 +1,144 @@
+import argparse
+import asyncio
+import os
+import time
+from datetime import timedelta
+from typing import List, Optional
+
+from asset_cache import CACHE_MODES, asset_cache
+from combine_clips import segment_cache
+from generate_audio import AUDIO_FORMAT, TTS_CONTEXTS
+from http_client import close as close_http
+from main import run_job
+from mux_audio_and_video import AUDIO_FILES
+from render_profiles import RENDER_PROFILE, RENDER_PROFILES
+from tracing import span, tracer
+from workspace import Workspace
+
+# Jobs running at once, provider and ffmpeg limits are shared between them
+BATCH_JOBS = int(os.environ.get("BATCH_JOBS", 4))
+
+
+def job_name(source_path: str) -> str:
+    return os.path.splitext(os.path.basename(source_path))[0]
+
+
+async def render_source(
+    source_path: str,
+    output_dir: str,
+    limiter: asyncio.Semaphore,
+    single_pass: bool,
+    audio_format: str,
+    tts_contexts: int,
+    resume: bool = False,
+    render_profile: str = RENDER_PROFILE,
+) -> Optional[str]:
+    name = job_name(source_path)
+    with open(source_path) as f:
+        source_markdown = f.read()
+
+    async with limiter:
+        start = time.time()
+        print(f"Starting job {name}")
+        job_workspace = Workspace(os.path.join(output_dir, name))
+        try:
+            with span("job", job=name):
+                await run_job(
+                    source_markdown,
+                    job_workspace,
+                    single_pass,
+                    audio_format,
+                    tts_contexts,
+                    resume,
+                    render_profile,
+                )
+        except Exception as e:
+            print(f"Job {name} failed: {type(e).__name__}: {e}")
+            return None
+        print(f"Job {name} completed in {timedelta(seconds=time.time() - start)}")
+        return job_workspace.final_output
+
+
+async def render_batch(
+    source_paths: List[str],
+    output_dir: str,
+    jobs: int = BATCH_JOBS,
+    single_pass: bool = False,
+    audio_format: str = AUDIO_FORMAT,
+    tts_contexts: int = TTS_CONTEXTS,
+    resume: bool = False,
+    render_profile: str = RENDER_PROFILE,
+) -> List[Optional[str]]:
+    names = [job_name(path) for path in source_paths]
+    if len(set(names)) != len(names):
+        raise ValueError("Source documents need distinct file names")
+
+    limiter = asyncio.Semaphore(jobs)
+    try:
+        # Each job runs in its own task, so its workspace stays its own
+        return await asyncio.gather(
+            *(
+                render_source(
+                    path,
+                    output_dir,
+                    limiter,
+                    single_pass,
+                    audio_format,
+                    tts_contexts,
+                    resume,
+                    render_profile,
+                )
+                for path in source_paths
+            )
+        )
+    finally:
+        await close_http()
+        tracer.finish()
+
+
+if __name__ == "__main__":
+    batch_start_time = time.time()
+    parser = argparse.ArgumentParser(description="Render one video per source document")
+    parser.add_argument("sources", nargs="+", help="Markdown source documents")
+    parser.add_argument(
+        "--output-dir",
+        default="renders",
+        help="Each job works in and writes final_output.mp4 to <dir>/<source name>",
+    )
+    parser.add_argument("--jobs", type=int, default=BATCH_JOBS)
+    parser.add_argument("--single-pass", action="store_true")
+    parser.add_argument("--cache", choices=CACHE_MODES, default=asset_cache.mode)
+    parser.add_argument(
+        "--audio-format", choices=list(AUDIO_FILES), default=AUDIO_FORMAT
+    )
+    parser.add_argument("--tts-contexts", type=int, default=TTS_CONTEXTS)
+    parser.add_argument("--trace", metavar="PATH", default=tracer.path)
+    parser.add_argument(
+        "--profile", choices=list(RENDER_PROFILES), default=RENDER_PROFILE
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Continue each job from the run manifest in its workspace",
+    )
+    args = parser.parse_args()
+    asset_cache.mode = args.cache
+    segment_cache.mode = args.cache
+    if args.trace:
+        tracer.enable(args.trace)
+
+    outputs = asyncio.run(
+        render_batch(
+            args.sources,
+            args.output_dir,
+            args.jobs,
+            args.single_pass,
+            args.audio_format,
+            args.tts_contexts,
+            args.resume,
+            args.profile,
+        )
+    )
+    for source, output in zip(args.sources, outputs):
+        print(f"{source}: {output or 'failed'}")
+    print(f"Batch completed in {timedelta(seconds=time.time() - batch_start_time)}")
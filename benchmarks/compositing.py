@@ -0,0 +1,125 @@
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+from compositing import compose_meme_backdrop, compose_tweet_backdrop, run_in_process
+
+SIZES = [(600, 800), (1200, 2400), (2400, 4800), (4000, 8000)]
+
+
+def synthetic_screenshot(width: int, height: int) -> Image.Image:
+    # Mostly flat regions with some noise, like a rendered tweet
+    rng = np.random.default_rng(0)
+    pixels = np.full((height, width, 3), 245, dtype=np.uint8)
+    pixels[height // 4 : height // 2, width // 8 : -width // 8] = rng.integers(
+        0, 255, (height // 2 - height // 4, width - 2 * (width // 8), 3), dtype=np.uint8
+    )
+    return Image.fromarray(pixels)
+
+
+def legacy_meme_backdrop(image_bytes: bytes, width=1080, height=1920) -> bytes:
+    # meme.create_meme_backdrop before the compositing module
+    meme_image = Image.open(BytesIO(image_bytes))
+    average_color = np.mean(np.array(meme_image))
+    background_color = (0, 0, 0) if average_color > 128 else (255, 255, 255)
+    backdrop = Image.new("RGB", (width, height), background_color)
+    if meme_image.width / meme_image.height > width / height:
+        new_width, new_height = (
+            width,
+            int(width / (meme_image.width / meme_image.height)),
+        )
+    else:
+        new_width, new_height = (
+            int(height * (meme_image.width / meme_image.height)),
+            height,
+        )
+    meme_image = meme_image.resize((new_width, new_height), Image.LANCZOS)
+    backdrop.paste(meme_image, ((width - new_width) // 2, (height - new_height) // 2))
+    output = BytesIO()
+    backdrop.save(output, format="PNG")
+    return output.getvalue()
+
+
+def legacy_tweet_backdrop(image_path: str) -> bytes:
+    # twitter_capture.create_backdrop before the compositing module
+    tweet_image = Image.open(image_path)
+    padding = 50
+    padded_width = tweet_image.width + 2 * padding
+    padded_height = tweet_image.height + 2 * padding
+    backdrop_width = max(padded_width, int(padded_height * 9 / 16))
+    backdrop_height = max(padded_height, int(padded_width * 16 / 9))
+    colors = tweet_image.getcolors(tweet_image.size[0] * tweet_image.size[1])
+    avg_color = sum(c[0] * c[1][0] for c in colors) / sum(c[0] for c in colors)
+    bg_color = "white" if avg_color < 128 else "black"
+    backdrop = Image.new("RGB", (backdrop_width, backdrop_height), bg_color)
+    padded = Image.new("RGBA", (padded_width, padded_height), (0, 0, 0, 0))
+    padded.paste(tweet_image, (padding, padding))
+    backdrop.paste(
+        padded,
+        ((backdrop_width - padded_width) // 2, (backdrop_height - padded_height) // 2),
+        padded,
+    )
+    output = BytesIO()
+    backdrop.save(output, format="PNG")
+    return output.getvalue()
+
+
+def timed(fn, *args, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+async def overlapped(fn, args, count: int) -> float:
+    start = time.perf_counter()
+    await asyncio.gather(*(run_in_process(fn, *args) for _ in range(count)))
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        print(f"{'size':>11} {'path':>6} {'legacy':>9} {'new':>9} {'speedup':>8}")
+        for width, height in SIZES:
+            image = synthetic_screenshot(width, height)
+            path = os.path.join(work_dir, f"tweet_{width}x{height}.png")
+            image.save(path)
+            buffer = BytesIO()
+            image.save(buffer, format="PNG")
+            image_bytes = buffer.getvalue()
+
+            for name, legacy, new, arg in [
+                ("meme", legacy_meme_backdrop, compose_meme_backdrop, image_bytes),
+                ("tweet", legacy_tweet_backdrop, compose_tweet_backdrop, path),
+            ]:
+                legacy_time = timed(legacy, arg, repeat=args.repeat)
+                new_time = timed(new, arg, repeat=args.repeat)
+                print(
+                    f"{width:>5}x{height:<5} {name:>6} {legacy_time * 1000:7.1f}ms "
+                    f"{new_time * 1000:7.1f}ms {legacy_time / new_time:7.1f}x"
+                )
+
+        count = os.cpu_count() or 1
+        path = os.path.join(work_dir, f"tweet_{SIZES[2][0]}x{SIZES[2][1]}.png")
+        serial = timed(compose_tweet_backdrop, path, repeat=1) * count
+        pooled = asyncio.run(overlapped(compose_tweet_backdrop, (path,), count))
+        print(
+            f"{count} tweet backdrops through run_in_process: {pooled:.2f}s "
+            f"(serial estimate {serial:.2f}s)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import tempfile
+import time
+
+import aiohttp
+from aiohttp import web
+
+from asset_cache import asset_cache
+from benchmarks.pipeline import DEFAULT_LATENCY, write_fixture
+from combine_clips import segment_cache
+from daemon import RenderDaemon
+from replay import parse_latency, replay_session
+
+
+async def render(session: aiohttp.ClientSession, source: str, profile: str):
+    # Submits a job and follows its events, returns the latency until the job
+    # finished and until its first item started
+    start = time.perf_counter()
+    async with session.post(
+        "http://daemon/jobs", json={"source": source, "profile": profile}
+    ) as response:
+        job = await response.json()
+    first_item = None
+    state = None
+    async with session.get(f"http://daemon/jobs/{job['id']}/events") as response:
+        async for line in response.content:
+            event = json.loads(line)
+            if event["event"] == "item" and first_item is None:
+                first_item = time.perf_counter() - start
+            if event["event"] == "job":
+                state = event["state"]
+    return state, time.perf_counter() - start, first_item
+
+
+async def load_level(socket_path: str, concurrency: int, jobs: int, profile: str):
+    limiter = asyncio.Semaphore(concurrency)
+    connector = aiohttp.UnixConnector(path=socket_path)
+    async with aiohttp.ClientSession(connector=connector) as session:
+
+        async def client(i):
+            async with limiter:
+                return await render(session, f"story {concurrency}-{i}", profile)
+
+        start = time.perf_counter()
+        results = await asyncio.gather(*(client(i) for i in range(jobs)))
+        return time.perf_counter() - start, results
+
+
+async def run(args, socket_path: str):
+    daemon = RenderDaemon(max(args.concurrency))
+    runner = web.AppRunner(daemon.app())
+    await runner.setup()
+    await web.UnixSite(runner, socket_path).start()
+    rows = []
+    try:
+        for concurrency in args.concurrency:
+            jobs = args.jobs or concurrency * 2
+            total, results = await load_level(
+                socket_path, concurrency, jobs, args.profile
+            )
+            latencies = sorted(latency for _, latency, _ in results)
+            first_items = [first for _, _, first in results if first is not None]
+            failed = sum(state != "completed" for state, _, _ in results)
+            rows.append(
+                (
+                    concurrency,
+                    jobs,
+                    jobs / total * 60,
+                    latencies[len(latencies) // 2],
+                    latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+                    statistics.median(first_items) if first_items else 0.0,
+                    failed,
+                )
+            )
+    finally:
+        await runner.cleanup()
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, default=3)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument(
+        "--jobs", type=int, help="Jobs per concurrency level, twice the level"
+    )
+    parser.add_argument("--profile", default="draft")
+    parser.add_argument("--latency", default=DEFAULT_LATENCY)
+    parser.add_argument("--time-scale", type=float, default=0.02)
+    args = parser.parse_args()
+
+    # Every job renders from scratch, cached segments would hide the load
+    asset_cache.mode = "off"
+    segment_cache.mode = "off"
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as work_dir:
+        fixture_dir = os.path.join(work_dir, "fixture")
+        write_fixture(fixture_dir, args.items)
+        os.chdir(work_dir)
+        try:
+            latency = parse_latency(args.latency)
+            with replay_session("replay", fixture_dir, latency, args.time_scale):
+                rows = asyncio.run(run(args, os.path.join(work_dir, "daemon.sock")))
+        finally:
+            os.chdir(cwd)
+
+    print(
+        f"\n{'clients':>7} {'jobs':>5} {'jobs/min':>9} {'p50':>8} {'p95':>8} "
+        f"{'first item':>10} {'failed':>6}"
+    )
+    for concurrency, jobs, throughput, p50, p95, first_item, failed in rows:
+        print(
+            f"{concurrency:>7} {jobs:>5} {throughput:9.1f} {p50:7.2f}s {p95:7.2f}s "
+            f"{first_item:9.2f}s {failed:>6}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+import argparse
+import asyncio
+import time
+
+import aiohttp
+from aiohttp import web
+
+from http_client import HttpClient, ProviderLimits, TokenBucket
+
+
+class FakeProvider:
+    # Rate limits like a provider API: requests over the budget get a 429,
+    # and every new TCP connection pays a simulated TLS handshake
+    def __init__(self, rate: float, burst: int, handshake: float, latency: float):
+        self.bucket = TokenBucket(rate, burst)
+        self.handshake = handshake
+        self.latency = latency
+        self.connections = set()
+        self.throttled = 0
+
+    async def handle(self, request: web.Request) -> web.Response:
+        peer = request.transport.get_extra_info("peername")
+        if peer not in self.connections:
+            self.connections.add(peer)
+            await asyncio.sleep(self.handshake)
+        if not self.try_acquire():
+            self.throttled += 1
+            return web.Response(status=429)
+        await asyncio.sleep(self.latency)
+        return web.json_response({"data": [{"url": "https://example.invalid"}]})
+
+    def try_acquire(self) -> bool:
+        bucket = self.bucket
+        now = asyncio.get_running_loop().time()
+        if bucket.updated is not None:
+            elapsed = now - bucket.updated
+            bucket.tokens = min(bucket.capacity, bucket.tokens + elapsed * bucket.rate)
+        bucket.updated = now
+        if bucket.tokens >= 1:
+            bucket.tokens -= 1
+            return True
+        return False
+
+
+async def serve(provider: FakeProvider):
+    app = web.Application()
+    app.router.add_post("/generate", provider.handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}/generate"
+
+
+async def session_per_request(url: str, count: int):
+    # ideogram.generate_ideo_image before the shared transport
+    async def one():
+        async with aiohttp.ClientSession() as session:
+            async with session.post(url, json={}) as response:
+                await response.read()
+                return response.status
+
+    return await asyncio.gather(*(one() for _ in range(count)))
+
+
+async def shared_transport(url: str, count: int, limits: ProviderLimits):
+    client = HttpClient({"default": limits})
+    try:
+        responses = await asyncio.gather(
+            *(client.request("default", "POST", url, json={}) for _ in range(count))
+        )
+        return [response.status for response in responses]
+    finally:
+        await client.close()
+
+
+async def run(name: str, fn, args, count: int):
+    provider = FakeProvider(args.rate, args.burst, args.handshake, args.latency)
+    runner, url = await serve(provider)
+    try:
+        start = time.perf_counter()
+        statuses = await fn(url, count)
+        elapsed = time.perf_counter() - start
+    finally:
+        await runner.cleanup()
+    ok = sum(status == 200 for status in statuses)
+    print(
+        f"{name:>20}: {ok}/{count} ok, {provider.throttled} throttled, "
+        f"{len(provider.connections)} connections, {elapsed:.2f}s"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--count", type=int, default=24)
+    parser.add_argument("--rate", type=float, default=8)
+    parser.add_argument("--burst", type=int, default=8)
+    parser.add_argument("--handshake", type=float, default=0.1)
+    parser.add_argument("--latency", type=float, default=0.05)
+    args = parser.parse_args()
+
+    # Client limits sit just under the provider's so a burst never trips it
+    limits = ProviderLimits(
+        rate=args.rate * 0.9, burst=args.burst - 1, concurrency=8, retries=3
+    )
+
+    async def bench():
+        await run("session per request", session_per_request, args, args.count)
+        await run(
+            "shared transport",
+            lambda url, count: shared_transport(url, count, limits),
+            args,
+            args.count,
+        )
+
+    asyncio.run(bench())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+# Dependencies only the stages that use them should pay for
+HEAVY_MODULES = [
+    "aiohttp",
+    "boto3",
+    "botocore",
+    "cartesia",
+    "lumaai",
+    "numpy",
+    "openai",
+    "PIL",
+    "pyairtable",
+    "selenium",
+    "tweetcapture",
+]
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def import_times(module: str):
+    # Cumulative microseconds per module from python -X importtime, with the
+    # nesting depth of each import under the one that triggered it
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=REPO_ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        times.append((name.strip(), depth, int(cumulative)))
+    return times
+
+
+def loaded_heavy_modules(module: str):
+    result = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            f"import sys, {module}; print(' '.join(sys.modules))",
+        ],
+        cwd=REPO_ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    loaded = set(result.stdout.split())
+    return [name for name in HEAVY_MODULES if name in loaded]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--module", default="main")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument(
+        "--budget",
+        type=float,
+        default=float(os.environ.get("IMPORT_BUDGET_MS", 500)),
+        help="Fail when the median import takes longer, in milliseconds",
+    )
+    parser.add_argument("--top", type=int, default=8)
+    args = parser.parse_args()
+
+    runs = [import_times(args.module) for _ in range(args.runs)]
+    totals = [
+        next(cumulative for name, depth, cumulative in times if name == args.module)
+        for times in runs
+    ]
+    median = statistics.median(totals) / 1000
+
+    # Direct imports of the module, slowest first, from the median run
+    times = runs[totals.index(sorted(totals)[len(totals) // 2])]
+    position = next(i for i, (name, _, _) in enumerate(times) if name == args.module)
+    children = []
+    for name, depth, cumulative in reversed(times[:position]):
+        if depth == 0:
+            break
+        if depth == 1:
+            children.append((cumulative, name))
+    for cumulative, name in sorted(children, reverse=True)[: args.top]:
+        print(f"{name:>20}: {cumulative / 1000:7.1f}ms")
+
+    heavy = loaded_heavy_modules(args.module)
+    print(f"\nimport {args.module}: {median:.1f}ms median of {args.runs}")
+    print(f"budget: {args.budget:.0f}ms")
+    failures = []
+    if median > args.budget:
+        failures.append(f"import took {median:.1f}ms, over the budget")
+    if heavy:
+        failures.append(f"imported eagerly: {', '.join(heavy)}")
+    for failure in failures:
+        print(failure)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
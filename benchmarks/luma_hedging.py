@@ -0,0 +1,82 @@
+import argparse
+import asyncio
+import random
+import statistics
+import time
+from types import SimpleNamespace
+
+import luma
+from benchmarks.luma_tracker import FakeGenerations
+from luma import GenerationTracker, HedgePolicy, current_hedge_policy, poll_generation
+
+
+def sample_duration(rng: random.Random) -> float:
+    # Most generations land close together, a few straggle
+    if rng.random() < 0.1:
+        return rng.uniform(4.0, 6.0)
+    return rng.uniform(1.0, 1.6)
+
+
+async def run(items: int, budget: int, percentile: float, seed: int):
+    rng = random.Random(seed)
+    generations = FakeGenerations({})
+    tracker = GenerationTracker(
+        SimpleNamespace(generations=generations), min_interval=0.05, max_interval=0.25
+    )
+    # Durations learned from past runs
+    tracker.durations.extend(sample_duration(rng) for _ in range(50))
+    luma.tracker = tracker
+    current_hedge_policy.set(HedgePolicy(budget, percentile))
+    submitted = 0
+
+    async def create():
+        nonlocal submitted
+        submitted += 1
+        generation_id = f"gen-{submitted}"
+        generations.durations[generation_id] = sample_duration(rng)
+        generations.started[generation_id] = time.monotonic()
+        return generation_id
+
+    async def item():
+        start = time.monotonic()
+        await poll_generation(await create(), hedge=create)
+        return time.monotonic() - start
+
+    start = time.monotonic()
+    latencies = sorted(await asyncio.gather(*(item() for _ in range(items))))
+    return time.monotonic() - start, latencies, submitted - items
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, default=24)
+    parser.add_argument("--budget", type=int, default=4)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--percentiles", type=float, nargs="+", default=[0.9, 0.8, 0.7])
+    args = parser.parse_args()
+
+    # Means over the same seeded runs for every policy
+    policies = [("no hedge", 0, 1.0)] + [
+        (f"p{percentile * 100:.0f}", args.budget, percentile)
+        for percentile in args.percentiles
+    ]
+    rows = []
+    for name, budget, percentile in policies:
+        p50s, p95s, totals, extras = [], [], [], []
+        for seed in range(args.runs):
+            total, latencies, extra = asyncio.run(
+                run(args.items, budget, percentile, seed)
+            )
+            p50s.append(latencies[len(latencies) // 2])
+            p95s.append(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))])
+            totals.append(total)
+            extras.append(extra)
+        rows.append((name, *(statistics.mean(v) for v in [p50s, p95s, totals, extras])))
+
+    print(f"\n{'policy':>10} {'p50':>7} {'p95':>7} {'slowest':>8} {'extra':>6}")
+    for name, p50, p95, total, extra in rows:
+        print(f"{name:>10} {p50:6.2f}s {p95:6.2f}s {total:7.2f}s {extra:6.1f}")
+
+
+if __name__ == "__main__":
+    main()
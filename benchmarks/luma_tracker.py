@@ -0,0 +1,54 @@
+import asyncio
+import random
+import time
+from types import SimpleNamespace
+
+from luma import GenerationTracker
+
+GENERATIONS = 12
+REQUEST_LATENCY = 0.02
+
+
+class FakeGenerations:
+    def __init__(self, durations):
+        self.durations = durations
+        self.started = {}
+
+    async def get(self, generation_id):
+        await asyncio.sleep(REQUEST_LATENCY)
+        started = self.started.setdefault(generation_id, time.monotonic())
+        done = time.monotonic() - started >= self.durations[generation_id]
+        return SimpleNamespace(
+            id=generation_id,
+            state="completed" if done else "dreaming",
+            failure_reason=None,
+        )
+
+
+async def run(durations):
+    generations = FakeGenerations(durations)
+    client = SimpleNamespace(generations=generations)
+    tracker = GenerationTracker(client, min_interval=0.05, max_interval=0.25)
+
+    start = time.monotonic()
+    for generation_id in durations:
+        generations.started[generation_id] = start
+    await asyncio.gather(*(tracker.track(gid) for gid in durations))
+    return time.monotonic() - start
+
+
+def main():
+    random.seed(0)
+    durations = {f"gen-{i}": random.uniform(0.5, 2.0) for i in range(GENERATIONS)}
+
+    elapsed = asyncio.run(run(durations))
+    slowest = max(durations.values())
+    serial = sum(durations.values())
+
+    print(f"{GENERATIONS} concurrent generations finished in {elapsed:.2f}s")
+    print(f"slowest single generation: {slowest:.2f}s, serial sum: {serial:.2f}s")
+    assert elapsed < slowest + 0.5, "tracker is not overlapping generations"
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+import subprocess
+
+from captions import format_time
+from generate_audio import sample_rate
+
+
+def make_video(path: str, duration: float, size: str = "1280x720", rate: int = 24):
+    # fmt: off
+    subprocess.run([
+        "ffmpeg", "-y", "-loglevel", "error",
+        "-f", "lavfi", "-i", f"testsrc2=size={size}:rate={rate}:duration={duration}",
+        "-c:v", "libx264", "-preset", "ultrafast", "-pix_fmt", "yuv420p",
+        path,
+    ], check=True)
+    # fmt: on
+    return path
+
+
+def make_image(path: str, size: str = "1080x1920"):
+    # fmt: off
+    subprocess.run([
+        "ffmpeg", "-y", "-loglevel", "error",
+        "-f", "lavfi", "-i", f"testsrc2=size={size}:rate=1",
+        "-frames:v", "1",
+        path,
+    ], check=True)
+    # fmt: on
+    return path
+
+
+def make_audio_pcm(path: str, duration: float):
+    # Same raw format Cartesia streams into audio.pcm
+    # fmt: off
+    subprocess.run([
+        "ffmpeg", "-y", "-loglevel", "error",
+        "-f", "lavfi", "-i", f"sine=frequency=440:sample_rate={sample_rate}:duration={duration}",
+        "-f", "f32le", "-ac", "1",
+        path,
+    ], check=True)
+    # fmt: on
+    return path
+
+
+def make_captions(path: str, duration: float, cue_length: float = 1.5):
+    with open(path, "w") as srt_file:
+        start = 0.0
+        index = 1
+        while start < duration:
+            end = min(start + cue_length, duration)
+            srt_file.write(f"{index}\n")
+            srt_file.write(f"{format_time(start)} --> {format_time(end)}\n")
+            srt_file.write(f"caption number {index}\n\n")
+            start = end
+            index += 1
+    return path
@@ -0,0 +1,77 @@
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from meme_index import MemeIndex, load_meme_index
+
+WORDS = (
+    "cat dog boyfriend girlfriend distracted drake button sweating choice "
+    "brain galaxy expanding stonks wojak doomer bloomer chad virgin fire "
+    "fine everything office handshake epic spiderman pointing panik kalm "
+    "change mind table surprised pikachu success kid grumpy doge shiba "
+    "bernie mittens again asking guy tapping head roll safe think about "
+    "it disaster girl house burning smirk this is fine elmo rise hell "
+    "money printer brr gru plan whiteboard anakin padme right trade offer"
+).split()
+
+
+def synthetic_memes(count: int, rng: random.Random):
+    memes = {}
+    for i in range(count):
+        name = " ".join(rng.sample(WORDS, 3)) + f" {i}"
+        notes = " ".join(rng.choices(WORDS, k=rng.randint(8, 30)))
+        memes[name] = {"notes": notes, "image_url": f"https://example.com/{i}.png"}
+    return memes
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--memes", type=int, default=3000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("-k", type=int, default=8)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    memes = synthetic_memes(args.memes, rng)
+
+    start = time.perf_counter()
+    index = MemeIndex.build(memes)
+    build_time = time.perf_counter() - start
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        path = os.path.join(work_dir, "meme_index.npz")
+        index.save(path)
+        start = time.perf_counter()
+        load_meme_index(memes, path)
+        load_time = time.perf_counter() - start
+
+    names = list(memes)
+    latencies = []
+    hits = 0
+    for _ in range(args.queries):
+        # Query with a noisy paraphrase of a known meme
+        target = rng.choice(names)
+        words = memes[target]["notes"].split()
+        query = " ".join(rng.sample(words, max(3, len(words) // 3)))
+        query += " " + " ".join(target.split()[:2])
+
+        start = time.perf_counter()
+        results = index.search(query, k=args.k)
+        latencies.append(time.perf_counter() - start)
+        hits += any(name == target for name, _ in results)
+
+    latencies.sort()
+    print(f"built index for {args.memes} memes in {build_time * 1000:.1f}ms")
+    print(f"loaded persisted index in {load_time * 1000:.1f}ms")
+    print(
+        f"query p50 {statistics.median(latencies) * 1000:.3f}ms, "
+        f"p95 {latencies[int(len(latencies) * 0.95)] * 1000:.3f}ms"
+    )
+    print(f"target in top {args.k}: {hits / args.queries:.1%}")
+
+
+if __name__ == "__main__":
+    main()
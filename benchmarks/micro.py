@@ -0,0 +1,295 @@
+import argparse
+import asyncio
+import inspect
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from io import BytesIO
+from typing import Any, Awaitable, Callable, Dict, List, NamedTuple, Optional, Union
+
+from aiohttp import web
+
+from asset_cache import asset_cache
+from benchmarks.compositing import synthetic_screenshot
+from benchmarks.media import make_audio_pcm, make_captions
+from benchmarks.render import CLIP_DURATION, make_clips
+from captions import format_time
+from combine_clips import combine_clips, segment_cache
+from generate_audio import compute_duration, receive_audio
+from http_client import ProviderLimits, http_client
+from http_client import close as close_http
+from meme import create_meme_backdrop
+from mux_audio_and_video import mux_audio_and_video
+from render_profiles import RENDER_PROFILES
+from twitter_capture import create_backdrop
+from workspace import Workspace, current_workspace
+
+# Baselines are per machine, so they live with the other local state
+MICRO_BASELINE_PATH = os.environ.get(
+    "MICRO_BASELINE_PATH", ".cache/benchmarks/micro.json"
+)
+# A case is a regression once its median is this much slower than baseline
+MICRO_THRESHOLD = float(os.environ.get("MICRO_THRESHOLD", 0.25))
+
+IMAGE_SIZES = [(600, 800), (1200, 2400), (2400, 4800)]
+CLIP_COUNTS = [2, 6, 12]
+STREAM_WORDS = 20000
+CALLS = 100000
+
+
+class Case(NamedTuple):
+    name: str
+    run: Callable[[], Union[Awaitable[Any], Any]]
+    repeat: int = 5
+
+
+class FakeContext:
+    # Stands in for a Cartesia context: chunks of word timestamps, each with
+    # a small audio buffer so the captions dominate
+    def __init__(self, words: int, words_per_chunk: int = 4):
+        self.chunks = []
+        audio = bytes(4096)
+        for first in range(0, words, words_per_chunk):
+            count = min(words_per_chunk, words - first)
+            starts = [(first + i) * 0.35 for i in range(count)]
+            self.chunks.append(
+                {
+                    "audio": audio,
+                    "word_timestamps": {
+                        "words": ["word"] * count,
+                        "start": starts,
+                        "end": [start + 0.3 for start in starts],
+                    },
+                }
+            )
+
+    async def receive(self):
+        for chunk in self.chunks:
+            yield chunk
+
+
+def png_bytes(width: int, height: int) -> bytes:
+    buffer = BytesIO()
+    synthetic_screenshot(width, height).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+async def serve_images(images: Dict[str, bytes]) -> web.AppRunner:
+    # Meme images come from a local server, so the download path is measured
+    # without the network
+    async def image(request: web.Request):
+        return web.Response(
+            body=images[request.match_info["name"]], content_type="image/png"
+        )
+
+    app = web.Application()
+    app.add_routes([web.get("/{name}", image)])
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", 0).start()
+    return runner
+
+
+async def backdrop_cases(work_dir: str, runners: List[web.AppRunner]) -> List[Case]:
+    images = {}
+    for width, height in IMAGE_SIZES:
+        size = f"{width}x{height}"
+        images[size] = png_bytes(width, height)
+        with open(os.path.join(work_dir, f"tweet_{size}.png"), "wb") as f:
+            f.write(images[size])
+    runners.append(await serve_images(images))
+    host, port = runners[-1].addresses[0][:2]
+
+    cases = []
+    for size in images:
+        path = os.path.join(work_dir, f"tweet_{size}.png")
+        url = f"http://{host}:{port}/{size}"
+        cases.append(
+            Case(f"backdrop.tweet.{size}", lambda path=path: create_backdrop(path))
+        )
+        cases.append(
+            Case(f"backdrop.meme.{size}", lambda url=url: create_meme_backdrop(url))
+        )
+    return cases
+
+
+def caption_cases(work_dir: str) -> List[Case]:
+    current_workspace.set(Workspace(os.path.join(work_dir, "captions")).create())
+    context = FakeContext(STREAM_WORDS)
+    times = [i * 0.137 for i in range(CALLS)]
+    byte_counts = [i * 4096 for i in range(CALLS)]
+
+    def format_times():
+        for seconds in times:
+            format_time(seconds)
+
+    def compute_durations():
+        for total_bytes in byte_counts:
+            compute_duration(total_bytes)
+
+    return [
+        Case(
+            f"captions.receive_audio.{STREAM_WORDS}words",
+            lambda: receive_audio(context, "pcm"),
+        ),
+        Case(f"captions.format_time.{CALLS}", format_times),
+        Case(f"audio.compute_duration.{CALLS}", compute_durations),
+    ]
+
+
+async def render_cases(work_dir: str, profile_name: str) -> List[Case]:
+    profile = RENDER_PROFILES[profile_name]
+    cases = []
+    for count in CLIP_COUNTS:
+        clip_dir = os.path.join(work_dir, f"clips_{count}")
+        os.makedirs(clip_dir)
+        clips = make_clips(clip_dir, count)
+        audio = make_audio_pcm(
+            os.path.join(clip_dir, "audio.pcm"), count * CLIP_DURATION
+        )
+        captions = make_captions(
+            os.path.join(clip_dir, "captions.srt"), count * CLIP_DURATION
+        )
+        video = os.path.join(clip_dir, "output.mp4")
+        output = os.path.join(clip_dir, "final_output.mp4")
+
+        def combine(clips=clips, video=video, captions=captions):
+            return combine_clips(
+                clips, output_file=video, profile=profile, captions_path=captions
+            )
+
+        def mux(audio=audio, video=video, captions=captions, output=output):
+            return mux_audio_and_video(audio, video, captions, output, profile)
+
+        # The mux cases read what the combine cases wrote
+        cases.append(Case(f"render.combine.{profile.name}.{count}clips", combine, 3))
+        cases.append(Case(f"render.mux.{profile.name}.{count}clips", mux, 3))
+    return cases
+
+
+async def measure(case: Case, warmup: int = 1) -> Dict[str, float]:
+    samples = []
+    for attempt in range(warmup + case.repeat):
+        start = time.perf_counter()
+        result = case.run()
+        if inspect.isawaitable(result):
+            result = await result
+        if attempt >= warmup:
+            samples.append(time.perf_counter() - start)
+    return {"median": statistics.median(samples), "min": min(samples)}
+
+
+def load_baseline(path: str) -> Dict[str, Any]:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"cases": {}}
+
+
+def save_baseline(path: str, baseline: Dict[str, Any], results: Dict[str, Any]):
+    baseline["cases"].update(results)
+    baseline["recorded_at"] = time.time()
+    baseline["machine"] = f"{platform.node()} {platform.machine()}"
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(baseline, f, indent=2, sort_keys=True)
+    print(f"Saved {len(results)} baselines to {path}")
+
+
+async def run(args, work_dir: str) -> Dict[str, Dict[str, float]]:
+    # Caches would turn every repeat after the first into a lookup
+    asset_cache.mode = "off"
+    segment_cache.mode = "off"
+    http_client.configure("memes", ProviderLimits(rate=1e6, burst=10**6, concurrency=8))
+
+    runners: List[web.AppRunner] = []
+    # The case name prefixes each group sets up
+    groups = {
+        ("backdrop",): lambda: backdrop_cases(work_dir, runners),
+        ("captions", "audio"): lambda: caption_cases(work_dir),
+        ("render",): lambda: render_cases(work_dir, args.profile),
+    }
+    prefixes = args.only or [""]
+    results = {}
+    try:
+        for names, build in groups.items():
+            # Only set up the groups a prefix can match
+            if not any(
+                name.startswith(p) or p.startswith(name)
+                for name in names
+                for p in prefixes
+            ):
+                continue
+            cases = build()
+            if inspect.isawaitable(cases):
+                cases = await cases
+            for case in cases:
+                if not any(case.name.startswith(p) for p in prefixes):
+                    continue
+                results[case.name] = await measure(case)
+                print(f"{case.name:<40} {results[case.name]['median'] * 1000:10.2f}ms")
+    finally:
+        await close_http()
+        for runner in runners:
+            await runner.cleanup()
+    return results
+
+
+def report(results, baseline, threshold: float) -> List[str]:
+    regressions = []
+    print(f"\n{'case':<40} {'median':>10} {'baseline':>10} {'change':>8}")
+    for name, result in results.items():
+        previous: Optional[Dict[str, float]] = baseline["cases"].get(name)
+        line = f"{name:<40} {result['median'] * 1000:8.2f}ms"
+        if previous is None:
+            print(f"{line} {'-':>10} {'new':>8}")
+            continue
+        change = result["median"] / previous["median"] - 1
+        flag = ""
+        if change > threshold:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        print(f"{line} {previous['median'] * 1000:8.2f}ms {change:+7.1%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Time the local hot paths against stored baselines"
+    )
+    parser.add_argument(
+        "--only",
+        nargs="+",
+        help="Case name prefixes, e.g. backdrop.meme render.combine",
+    )
+    parser.add_argument("--profile", choices=list(RENDER_PROFILES), default="draft")
+    parser.add_argument("--baseline", default=MICRO_BASELINE_PATH)
+    parser.add_argument("--threshold", type=float, default=MICRO_THRESHOLD)
+    parser.add_argument(
+        "--save", action="store_true", help="Store these results as the baseline"
+    )
+    args = parser.parse_args()
+
+    baseline = load_baseline(args.baseline)
+    with tempfile.TemporaryDirectory() as work_dir:
+        results = asyncio.run(run(args, work_dir))
+
+    regressions = report(results, baseline, args.threshold)
+    if args.save:
+        save_baseline(args.baseline, baseline, results)
+        return
+    if regressions:
+        print(
+            f"\n{len(regressions)} cases regressed more than {args.threshold:.0%}: "
+            + ", ".join(regressions)
+        )
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+from asset_cache import asset_cache
+from batch import render_batch
+from benchmarks.media import make_audio_pcm, make_captions, make_image, make_video
+from combine_clips import VIDEO_SOURCE_SECONDS, segment_cache
+from generate_audio import AUDIO_FORMAT, TTS_CONTEXTS, WORDS_PER_SECOND
+from main import main
+from openai_client import Storyboard, StoryboardItem
+from planner import SLOT_SECONDS, Word, save_words, storyboard_size
+from replay import Fixture, parse_latency, replay_session
+from tracing import tracer
+
+ITEM_TYPES = ["stock_video", "meme", "twitter_screenshot"]
+
+# Seconds each provider takes in a live run, before --time-scale
+DEFAULT_LATENCY = ",".join(
+    [
+        "generate_audio.generate_transcript=lognormal:6:0.3",
+        "generate_audio.synthesize_audio=lognormal:8:0.2",
+        "openai_client.generate_storyboard=lognormal:12:0.3",
+        "openai_client.find_memes=lognormal:4:0.3",
+        "ideogram=lognormal:8:0.3",
+        "luma.generate_luma_video=lognormal:1:0.3",
+        "luma.poll_generation=lognormal:90:0.25",
+        "airtable=lognormal:1.5:0.3",
+        "cloudflare=lognormal:0.4:0.3",
+        "twitter_capture=lognormal:4:0.3",
+        "http_client=lognormal:0.3:0.3",
+    ]
+)
+
+
+def write_fixture(root: str, items: int) -> Fixture:
+    # A synthetic recording: every entry matches any call to its provider and
+    # the media comes from ffmpeg's lavfi sources
+    fixture = Fixture(root)
+    media = os.path.join(root, "media")
+    os.makedirs(media, exist_ok=True)
+    duration = items * SLOT_SECONDS
+
+    spacing = 1 / WORDS_PER_SECOND
+    words = [
+        Word("word", i * spacing, (i + 0.8) * spacing)
+        for i in range(int(duration * WORDS_PER_SECOND))
+    ]
+    save_words(os.path.join(media, "words.json"), words)
+    fixture.add(
+        "generate_audio.generate_transcript",
+        None,
+        " ".join(word.text for word in words),
+    )
+    fixture.add(
+        "generate_audio.synthesize_audio",
+        None,
+        {"duration": duration, "audio_format": "pcm"},
+        artifacts={
+            "audio": fixture.add_artifact(
+                make_audio_pcm(os.path.join(media, "audio.pcm"), duration)
+            ),
+            "captions": fixture.add_artifact(
+                make_captions(os.path.join(media, "captions.srt"), duration)
+            ),
+            "words": fixture.add_artifact(os.path.join(media, "words.json")),
+        },
+    )
+
+    # Spare items like the live storyboard, one of them a repeated tweet
+    storyboard_items = [
+        StoryboardItem(
+            type=ITEM_TYPES[i % len(ITEM_TYPES)],
+            stock_image_description=f"scene {i}",
+            twitter_url=f"https://twitter.com/user{i}/status/{1000 + i}",
+        )
+        for i in range(storyboard_size(duration))
+    ]
+    storyboard_items.insert(
+        3,
+        StoryboardItem(
+            type="twitter_screenshot",
+            stock_image_description=None,
+            twitter_url="https://x.com/user2/status/1002?s=20",
+        ),
+    )
+    storyboard = Storyboard(
+        items=storyboard_items,
+        total_duration=duration,
+        total_frames=len(storyboard_items),
+    )
+    fixture.add("openai_client.generate_storyboard", None, storyboard.model_dump())
+
+    meme_urls = [f"https://memes.invalid/{i}.png" for i in range(3)]
+    fixture.add(
+        "airtable.memes",
+        None,
+        {
+            f"meme {i}": {"notes": f"scene {i}", "image_url": url}
+            for i, url in enumerate(meme_urls)
+        },
+    )
+    fixture.add("openai_client.find_memes", None, [{"url": url} for url in meme_urls])
+    meme_image = make_image(os.path.join(media, "meme.png"), size="800x600")
+    with open(meme_image, "rb") as f:
+        fixture.add(
+            "http_client.request",
+            None,
+            {"status": 200, "headers": {"Content-Type": "image/png"}},
+            artifacts={"body": fixture.add_artifact(f.read(), ".png")},
+        )
+
+    fixture.add(
+        "ideogram.generate_ideo_image",
+        None,
+        {"data": [{"url": "https://ideogram.invalid/image.png"}]},
+    )
+    fixture.add("cloudflare.upload_to_cloudflare", None, "https://r2.invalid/a.png")
+    for i in range(items):
+        fixture.add("luma.generate_luma_video", None, f"generation-{i}")
+    video = make_video(os.path.join(media, "video.mp4"), VIDEO_SOURCE_SECONDS)
+    fixture.add(
+        "luma.poll_generation",
+        None,
+        {"id": "generation", "state": "completed"},
+        artifacts={"video": fixture.add_artifact(video)},
+    )
+    screenshot = make_image(os.path.join(media, "tweet.png"), size="1200x1600")
+    fixture.add(
+        "twitter_capture.capture_tweet",
+        None,
+        "tweet.png",
+        artifacts={"screenshot": fixture.add_artifact(screenshot)},
+    )
+    fixture.save()
+    return fixture
+
+
+def run_batch(args, fixture_dir: str):
+    # The same source rendered by several concurrent jobs
+    latency = parse_latency(args.latency)
+    with tempfile.TemporaryDirectory() as work_dir:
+        os.chdir(work_dir)
+        sources = []
+        for i in range(args.jobs):
+            sources.append(f"story_{i}.md")
+            with open(sources[-1], "w") as f:
+                f.write(f"story {i}")
+        with replay_session("replay", fixture_dir, latency, args.time_scale):
+            start = time.perf_counter()
+            outputs = asyncio.run(
+                render_batch(
+                    sources,
+                    "renders",
+                    args.jobs,
+                    args.single_pass,
+                    args.audio_format,
+                    args.tts_contexts,
+                )
+            )
+            total = time.perf_counter() - start
+        if not all(outputs) or not all(os.path.exists(path) for path in outputs):
+            raise RuntimeError("A batch job did not produce its final_output.mp4")
+    return total
+
+
+def run(args, fixture_dir: str):
+    latency = parse_latency(args.latency)
+    with tempfile.TemporaryDirectory() as work_dir:
+        os.chdir(work_dir)
+        with open("source.md", "w") as f:
+            f.write("story")
+        with replay_session("replay", fixture_dir, latency, args.time_scale):
+            start = time.perf_counter()
+            pipeline = asyncio.run(
+                main(
+                    single_pass=args.single_pass,
+                    audio_format=args.audio_format,
+                    tts_contexts=args.tts_contexts,
+                )
+            )
+            total = time.perf_counter() - start
+        if not os.path.exists("final_output.mp4"):
+            raise RuntimeError("The pipeline did not produce final_output.mp4")
+    return pipeline.timings, total
+
+
+def main_benchmark():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, default=12)
+    parser.add_argument(
+        "--fixture", help="Replay a recorded fixture instead of synthetic media"
+    )
+    parser.add_argument("--latency", default=DEFAULT_LATENCY)
+    parser.add_argument(
+        "--time-scale",
+        type=float,
+        default=0.02,
+        help="Multiplier on every provider latency",
+    )
+    parser.add_argument("--single-pass", action="store_true")
+    parser.add_argument("--audio-format", default=AUDIO_FORMAT)
+    parser.add_argument("--tts-contexts", type=int, default=TTS_CONTEXTS)
+    parser.add_argument("--trace", metavar="PATH", help="Write a Chrome trace")
+    parser.add_argument(
+        "--jobs", type=int, default=1, help="Render this many stories as one batch"
+    )
+    args = parser.parse_args()
+    if args.trace:
+        tracer.enable(args.trace)
+
+    asset_cache.mode = "off"
+    segment_cache.mode = "off"
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as fixture_dir:
+        if args.fixture:
+            fixture_dir = os.path.abspath(args.fixture)
+        else:
+            write_fixture(fixture_dir, args.items)
+        try:
+            if args.jobs > 1:
+                total = run_batch(args, fixture_dir)
+                print(f"\n{args.jobs} jobs in {total:.2f}s")
+                return
+            timings, total = run(args, fixture_dir)
+        finally:
+            os.chdir(cwd)
+
+    print()
+    for name, seconds in timings.items():
+        print(f"{name:>12}: {seconds:7.2f}s")
+    print(f"{'total':>12}: {total:7.2f}s")
+
+
+if __name__ == "__main__":
+    main_benchmark()
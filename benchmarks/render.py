@@ -0,0 +1,136 @@
+import argparse
+import asyncio
+import os
+import resource
+import tempfile
+import time
+
+from asset_cache import asset_cache
+from benchmarks.media import make_audio_pcm, make_captions, make_image, make_video
+from combine_clips import combine_clips, run_command, segment_cache
+from generate_audio import sample_rate
+from mux_audio_and_video import mux_audio_and_video
+from render import render_single_pass
+from render_profiles import subtitles_filter
+
+CLIP_DURATION = 2
+
+
+def make_clips(work_dir: str, count: int):
+    clips = []
+    for i in range(count):
+        if i % 3 == 2:
+            path = make_image(os.path.join(work_dir, f"source_{i}.png"))
+            clips.append({"type": "image", "url": path, "duration": CLIP_DURATION})
+        else:
+            path = make_video(os.path.join(work_dir, f"source_{i}.mp4"), 5)
+            clips.append({"type": "video", "url": path, "duration": CLIP_DURATION})
+    return clips
+
+
+async def legacy_three_encodes(clips):
+    # The render before prepared segments: images become clips, then the
+    # concat and the mux that burns in the captions each encode everything
+    paths = []
+    for i, clip in enumerate(clips):
+        path = f"legacy_{i}.mp4"
+        if clip["type"] == "video":
+            # fmt: off
+            await run_command([
+                "ffmpeg", "-y", "-i", clip["url"],
+                "-t", str(round(clip["duration"] * 1.2, 1)), "-c", "copy",
+                path,
+            ])
+            # fmt: on
+        else:
+            # fmt: off
+            await run_command([
+                "ffmpeg", "-y", "-loop", "1", "-i", clip["url"],
+                "-c:v", "libx264", "-t", str(clip["duration"]),
+                "-pix_fmt", "yuv420p", "-vf", "scale=1080:1920",
+                path,
+            ])
+            # fmt: on
+        paths.append(path)
+    with open("legacy_list.txt", "w") as f:
+        f.write("\n".join(f"file '{path}'" for path in paths))
+    # fmt: off
+    await run_command([
+        "ffmpeg", "-y", "-f", "concat", "-safe", "0", "-i", "legacy_list.txt",
+        "-c:v", "libx264", "-preset", "medium", "-crf", "23",
+        "-vf", "scale=1080:1920", "-c:a", "aac", "-b:a", "192k",
+        "output.mp4",
+    ])
+    await run_command([
+        "ffmpeg", "-y", "-i", "output.mp4",
+        "-f", "f32le", "-ar", f"{sample_rate}", "-ac", "1", "-i", "audio.pcm",
+        "-vf", subtitles_filter("captions.srt"),
+        "-c:a", "aac", "-b:a", "192k",
+        "-c:v", "libx264", "-preset", "medium", "-crf", "23",
+        "-shortest", "final_output.mp4",
+    ])
+    # fmt: on
+
+
+async def segments(clips):
+    # One encode per clip, then the concat and the mux copy the video
+    await combine_clips(clips, output_file="output.mp4", captions_path="captions.srt")
+    await mux_audio_and_video()
+
+
+async def single_pass(clips):
+    await render_single_pass(clips)
+
+
+def measure(name, coroutine_fn, clips):
+    before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    start = time.perf_counter()
+    asyncio.run(coroutine_fn(clips))
+    wall = time.perf_counter() - start
+    after = resource.getrusage(resource.RUSAGE_CHILDREN)
+    cpu = (after.ru_utime - before.ru_utime) + (after.ru_stime - before.ru_stime)
+    size = os.path.getsize("final_output.mp4")
+    print(f"{name:>14}: wall {wall:6.2f}s  cpu {cpu:7.2f}s  output {size:>9} bytes")
+    return wall, cpu
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clips", type=int, default=6)
+    args = parser.parse_args()
+
+    # The synthetic clips are identical, cached segments would turn every
+    # clip after the first into a copy
+    asset_cache.mode = "off"
+    segment_cache.mode = "off"
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as work_dir:
+        os.chdir(work_dir)
+        try:
+            print(f"Preparing {args.clips} synthetic clips in {work_dir}")
+            clips = make_clips(work_dir, args.clips)
+            make_audio_pcm("audio.pcm", args.clips * CLIP_DURATION)
+            make_captions("captions.srt", args.clips * CLIP_DURATION)
+
+            results = {
+                name: measure(name, render_fn, clips)
+                for name, render_fn in [
+                    ("three encodes", legacy_three_encodes),
+                    ("segments", segments),
+                    ("single pass", single_pass),
+                ]
+            }
+        finally:
+            os.chdir(cwd)
+
+    legacy_wall, legacy_cpu = results["three encodes"]
+    for name in ["segments", "single pass"]:
+        wall, cpu = results[name]
+        print(
+            f"{name} speedup over three encodes: wall {legacy_wall / wall:.2f}x, "
+            f"cpu {legacy_cpu / cpu:.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
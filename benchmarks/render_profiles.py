@@ -0,0 +1,80 @@
+import argparse
+import asyncio
+import os
+import resource
+import tempfile
+import time
+
+from asset_cache import asset_cache
+from benchmarks.media import make_audio_pcm, make_captions
+from benchmarks.render import CLIP_DURATION, make_clips
+from combine_clips import combine_clips, fetch_clip, segment_cache
+from mux_audio_and_video import mux_audio_and_video
+from render import render_single_pass
+from render_profiles import RENDER_PROFILES
+
+
+async def segments(clips, profile):
+    await combine_clips(
+        clips, output_file="output.mp4", profile=profile, captions_path="captions.srt"
+    )
+    await mux_audio_and_video(profile=profile)
+
+
+async def single_pass(clips, profile):
+    # Sources are already local, fetch_clip only resolves the paths
+    fetched = [
+        {**clip, "url": await fetch_clip(clip, i, ".")} for i, clip in enumerate(clips)
+    ]
+    await render_single_pass(fetched, profile=profile)
+
+
+def measure(name, coroutine_fn, clips, profile):
+    before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    start = time.perf_counter()
+    asyncio.run(coroutine_fn(clips, profile))
+    wall = time.perf_counter() - start
+    after = resource.getrusage(resource.RUSAGE_CHILDREN)
+    cpu = (after.ru_utime - before.ru_utime) + (after.ru_stime - before.ru_stime)
+    size = os.path.getsize("final_output.mp4")
+    print(f"{name:>20}: wall {wall:6.2f}s  cpu {cpu:7.2f}s  output {size:>9} bytes")
+    return wall
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clips", type=int, default=6)
+    args = parser.parse_args()
+
+    # The synthetic clips are identical, cached segments would turn every
+    # clip after the first into a copy
+    asset_cache.mode = "off"
+    segment_cache.mode = "off"
+    cwd = os.getcwd()
+    walls = {}
+    with tempfile.TemporaryDirectory() as work_dir:
+        os.chdir(work_dir)
+        try:
+            print(f"Preparing {args.clips} synthetic clips in {work_dir}")
+            clips = make_clips(work_dir, args.clips)
+            make_audio_pcm("audio.pcm", args.clips * CLIP_DURATION)
+            make_captions("captions.srt", args.clips * CLIP_DURATION)
+
+            for render_name, render_fn in [
+                ("segments", segments),
+                ("single pass", single_pass),
+            ]:
+                for profile in RENDER_PROFILES.values():
+                    walls[render_name, profile.name] = measure(
+                        f"{render_name} {profile.name}", render_fn, clips, profile
+                    )
+        finally:
+            os.chdir(cwd)
+
+    for render_name in ["segments", "single pass"]:
+        speedup = walls[render_name, "final"] / walls[render_name, "draft"]
+        print(f"{render_name} draft speedup: {speedup:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
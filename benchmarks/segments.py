@@ -0,0 +1,65 @@
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+from benchmarks.media import make_audio_pcm, make_captions, make_video
+from benchmarks.render import CLIP_DURATION, make_clips
+from combine_clips import combine_clips, segment_cache
+from mux_audio_and_video import mux_audio_and_video
+from render_profiles import RENDER_PROFILES
+
+
+async def render(clips, profile):
+    await combine_clips(
+        clips, output_file="output.mp4", profile=profile, captions_path="captions.srt"
+    )
+    await mux_audio_and_video(profile=profile)
+
+
+def measure(name, clips, profile):
+    start = time.perf_counter()
+    asyncio.run(render(clips, profile))
+    wall = time.perf_counter() - start
+    size = os.path.getsize("final_output.mp4")
+    print(f"{name:>24}: wall {wall:6.2f}s  output {size:>9} bytes")
+    return wall
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clips", type=int, default=6)
+    parser.add_argument("--profile", choices=list(RENDER_PROFILES), default="final")
+    args = parser.parse_args()
+    profile = RENDER_PROFILES[args.profile]
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as work_dir:
+        os.chdir(work_dir)
+        segment_cache.root = os.path.join(work_dir, "segments")
+        segment_cache.mode = "on"
+        try:
+            print(f"Preparing {args.clips} synthetic clips in {work_dir}")
+            clips = make_clips(work_dir, args.clips)
+            make_audio_pcm("audio.pcm", args.clips * CLIP_DURATION)
+            make_captions("captions.srt", args.clips * CLIP_DURATION)
+
+            cold = measure(f"{profile.name} cold", clips, profile)
+            warm = measure(f"{profile.name} unchanged", clips, profile)
+            # An editor swaps the footage of one storyboard item
+            edited = list(clips)
+            swapped = make_video(
+                os.path.join(work_dir, "swapped.mp4"), 5, size="640x360"
+            )
+            edited[1] = {**clips[1], "type": "video", "url": swapped}
+            edit = measure(f"{profile.name} one item edited", edited, profile)
+        finally:
+            os.chdir(cwd)
+
+    print(f"unchanged re-render speedup: {cold / warm:.2f}x")
+    print(f"one item edit speedup: {cold / edit:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
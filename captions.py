@@ -0,0 +1,51 @@
+import re
+from typing import List, NamedTuple, Optional
+
+TIMESTAMP = re.compile(r"(\d+):(\d+):(\d+),(\d+)")
+
+
+class Cue(NamedTuple):
+    start: float
+    end: float
+    text: str
+
+
+def format_time(seconds):
+    hours, remainder = divmod(seconds, 3600)
+    minutes, seconds = divmod(remainder, 60)
+    milliseconds = int((seconds % 1) * 1000)
+    return f"{int(hours):02d}:{int(minutes):02d}:{int(seconds):02d},{milliseconds:03d}"
+
+
+def parse_time(timestamp: str) -> float:
+    hours, minutes, seconds, milliseconds = TIMESTAMP.match(timestamp.strip()).groups()
+    return (
+        int(hours) * 3600 + int(minutes) * 60 + int(seconds) + int(milliseconds) / 1000
+    )
+
+
+def load_cues(path: str) -> List[Cue]:
+    with open(path) as f:
+        blocks = f.read().strip().split("\n\n")
+    cues = []
+    for block in blocks:
+        lines = block.strip().splitlines()
+        if len(lines) < 3:
+            continue
+        start, _, end = lines[1].partition(" --> ")
+        cues.append(Cue(parse_time(start), parse_time(end), "\n".join(lines[2:])))
+    return cues
+
+
+def caption_window(cues: List[Cue], start: float, duration: float) -> Optional[str]:
+    # The cues shown during one clip as an SRT of their own, timed from the
+    # start of the clip so they can be burned into it alone
+    end = start + duration
+    entries = []
+    for cue in cues:
+        if cue.end <= start or cue.start >= end:
+            continue
+        cue_start = format_time(max(cue.start, start) - start)
+        cue_end = format_time(min(cue.end, end) - start)
+        entries.append(f"{len(entries) + 1}\n{cue_start} --> {cue_end}\n{cue.text}\n")
+    return "\n".join(entries) if entries else None
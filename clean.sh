@@ -1,5 +1,8 @@
 #!/bin/bash
 rm -f audio.pcm
+rm -f audio.s16
+rm -f audio.m4a
 rm -f captions.srt
 rm -f output.mp4
 rm -f final_output.mp4
+rm -rf runs
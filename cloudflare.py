@@ -1,7 +1,16 @@
+import asyncio
+import hashlib
 import os
+from io import BytesIO
+from typing import Optional, Union
 
-import boto3
-from botocore.client import Config
+from providers import lazy_import
+from tracing import span
+
+boto3 = lazy_import("boto3")
+s3_transfer = lazy_import("boto3.s3.transfer")
+botocore_client = lazy_import("botocore.client")
+botocore_exceptions = lazy_import("botocore.exceptions")
 
 ACCOUNT_ID = os.environ.get("R2_ACCOUNT_ID")
 ACCESS_KEY_ID = os.environ.get("R2_ACCESS_KEY_ID")
@@ -10,25 +19,153 @@ BUCKET_NAME = os.environ.get("R2_BUCKET_NAME")
 CLOUDFLARE_BUCKET_PUBLIC_URL = os.environ.get(
     "R2_BUCKET_PUBLIC_URL", "https://pub-2576bbab2f764a5a9c3fdc59f470ef1a.r2.dev"
 )
-
-s3_client = boto3.client(
-    "s3",
-    endpoint_url=f"https://{ACCOUNT_ID}.r2.cloudflarestorage.com",
-    aws_access_key_id=ACCESS_KEY_ID,
-    aws_secret_access_key=SECRET_ACCESS_KEY,
-    config=Config(signature_version="s3v4"),
+# Point at any S3 compatible endpoint, e.g. a local MinIO or moto server
+R2_ENDPOINT_URL = os.environ.get(
+    "R2_ENDPOINT_URL", f"https://{ACCOUNT_ID}.r2.cloudflarestorage.com"
 )
+R2_UPLOAD_CONCURRENCY = int(os.environ.get("R2_UPLOAD_CONCURRENCY", 8))
+# Objects above the threshold, like final videos, are uploaded in parts
+MULTIPART_THRESHOLD = 8 * 1024 * 1024
+MULTIPART_CHUNKSIZE = 8 * 1024 * 1024
 
+CONTENT_TYPES = {".png": "image/png", ".jpg": "image/jpeg", ".mp4": "video/mp4"}
 
-async def upload_to_cloudflare(image_path):
-    try:
-        with open(image_path, "rb") as file:
-            object_name = os.path.basename(image_path)
-            s3_client.upload_fileobj(file, BUCKET_NAME, object_name)
 
-            file_name = image_path.split("/")[-1]
-            cloudflare_url = f"{CLOUDFLARE_BUCKET_PUBLIC_URL}/{file_name}"
-            return cloudflare_url
+def content_key(data: bytes, suffix: str) -> str:
+    return hashlib.sha256(data).hexdigest()[:32] + suffix
+
+
+def file_content_key(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()[:32] + os.path.splitext(path)[1]
+
+
+class R2Uploader:
+    # Uploads run on worker threads with one shared, pooled boto3 client, so
+    # they overlap with each other and never block the event loop. Objects
+    # are keyed by content hash and skipped when they already exist.
+
+    def __init__(
+        self,
+        bucket: Optional[str] = BUCKET_NAME,
+        endpoint_url: str = R2_ENDPOINT_URL,
+        public_url: str = CLOUDFLARE_BUCKET_PUBLIC_URL,
+        concurrency: int = R2_UPLOAD_CONCURRENCY,
+        access_key_id: Optional[str] = ACCESS_KEY_ID,
+        secret_access_key: Optional[str] = SECRET_ACCESS_KEY,
+    ):
+        self.bucket = bucket
+        self.endpoint_url = endpoint_url
+        self.public_url = public_url
+        self.concurrency = concurrency
+        self.access_key_id = access_key_id
+        self.secret_access_key = secret_access_key
+        self._transfer_config = None
+        self._client = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loop = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = boto3.client(
+                "s3",
+                endpoint_url=self.endpoint_url,
+                aws_access_key_id=self.access_key_id,
+                aws_secret_access_key=self.secret_access_key,
+                config=botocore_client.Config(
+                    signature_version="s3v4",
+                    # Room for every upload plus its multipart threads
+                    max_pool_connections=self.concurrency * 10,
+                ),
+            )
+        return self._client
+
+    @property
+    def transfer_config(self):
+        if self._transfer_config is None:
+            self._transfer_config = s3_transfer.TransferConfig(
+                multipart_threshold=MULTIPART_THRESHOLD,
+                multipart_chunksize=MULTIPART_CHUNKSIZE,
+            )
+        return self._transfer_config
+
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+            self._loop = loop
+        return self._semaphore
+
+    def url(self, object_name: str) -> str:
+        return f"{self.public_url}/{object_name}"
+
+    def exists(self, object_name: str) -> bool:
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=object_name)
+            return True
+        except botocore_exceptions.ClientError as e:
+            if e.response["Error"]["Code"] in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+
+    def _upload(self, source: Union[bytes, str], object_name: str):
+        if self.exists(object_name):
+            print(f"{object_name} already in R2, skipping upload")
+            return
+
+        extra_args = {}
+        content_type = CONTENT_TYPES.get(os.path.splitext(object_name)[1])
+        if content_type:
+            extra_args["ContentType"] = content_type
+
+        if isinstance(source, bytes):
+            self.client.upload_fileobj(
+                BytesIO(source),
+                self.bucket,
+                object_name,
+                ExtraArgs=extra_args,
+                Config=self.transfer_config,
+            )
+        else:
+            self.client.upload_file(
+                source,
+                self.bucket,
+                object_name,
+                ExtraArgs=extra_args,
+                Config=self.transfer_config,
+            )
+
+    async def upload(
+        self,
+        source: Union[bytes, str],
+        object_name: Optional[str] = None,
+        suffix: str = ".png",
+    ) -> str:
+        # `source` is either encoded bytes or a file path
+        if object_name is None:
+            if isinstance(source, bytes):
+                object_name = content_key(source, suffix)
+            else:
+                object_name = await asyncio.to_thread(file_content_key, source)
+
+        size = len(source) if isinstance(source, bytes) else os.path.getsize(source)
+        async with self.semaphore:
+            with span("r2.upload", object=object_name, bytes=size):
+                await asyncio.to_thread(self._upload, source, object_name)
+        return self.url(object_name)
+
+
+uploader = R2Uploader()
+
+
+async def upload_to_cloudflare(image, object_name=None):
+    try:
+        return await uploader.upload(image, object_name)
     except Exception as e:
         print(f"Error uploading to Cloudflare R2: {str(e)}")
         return None
@@ -1,65 +1,249 @@
+import asyncio
+import functools
+import hashlib
 import os
 import subprocess
 import tempfile
-from typing import Dict, List, Union
+from typing import Dict, List, Optional, Union
 
+from asset_cache import AssetCache, cache_key
+from captions import caption_window, load_cues
+from http_client import download
+from render_profiles import (
+    FINAL_PROFILE,
+    FRAME_RATE,
+    SUBTITLE_STYLE,
+    RenderProfile,
+    subtitles_filter,
+)
+from tracing import span
 
-def download_image(url: str, output_path: str):
-    subprocess.run(["curl", "-L", url, "-o", output_path], check=True)
+# Clips prepared concurrently, defaults to one ffmpeg process per core
+CLIP_WORKERS = int(os.environ.get("CLIP_WORKERS", os.cpu_count() or 1))
+# ffmpeg processes across every job in the process
+FFMPEG_WORKERS = int(os.environ.get("FFMPEG_WORKERS", os.cpu_count() or 1))
 
+# Length of a Luma generation, longer slots need their last frame held
+VIDEO_SOURCE_SECONDS = 5
 
-def download_video(url: str, output_path: str, duration: int):
-    # Fetch the video trimming it to just the {duration * 1.2} seconds, with the
-    # 20% buffer accounting for the fact that there is often not enough content
-    # to fill the audio duration.
+# Prepared clips are kept apart from the provider assets, they are large and
+# only worth keeping while a storyboard is still being edited
+SEGMENT_CACHE_DIR = os.environ.get("SEGMENT_CACHE_DIR", ".cache/segments")
+SEGMENT_CACHE_MAX_BYTES = int(os.environ.get("SEGMENT_CACHE_MAX_BYTES", 4 * 1024**3))
+
+segment_cache = AssetCache(SEGMENT_CACHE_DIR, SEGMENT_CACHE_MAX_BYTES)
+
+_ffmpeg_slots: Dict[asyncio.AbstractEventLoop, asyncio.Semaphore] = {}
+
+
+def ffmpeg_slots() -> asyncio.Semaphore:
+    loop = asyncio.get_running_loop()
+    if loop not in _ffmpeg_slots:
+        for stale in [other for other in _ffmpeg_slots if other.is_closed()]:
+            del _ffmpeg_slots[stale]
+        _ffmpeg_slots[loop] = asyncio.Semaphore(FFMPEG_WORKERS)
+    return _ffmpeg_slots[loop]
+
+
+async def run_command(command: List[str]):
+    async with ffmpeg_slots():
+        with span(f"subprocess:{command[0]}", output=command[-1]) as command_span:
+            process = await asyncio.create_subprocess_exec(
+                *command, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+            )
+            stdout, stderr = await process.communicate()
+            command_span.set(returncode=process.returncode)
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(
+            process.returncode, command, output=stdout, stderr=stderr
+        )
+
+
+async def download_image(url: str, output_path: str):
+    await download("downloads", url, output_path)
+
+
+async def download_video(url: str, output_path: str, duration: float):
+    # Fetch just the slot planned for the clip, see planner.plan_slots
     # fmt: off
-    subprocess.run(
-        [
-            "ffmpeg",
-            "-i", url,
-            "-t", str(round(duration * 1.2, 1)),
-            "-c", "copy",
-            output_path,
-        ],
-        check=True,
+    await run_command([
+        "ffmpeg", "-y",
+        "-i", url,
+        "-t", str(duration),
+        "-c", "copy",
+        output_path,
+    ])
+    # fmt: on
+
+
+async def fetch_clip(clip: Dict[str, Union[str, float]], index: int, work_dir: str):
+    # Returns a local copy of the clip source, local images are used as-is
+    if clip["type"] == "video":
+        print(f"Loading video {index}...")
+        file_path = os.path.join(work_dir, f"video_{index}.mp4")
+        await download_video(clip["url"], file_path, clip["duration"])
+        return file_path
+    elif clip["type"] == "image":
+        if os.path.exists(clip["url"]):
+            return clip["url"]
+        print(f"Loading image {index}...")
+        file_path = os.path.join(work_dir, f"image_{index}.png")
+        await download_image(clip["url"], file_path)
+        return file_path
+    raise ValueError(f"Unknown clip type: {clip['type']}")
+
+
+def source_digest(url: str) -> str:
+    # Local files, like tweet backdrops, are regenerated under the same name,
+    # remote generations never change once they have a url
+    if not os.path.exists(url):
+        return url
+    digest = hashlib.sha256()
+    with open(url, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def segment_key(
+    clip: Dict[str, Union[str, float]],
+    profile: RenderProfile,
+    captions: Optional[str] = None,
+) -> str:
+    return cache_key(
+        source_digest(clip["url"]),
+        type=clip["type"],
+        duration=clip["duration"],
+        resolution=f"{profile.width}x{profile.height}",
+        frame_rate=FRAME_RATE,
+        profile=profile.name,
+        codec=profile.video_codec_args(),
+        captions=captions,
+        style=SUBTITLE_STYLE if captions else None,
     )
+
+
+async def prepare_clip(
+    clip: Dict[str, Union[str, float]],
+    index: int,
+    work_dir: str,
+    profile: RenderProfile = FINAL_PROFILE,
+    captions: Optional[str] = None,
+):
+    # Encodes the clip as a segment in the profile's format, with its captions
+    # burned in, so the concat and mux never encode the video again.
+    # Segments are cached, an edit to one item re-encodes only its clip.
+    print(">> clip:", clip)
+    video_path = os.path.join(work_dir, f"{clip['type']}_{profile.name}_{index}.mp4")
+    key = segment_key(clip, profile, captions)
+    entry = segment_cache.get(key)
+    if entry:
+        return segment_cache.copy_to(entry, video_path)
+
+    file_path = await fetch_clip(clip, index, work_dir)
+    if clip["type"] == "video":
+        # Footage shorter than its slot holds its last frame
+        input_args = ["-t", str(clip["duration"]), "-i", file_path]
+        video_filter = profile.clip_filter(clip["duration"])
+    else:
+        input_args = ["-loop", "1", "-t", str(clip["duration"]), "-i", file_path]
+        video_filter = profile.clip_filter()
+    if captions:
+        captions_path = os.path.join(work_dir, f"captions_{index}.srt")
+        with open(captions_path, "w") as f:
+            f.write(captions)
+        video_filter += "," + subtitles_filter(captions_path)
+    # fmt: off
+    await run_command([
+        "ffmpeg", "-y", *input_args,
+        *profile.video_codec_args(), "-an",
+        "-vf", video_filter,
+        video_path
+    ])
     # fmt: on
+    with open(video_path, "rb") as f:
+        segment_cache.put(key, clip["url"], data=f.read(), suffix=".mp4")
+    return video_path
 
 
-def combine_clips(clips: List[Dict[str, Union[str, int]]], output_file: str):
-    with tempfile.TemporaryDirectory() as temp_dir:
-        input_files = []
-        for i, clip in enumerate(clips):
-            print(">> clip:", clip)
-            if clip["type"] == "video":
-                print(f"Loading video {i}...")
-                file_path = os.path.join(temp_dir, f"video_{i}.mp4")
-                download_video(clip["url"], file_path, clip["duration"])
-                input_files.append(f"file '{file_path}'")
-            elif clip["type"] == "image":
-                print(f"Loading image {i}...")
-                file_path = os.path.join(temp_dir, f"image_{i}.png")
-                download_image(clip["url"], file_path)
-                video_path = os.path.join(temp_dir, f"image_video_{i}.mp4")
-                # fmt: off
-                subprocess.run([
-                    "ffmpeg", "-loop", "1", "-i", file_path,
-                    "-c:v", "libx264", "-t", str(clip["duration"]),
-                    "-pix_fmt", "yuv420p", "-vf", "scale=1080:1920",
-                    video_path
-                ], check=True)
-                # fmt: on
-                input_files.append(f"file '{video_path}'")
+def describe_error(error: Exception) -> str:
+    if isinstance(error, subprocess.CalledProcessError) and error.stderr:
+        stderr = error.stderr.decode(errors="replace").strip().splitlines()
+        return f"{error.cmd[0]} exited with {error.returncode}: " + " | ".join(
+            stderr[-5:]
+        )
+    return f"{type(error).__name__}: {error}"
+
+
+async def prepare_clip_bounded(
+    clip: Dict[str, Union[str, float]],
+    index: int,
+    work_dir: str,
+    limiter: asyncio.Semaphore,
+    step=prepare_clip,
+) -> Optional[str]:
+    # Runs a clip step under the worker limit, reporting a failure for this
+    # clip instead of failing the whole render.
+    async with limiter:
+        try:
+            return await step(clip, index, work_dir)
+        except Exception as e:
+            print(
+                f"Clip {index} ({clip['type']} {clip['url']}) failed: "
+                f"{describe_error(e)}"
+            )
+            return None
 
+
+async def concat_clips(clip_paths: List[str], output_file: str):
+    # Prepared segments share one format and are joined without an encode
+    with tempfile.TemporaryDirectory() as temp_dir:
         input_list_file = os.path.join(temp_dir, "input_list.txt")
+        # The concat demuxer resolves relative paths against the list file
         with open(input_list_file, "w") as f:
-            f.write("\n".join(input_files))
+            f.write("\n".join(f"file '{os.path.abspath(path)}'" for path in clip_paths))
 
         # fmt: off
-        subprocess.run([
-            "ffmpeg", "-f", "concat", "-safe", "0", "-i", input_list_file,
-            "-c:v", "libx264", "-preset", "medium", "-crf", "23",
-            "-vf", "scale=1080:1920", "-c:a", "aac", "-b:a", "192k",
+        await run_command([
+            "ffmpeg", "-y", "-f", "concat", "-safe", "0", "-i", input_list_file,
+            "-c", "copy",
             output_file
-        ], check=True)
+        ])
         # fmt: on
+
+
+async def combine_clips(
+    clips: List[Dict[str, Union[str, float]]],
+    output_file: str,
+    max_workers: Optional[int] = None,
+    profile: RenderProfile = FINAL_PROFILE,
+    captions_path: Optional[str] = None,
+):
+    limiter = asyncio.Semaphore(max_workers or CLIP_WORKERS)
+    cues = load_cues(captions_path) if captions_path and profile.burn_captions else []
+    steps = []
+    start = 0.0
+    for clip in clips:
+        captions = caption_window(cues, start, clip["duration"])
+        steps.append(
+            functools.partial(prepare_clip, profile=profile, captions=captions)
+        )
+        start += clip["duration"]
+    with tempfile.TemporaryDirectory() as temp_dir:
+        # gather keeps the results in clip order regardless of finish order
+        results = await asyncio.gather(
+            *(
+                prepare_clip_bounded(clip, i, temp_dir, limiter, step=step)
+                for i, (clip, step) in enumerate(zip(clips, steps))
+            )
+        )
+
+        failed = [i for i, path in enumerate(results) if path is None]
+        if failed:
+            print(f"Skipping {len(failed)} failed clips: {failed}")
+        clip_paths = [path for path in results if path is not None]
+        if not clip_paths:
+            raise RuntimeError("Every clip failed to prepare")
+
+        await concat_clips(clip_paths, output_file)
+        return failed
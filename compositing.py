@@ -0,0 +1,119 @@
+import asyncio
+import multiprocessing
+import os
+import sys
+import types
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+from typing import Optional, Tuple
+
+from providers import lazy_import
+
+np = lazy_import("numpy")
+Image = lazy_import("PIL.Image")
+
+BACKDROP_WIDTH = 1080
+BACKDROP_HEIGHT = 1920
+# Luminance is estimated on a copy whose longest side is about this long
+LUMINANCE_SAMPLE_SIZE = 64
+# Backdrops are intermediates, fast compression beats small files here
+PNG_COMPRESS_LEVEL = 1
+# With one worker or fewer compositing runs on a thread instead of a pool
+COMPOSITE_WORKERS = int(os.environ.get("COMPOSITE_WORKERS", os.cpu_count() or 1))
+# Imported once by the fork server, so workers start with them loaded
+COMPOSITE_PRELOAD = ["compositing", "numpy", "PIL.Image"]
+
+_executor: Optional[ProcessPoolExecutor] = None
+
+
+def estimate_luminance(image: "Image.Image") -> float:
+    if image.mode not in ("RGB", "RGBA", "L", "LA"):
+        image = image.convert("RGBA")
+    factor = max(1, max(image.size) // LUMINANCE_SAMPLE_SIZE)
+    sample = np.asarray(image.reduce(factor).convert("RGB"), dtype=np.float32)
+    return float((sample @ np.array([0.299, 0.587, 0.114], dtype=np.float32)).mean())
+
+
+def background_for(image: "Image.Image") -> Tuple[int, int, int]:
+    # Contrast with the content: dark images get a white backdrop
+    return (0, 0, 0) if estimate_luminance(image) > 128 else (255, 255, 255)
+
+
+def letterbox(
+    image: "Image.Image",
+    width: int = BACKDROP_WIDTH,
+    height: int = BACKDROP_HEIGHT,
+    padding: int = 0,
+) -> "Image.Image":
+    # Fits the image inside width x height with one resize, centered on a
+    # solid backdrop
+    background = background_for(image)
+    scale = min(
+        (width - 2 * padding) / image.width, (height - 2 * padding) / image.height
+    )
+    new_size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+    # reducing_gap shrinks large screenshots in cheap integer steps first
+    resized = image.resize(new_size, Image.LANCZOS, reducing_gap=2.0)
+
+    backdrop = Image.new("RGB", (width, height), background)
+    position = ((width - new_size[0]) // 2, (height - new_size[1]) // 2)
+    mask = resized if resized.mode in ("RGBA", "LA") else None
+    backdrop.paste(resized, position, mask)
+    return backdrop
+
+
+def encode_png(image: "Image.Image") -> bytes:
+    output = BytesIO()
+    image.save(output, format="PNG", compress_level=PNG_COMPRESS_LEVEL)
+    return output.getvalue()
+
+
+def compose_meme_backdrop(
+    image_bytes: bytes, width: int = BACKDROP_WIDTH, height: int = BACKDROP_HEIGHT
+) -> bytes:
+    with Image.open(BytesIO(image_bytes)) as image:
+        return encode_png(letterbox(image, width, height))
+
+
+def compose_tweet_backdrop(
+    image_path: str,
+    width: int = BACKDROP_WIDTH,
+    height: int = BACKDROP_HEIGHT,
+    padding: int = 50,
+) -> bytes:
+    with Image.open(image_path) as image:
+        return encode_png(letterbox(image, width, height, padding))
+
+
+def executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        # By now the process runs threads (to_thread workers, boto3, the
+        # Airtable sync), and a forked child could inherit a held lock
+        context = multiprocessing.get_context("forkserver")
+        context.set_forkserver_preload(COMPOSITE_PRELOAD)
+        _executor = ProcessPoolExecutor(
+            max_workers=COMPOSITE_WORKERS, mp_context=context
+        )
+    return _executor
+
+
+def submit(loop: asyncio.AbstractEventLoop, fn, *args) -> asyncio.Future:
+    # A new worker imports the parent's script again as __mp_main__ unless
+    # __main__ has neither a spec nor a file, and for main.py that means
+    # every provider SDK. Workers only run functions from this module, so
+    # __main__ is swapped out while submit starts them
+    main = sys.modules["__main__"]
+    sys.modules["__main__"] = types.ModuleType("__main__")
+    try:
+        return loop.run_in_executor(executor(), fn, *args)
+    finally:
+        sys.modules["__main__"] = main
+
+
+async def run_in_process(fn, *args):
+    # Image work is CPU bound, so it runs outside the event loop's process.
+    # A pool of one only adds pickling and a process start on top of that
+    if COMPOSITE_WORKERS <= 1:
+        return await asyncio.to_thread(fn, *args)
+    return await submit(asyncio.get_running_loop(), fn, *args)
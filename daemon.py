@@ -0,0 +1,307 @@
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+from aiohttp import web
+
+import load_env  # noqa: F401
+from airtable import meme_catalog
+from asset_cache import CACHE_MODES, asset_cache
+from combine_clips import segment_cache
+from events import current_listener, emit
+from generate_audio import AUDIO_FORMAT, TTS_CONTEXTS
+from http_client import close as close_http
+from http_client import http_client
+from main import run_job
+from meme_index import meme_index
+from mux_audio_and_video import AUDIO_FILES
+from providers import registry
+from render_profiles import RENDER_PROFILE, RENDER_PROFILES
+from tracing import span, tracer
+from twitter_capture import browser_pool
+from workspace import RUNS_DIR, Workspace
+
+# Jobs rendering at once, the rest wait in line. Provider and ffmpeg limits
+# are shared between them like in a batch.
+DAEMON_JOBS = int(os.environ.get("DAEMON_JOBS", 4))
+DAEMON_HOST = os.environ.get("DAEMON_HOST", "127.0.0.1")
+DAEMON_PORT = int(os.environ.get("DAEMON_PORT", 8765))
+# Listen on a Unix socket instead of TCP when set
+DAEMON_SOCKET = os.environ.get("DAEMON_SOCKET")
+# Finished jobs and their events are kept for clients that check on them
+# late, up to this many and for this many seconds
+DAEMON_KEEP_JOBS = int(os.environ.get("DAEMON_KEEP_JOBS", 100))
+DAEMON_JOB_RETENTION = int(os.environ.get("DAEMON_JOB_RETENTION", 60 * 60))
+
+FINISHED = {"completed", "failed"}
+
+
+class Job:
+    # A render submitted to the daemon and every progress event it has
+    # emitted so far, clients that follow it late get the events from the
+    # start
+
+    def __init__(self, job_id: str, options: Dict[str, Any]):
+        self.id = job_id
+        self.options = options
+        self.state = "queued"
+        self.output: Optional[str] = None
+        self.submitted_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.events: List[Dict[str, Any]] = []
+        self._changed = asyncio.Event()
+
+    def emit(self, event: Dict[str, Any]):
+        self.events.append({"job": self.id, **event})
+        self._changed.set()
+
+    async def follow(self):
+        position = 0
+        while True:
+            while position < len(self.events):
+                yield self.events[position]
+                position += 1
+            if self.state in FINISHED:
+                return
+            self._changed.clear()
+            await self._changed.wait()
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "state": self.state,
+            "submitted_at": self.submitted_at,
+            "finished_at": self.finished_at,
+            "output": self.output,
+            "events": len(self.events),
+        }
+
+
+def parse_options(body: Any) -> Dict[str, Any]:
+    if not isinstance(body, dict) or not isinstance(body.get("source"), str):
+        raise ValueError("Expected a JSON object with the source markdown")
+    options = {
+        "source": body["source"],
+        "single_pass": bool(body.get("single_pass", False)),
+        "audio_format": body.get("audio_format", AUDIO_FORMAT),
+        "tts_contexts": int(body.get("tts_contexts", TTS_CONTEXTS)),
+        "profile": body.get("profile", RENDER_PROFILE),
+    }
+    if options["audio_format"] not in AUDIO_FILES:
+        raise ValueError(f"Unknown audio format {options['audio_format']}")
+    if options["profile"] not in RENDER_PROFILES:
+        raise ValueError(f"Unknown render profile {options['profile']}")
+    return options
+
+
+class RenderDaemon:
+    # Keeps one process, event loop and set of provider clients, HTTP pools,
+    # meme index and browsers for every job, where each CLI run builds them
+    # from scratch
+
+    def __init__(
+        self,
+        jobs: int = DAEMON_JOBS,
+        runs_dir: str = RUNS_DIR,
+        keep_jobs: int = DAEMON_KEEP_JOBS,
+        retention: float = DAEMON_JOB_RETENTION,
+    ):
+        self.runs_dir = runs_dir
+        self.keep_jobs = keep_jobs
+        self.retention = retention
+        self.jobs: Dict[str, Job] = {}
+        self.limiter = asyncio.Semaphore(jobs)
+        self._ids = itertools.count(1)
+        self._tasks = set()
+
+    async def warm(self):
+        start = time.perf_counter()
+        # Builds every configured client, without network calls
+        problems = registry.check()
+        for name, found in problems.items():
+            if found:
+                print(f"Not warming {name}: {'; '.join(found)}")
+        http_client.session()
+        if meme_catalog.offline or not problems["airtable"]:
+            try:
+                index = await asyncio.to_thread(meme_index)
+                print(f"Loaded meme index with {len(index.names)} memes")
+            except Exception as e:
+                print(f"Failed to load the meme index: {type(e).__name__}: {e}")
+        print(f"Warmed up in {time.perf_counter() - start:.2f}s")
+
+    def prune(self):
+        # Drops finished jobs past the retention or over the count limit,
+        # oldest first. Their workspaces stay on disk.
+        now = time.time()
+        finished = sorted(
+            (job for job in self.jobs.values() if job.finished_at is not None),
+            key=lambda job: job.finished_at,
+        )
+        excess = len(finished) - self.keep_jobs
+        for position, job in enumerate(finished):
+            if position < excess or now - job.finished_at > self.retention:
+                del self.jobs[job.id]
+
+    def submit(self, options: Dict[str, Any]) -> Job:
+        self.prune()
+        job_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{next(self._ids)}"
+        job = Job(job_id, options)
+        self.jobs[job_id] = job
+        task = asyncio.create_task(self.run(job))
+        # The loop only keeps weak references to tasks
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return job
+
+    async def run(self, job: Job):
+        # Runs in the job's own task, so the listener only hears this job
+        current_listener.set(job.emit)
+        emit("job", state="queued")
+        try:
+            async with self.limiter:
+                await self.render(job)
+        finally:
+            if job.state not in FINISHED:
+                # Cancelled, say by a shutdown, followers must not wait forever
+                job.state = "failed"
+                emit("job", state="failed", error="Cancelled")
+            job.finished_at = time.time()
+            self.prune()
+
+    async def render(self, job: Job):
+        job.state = "running"
+        emit("job", state="running")
+        start = time.perf_counter()
+        job_workspace = Workspace(os.path.join(self.runs_dir, job.id))
+        options = job.options
+        try:
+            with span("job", job=job.id):
+                await run_job(
+                    options["source"],
+                    job_workspace,
+                    options["single_pass"],
+                    options["audio_format"],
+                    options["tts_contexts"],
+                    render_profile=options["profile"],
+                )
+        except Exception as e:
+            print(f"Job {job.id} failed: {type(e).__name__}: {e}")
+            job.state = "failed"
+            emit("job", state="failed", error=f"{type(e).__name__}: {e}")
+            return
+        job.output = job_workspace.final_output
+        job.state = "completed"
+        emit(
+            "job",
+            state="completed",
+            output=job.output,
+            seconds=time.perf_counter() - start,
+        )
+
+    def job(self, request: web.Request) -> Job:
+        job = self.jobs.get(request.match_info["job_id"])
+        if job is None:
+            raise web.HTTPNotFound(
+                text=json.dumps({"error": "Unknown job"}),
+                content_type="application/json",
+            )
+        return job
+
+    async def health(self, request: web.Request):
+        states: Dict[str, int] = {}
+        for job in self.jobs.values():
+            states[job.state] = states.get(job.state, 0) + 1
+        return web.json_response(
+            {
+                "jobs": states,
+                "clients": registry.created(),
+                "idle_browsers": len(browser_pool.idle),
+            }
+        )
+
+    async def create_job(self, request: web.Request):
+        try:
+            options = parse_options(await request.json())
+        except (ValueError, TypeError) as e:
+            return web.json_response({"error": str(e)}, status=400)
+        job = self.submit(options)
+        return web.json_response(job.summary(), status=202)
+
+    async def list_jobs(self, request: web.Request):
+        return web.json_response([job.summary() for job in self.jobs.values()])
+
+    async def get_job(self, request: web.Request):
+        return web.json_response(self.job(request).summary())
+
+    async def job_events(self, request: web.Request):
+        # One JSON event per line as it happens, until the job finishes
+        job = self.job(request)
+        response = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+        await response.prepare(request)
+        async for event in job.follow():
+            await response.write(json.dumps(event).encode() + b"\n")
+        await response.write_eof()
+        return response
+
+    async def job_output(self, request: web.Request):
+        job = self.job(request)
+        if job.state != "completed":
+            return web.json_response({"error": f"Job is {job.state}"}, status=409)
+        return web.FileResponse(job.output)
+
+    async def on_startup(self, app: web.Application):
+        await self.warm()
+
+    async def on_cleanup(self, app: web.Application):
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        await close_http()
+        browser_pool.close()
+        tracer.finish()
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.add_routes(
+            [
+                web.get("/health", self.health),
+                web.post("/jobs", self.create_job),
+                web.get("/jobs", self.list_jobs),
+                web.get("/jobs/{job_id}", self.get_job),
+                web.get("/jobs/{job_id}/events", self.job_events),
+                web.get("/jobs/{job_id}/output", self.job_output),
+            ]
+        )
+        app.on_startup.append(self.on_startup)
+        app.on_cleanup.append(self.on_cleanup)
+        return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Serve renders from one warm process over a local job API"
+    )
+    parser.add_argument("--host", default=DAEMON_HOST)
+    parser.add_argument("--port", type=int, default=DAEMON_PORT)
+    parser.add_argument(
+        "--socket", default=DAEMON_SOCKET, help="Listen on this Unix socket"
+    )
+    parser.add_argument("--jobs", type=int, default=DAEMON_JOBS)
+    parser.add_argument("--cache", choices=CACHE_MODES, default=asset_cache.mode)
+    parser.add_argument("--trace", metavar="PATH", default=tracer.path)
+    args = parser.parse_args()
+    asset_cache.mode = args.cache
+    segment_cache.mode = args.cache
+    if args.trace:
+        tracer.enable(args.trace)
+
+    daemon = RenderDaemon(args.jobs)
+    if args.socket:
+        web.run_app(daemon.app(), path=args.socket)
+    else:
+        web.run_app(daemon.app(), host=args.host, port=args.port)
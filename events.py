@@ -0,0 +1,15 @@
+import contextvars
+import time
+from typing import Any, Callable, Dict, Optional
+
+# Receives the progress of the job running in this context, the daemon
+# streams it to clients. A plain CLI run has no listener.
+current_listener: contextvars.ContextVar[Optional[Callable[[Dict[str, Any]], None]]] = (
+    contextvars.ContextVar("current_listener", default=None)
+)
+
+
+def emit(event: str, **fields):
+    listener = current_listener.get()
+    if listener is not None:
+        listener({"event": event, "time": time.time(), **fields})
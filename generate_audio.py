@@ -1,15 +1,17 @@
 import asyncio
 import os
+import re
+from typing import List, Optional
 
-from cartesia import AsyncCartesia
-from dotenv import load_dotenv
-from openai import OpenAI
+from captions import format_time
+from http_client import provider_limit
+from planner import Word, save_words
+from providers import lazy_import, registry
+from tracing import span
+from workspace import workspace
 
-load_dotenv()
-
-openai_client = OpenAI(
-    api_key=os.environ.get("OPENAI_API_KEY"),
-)
+cartesia = lazy_import("cartesia")
+openai_client = registry.lazy("openai")
 
 PROMPT = """
 Read the following summary of on or more currently unfolding news stories in the tech industry.
@@ -31,10 +33,12 @@ Don't add filler words or phrases like "let's begin", just get to the meat of th
 
 
 async def generate_transcript(summary: str):
-    response = openai_client.chat.completions.create(
-        model="gpt-4o",
-        messages=[{"role": "user", "content": PROMPT.format(summary=summary)}],
-    )
+    async with provider_limit("openai"):
+        with span("openai.transcript"):
+            response = await openai_client.chat.completions.create(
+                model="gpt-4o",
+                messages=[{"role": "user", "content": PROMPT.format(summary=summary)}],
+            )
     print(response)
     transcript = response.choices[0].message.content
     print(transcript)
@@ -43,6 +47,24 @@ async def generate_transcript(summary: str):
 
 sample_rate = 44100
 
+# pcm keeps the raw float stream, s16 and m4a are encoded while streaming
+AUDIO_FORMAT = os.environ.get("AUDIO_FORMAT", "pcm")
+
+# Cartesia contexts synthesizing transcript segments in parallel
+TTS_CONTEXTS = int(os.environ.get("TTS_CONTEXTS", 1))
+
+ENCODER_ARGS = {
+    "s16": ["-f", "s16le"],
+    "m4a": ["-c:a", "aac", "-b:a", "192k"],
+}
+
+# Rough narration pace used to plan the storyboard before synthesis finishes
+WORDS_PER_SECOND = 2.8
+
+
+def estimate_duration(transcript: str):
+    return len(transcript.split()) / WORDS_PER_SECOND
+
 
 def compute_duration(total_bytes: int):
     bytes_per_sample = 4
@@ -50,6 +72,38 @@ def compute_duration(total_bytes: int):
     return duration_seconds
 
 
+def split_transcript(transcript: str, segments: int):
+    # Splits the transcript into at most `segments` contiguous groups of lines
+    # with roughly equal word counts.
+    lines = [line.strip() for line in transcript.split("\n") if line.strip()]
+    if len(lines) < segments:
+        lines = [
+            sentence
+            for line in lines
+            for sentence in re.split(r"(?<=[.!?])\s+", line)
+            if sentence
+        ]
+
+    total_words = sum(len(line.split()) for line in lines)
+    target = total_words / max(1, min(segments, len(lines)))
+    groups = [[]]
+    words = 0
+    for line in lines:
+        if groups[-1] and words >= target * len(groups) and len(groups) < segments:
+            groups.append([])
+        groups[-1].append(line)
+        words += len(line.split())
+    return ["\n".join(group) for group in groups if group]
+
+
+def shift_timestamps(word_timestamps, offset: float):
+    return {
+        **word_timestamps,
+        "start": [start + offset for start in word_timestamps["start"]],
+        "end": [end + offset for end in word_timestamps["end"]],
+    }
+
+
 async def send_transcripts(ctx, transcript: str):
     # "Friendly Australian Man"
     voice_id = "421b3369-f63f-4b03-8980-37a44df1d4e8"
@@ -81,73 +135,185 @@ async def send_transcripts(ctx, transcript: str):
     await ctx.no_more_inputs()
 
 
-async def receive_audio(ctx):
-    total_bytes = 0
-    print("Generating audio...")
-    timestamp_chunks = []
-    with open("audio.pcm", "wb") as output_file:
+class PcmFileSink:
+    def __init__(self, path: str):
+        self.path = path
+        self.file = open(path, "wb")
+
+    async def write(self, buffer: bytes):
+        self.file.write(buffer)
+
+    async def close(self):
+        self.file.close()
+
+
+class EncoderSink:
+    # Pipes raw float samples into a background ffmpeg as they arrive, so the
+    # encoded file is complete as soon as synthesis ends.
+
+    def __init__(self, path: str, codec_args):
+        self.path = path
+        self.codec_args = codec_args
+        self.process = None
+
+    async def start(self):
+        # fmt: off
+        self.process = await asyncio.create_subprocess_exec(
+            "ffmpeg", "-y", "-loglevel", "error",
+            "-f", "f32le", "-ar", f"{sample_rate}", "-ac", "1", "-i", "pipe:0",
+            *self.codec_args,
+            self.path,
+            stdin=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        # fmt: on
+        return self
+
+    async def write(self, buffer: bytes):
+        self.process.stdin.write(buffer)
+        await self.process.stdin.drain()
+
+    async def close(self):
+        self.process.stdin.close()
+        stderr = await self.process.stderr.read()
+        if await self.process.wait() != 0:
+            print(f"Error encoding audio: {stderr.decode()}")
+            raise RuntimeError("FFmpeg audio encoder failed")
+
+
+async def open_audio_sink(audio_format: str = AUDIO_FORMAT):
+    path = workspace().audio(audio_format)
+    if audio_format == "pcm":
+        return PcmFileSink(path)
+    return await EncoderSink(path, ENCODER_ARGS[audio_format]).start()
+
+
+class SrtWriter:
+    # Writes each caption once the next one arrives, since a cue ends where
+    # the following chunk starts. Every word timing is kept for the planner,
+    # which cuts clips between words.
+
+    def __init__(self, path: str, words_path: Optional[str] = None):
+        self.file = open(path, "w")
+        self.words_path = words_path
+        self.words: List[Word] = []
+        self.subtitle_count = 0
+        self.pending = None
+
+    def add(self, word_timestamps):
+        if self.pending is not None:
+            self._write(self.pending, word_timestamps["start"][0])
+        self.pending = word_timestamps
+        self.words.extend(
+            Word(text, start, end)
+            for text, start, end in zip(
+                word_timestamps["words"],
+                word_timestamps["start"],
+                word_timestamps["end"],
+            )
+        )
+
+    def close(self):
+        if self.pending is not None:
+            self._write(self.pending, self.pending["end"][-1])
+            self.pending = None
+        self.file.close()
+        if self.words_path:
+            save_words(self.words_path, self.words)
+
+    def _write(self, word_timestamps, end_seconds):
+        self.subtitle_count += 1
+        start_time = format_time(word_timestamps["start"][0])
+        end_time = format_time(end_seconds)
+        accumulated_words = " ".join(word_timestamps["words"])
+
+        self.file.write(f"{self.subtitle_count}\n")
+        self.file.write(f"{start_time} --> {end_time}\n")
+        self.file.write(f"{accumulated_words}\n\n")
+        self.file.flush()
+
+
+async def buffer_segment(ctx, queue: asyncio.Queue):
+    try:
         async for chunk in ctx.receive():
-            if "audio" in chunk:
-                buffer = chunk["audio"]
-                output_file.write(buffer)
-                total_bytes += len(buffer)
-            if "word_timestamps" in chunk:
-                timestamp_chunks.append(chunk)
-
-    print("Generating captions...")
-    with open("captions.srt", "w") as srt_file:
-        subtitle_count = 0
-        for i, chunk in enumerate(timestamp_chunks):
-            word_timestamps = chunk["word_timestamps"]
-            words = word_timestamps["words"]
-            start_times = word_timestamps["start"]
-            end_times = word_timestamps["end"]
-
-            subtitle_count += 1
-            start_time = format_time(start_times[0])
-            end_time = None
-
-            # Peek ahead to grab the end time of the next chunk
-            if i < len(timestamp_chunks) - 1:
-                next_chunk = timestamp_chunks[i + 1]
-                next_start_time = next_chunk["word_timestamps"]["start"][0]
-                end_time = format_time(next_start_time)
-            else:
-                end_time = format_time(end_times[-1])
-
-            accumulated_words = " ".join(words)
-
-            srt_file.write(f"{subtitle_count}\n")
-            srt_file.write(f"{start_time} --> {end_time}\n")
-            srt_file.write(f"{accumulated_words}\n\n")
+            await queue.put(chunk)
+    finally:
+        await queue.put(None)
 
-    return total_bytes
 
+async def receive_audio(ctx, audio_format: str = AUDIO_FORMAT):
+    return await receive_segments([ctx], audio_format)
 
-def format_time(seconds):
-    hours, remainder = divmod(seconds, 3600)
-    minutes, seconds = divmod(remainder, 60)
-    milliseconds = int((seconds % 1) * 1000)
-    return f"{int(hours):02d}:{int(minutes):02d}:{int(seconds):02d},{milliseconds:03d}"
 
+async def receive_segments(contexts, audio_format: str = AUDIO_FORMAT):
+    # Every context streams into its own queue, and the queues are drained in
+    # transcript order. Timestamps of later segments are shifted by the audio
+    # written before them so the captions line up with the stitched audio.
+    total_bytes = 0
+    print("Generating audio and captions...")
+    queues = [asyncio.Queue() for _ in contexts]
+    receivers = [
+        asyncio.create_task(buffer_segment(ctx, queue))
+        for ctx, queue in zip(contexts, queues)
+    ]
+    sink = await open_audio_sink(audio_format)
+    srt = SrtWriter(workspace().captions, workspace().words)
+    try:
+        for queue in queues:
+            offset = compute_duration(total_bytes)
+            while (chunk := await queue.get()) is not None:
+                if "audio" in chunk:
+                    buffer = chunk["audio"]
+                    await sink.write(buffer)
+                    total_bytes += len(buffer)
+                if "word_timestamps" in chunk:
+                    srt.add(shift_timestamps(chunk["word_timestamps"], offset))
+        await asyncio.gather(*receivers)
+    finally:
+        for receiver in receivers:
+            receiver.cancel()
+        srt.close()
+        await sink.close()
 
-async def generate_audio(summary: str):
-    client = AsyncCartesia(api_key=os.environ.get("CARTESIA_API_KEY"))
+    return total_bytes
 
-    ws = await client.tts.websocket()
 
-    ctx = ws.context()
+async def synthesize_audio(
+    transcript: str, audio_format: str = AUDIO_FORMAT, contexts: int = TTS_CONTEXTS
+):
+    # Cartesia caps concurrent websocket sessions per account
+    async with provider_limit("cartesia"):
+        client = cartesia.AsyncCartesia(api_key=os.environ.get("CARTESIA_API_KEY"))
 
-    transcript = await generate_transcript(summary)
+        ws = await client.tts.websocket()
 
-    send_task = asyncio.create_task(send_transcripts(ctx, transcript))
-    listen_task = asyncio.create_task(receive_audio(ctx))
+        segments = (
+            split_transcript(transcript, contexts) if contexts > 1 else [transcript]
+        )
+        ctxs = [ws.context() for _ in segments]
+        if len(ctxs) > 1:
+            print(f"Synthesizing {len(ctxs)} transcript segments in parallel")
 
-    _, total_bytes = await asyncio.gather(send_task, listen_task)
+        send_tasks = [
+            asyncio.create_task(send_transcripts(ctx, segment))
+            for ctx, segment in zip(ctxs, segments)
+        ]
+        listen_task = asyncio.create_task(receive_segments(ctxs, audio_format))
 
-    duration_seconds = compute_duration(total_bytes)
+        with span("cartesia.tts", contexts=len(ctxs)) as tts_span:
+            *_, total_bytes = await asyncio.gather(*send_tasks, listen_task)
+            tts_span.set(bytes=total_bytes)
 
-    print(f"Generated {duration_seconds} seconds of audio.")
-    print("Saved audio.pcm and captions.srt")
+        duration_seconds = compute_duration(total_bytes)
 
-    return duration_seconds
+        print(f"Generated {duration_seconds} seconds of audio.")
+        print(f"Saved {workspace().audio(audio_format)} and {workspace().captions}")
+
+        return duration_seconds
+
+
+async def generate_audio(
+    summary: str, audio_format: str = AUDIO_FORMAT, contexts: int = TTS_CONTEXTS
+):
+    transcript = await generate_transcript(summary)
+    return await synthesize_audio(transcript, audio_format, contexts)
@@ -0,0 +1,285 @@
+import asyncio
+import contextlib
+import json
+import os
+import random
+from typing import Dict, NamedTuple
+
+from multidict import CIMultiDict
+
+from providers import lazy_import
+from tracing import current_span, span
+
+aiohttp = lazy_import("aiohttp")
+
+# Connections kept open across every provider, and per host
+HTTP_MAX_CONNECTIONS = int(os.environ.get("HTTP_MAX_CONNECTIONS", 64))
+HTTP_MAX_CONNECTIONS_PER_HOST = int(os.environ.get("HTTP_MAX_CONNECTIONS_PER_HOST", 16))
+HTTP_TIMEOUT = float(os.environ.get("HTTP_TIMEOUT", 60))
+DOWNLOAD_CHUNK_SIZE = 256 * 1024
+MAX_BACKOFF = 30
+
+RETRY_STATUSES = {408, 429, 500, 502, 503, 504}
+
+
+def retry_errors():
+    return (
+        aiohttp.ClientConnectionError,
+        aiohttp.ClientPayloadError,
+        asyncio.TimeoutError,
+    )
+
+
+class ProviderLimits(NamedTuple):
+    # Steady requests per second and how many may go out back to back
+    rate: float
+    burst: int
+    # Requests in flight at once
+    concurrency: int
+    # Retries per request after the first attempt
+    retries: int = 3
+    # Retries allowed per request made, shared across the provider so an
+    # outage does not multiply the load with retries
+    retry_ratio: float = 0.2
+    backoff: float = 0.5
+
+
+# Limits are per process, so concurrent batch jobs share them. SDK based
+# providers (openai, cartesia, luma) hold a slot through provider_limit().
+PROVIDER_LIMITS: Dict[str, ProviderLimits] = {
+    "openai": ProviderLimits(rate=5, burst=5, concurrency=8),
+    "cartesia": ProviderLimits(rate=2, burst=2, concurrency=2),
+    # A slot covers a generation from creation until it completes
+    "luma": ProviderLimits(rate=1, burst=5, concurrency=10),
+    "ideogram": ProviderLimits(rate=2, burst=4, concurrency=4),
+    "memes": ProviderLimits(rate=10, burst=10, concurrency=8),
+    "downloads": ProviderLimits(rate=20, burst=20, concurrency=8),
+    "default": ProviderLimits(rate=10, burst=10, concurrency=8),
+}
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = float(burst)
+        self.updated = None
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        # The lock queues waiters so tokens go out in arrival order
+        async with self.lock:
+            loop = asyncio.get_running_loop()
+            while True:
+                now = loop.time()
+                if self.updated is not None:
+                    elapsed = now - self.updated
+                    self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class RetryBudget:
+    def __init__(self, ratio: float, minimum: float = 3):
+        self.ratio = ratio
+        self.minimum = minimum
+        self.balance = minimum
+
+    def deposit(self):
+        self.balance = min(self.balance + self.ratio, 10 * max(self.minimum, 1))
+
+    def withdraw(self) -> bool:
+        if self.balance < 1:
+            return False
+        self.balance -= 1
+        return True
+
+
+class Provider:
+    def __init__(self, limits: ProviderLimits):
+        self.limits = limits
+        self.bucket = TokenBucket(limits.rate, limits.burst)
+        self.semaphore = asyncio.Semaphore(limits.concurrency)
+        self.budget = RetryBudget(limits.retry_ratio)
+
+
+class HttpResponse(NamedTuple):
+    status: int
+    headers: CIMultiDict
+    body: bytes
+
+    @property
+    def ok(self) -> bool:
+        return 200 <= self.status < 300
+
+    def json(self):
+        return json.loads(self.body)
+
+
+class HttpClient:
+    # One pooled session per event loop with keep-alive connections, shared by
+    # every provider. Each provider gets its own token bucket, concurrency cap
+    # and retry budget.
+
+    def __init__(self, limits: Dict[str, ProviderLimits] = PROVIDER_LIMITS):
+        self.limits = dict(limits)
+        self._sessions: Dict[asyncio.AbstractEventLoop, aiohttp.ClientSession] = {}
+        self._providers: Dict[tuple, Provider] = {}
+
+    def configure(self, provider: str, limits: ProviderLimits):
+        self.limits[provider] = limits
+        for key in [key for key in self._providers if key[1] == provider]:
+            del self._providers[key]
+
+    def session(self) -> "aiohttp.ClientSession":
+        loop = asyncio.get_running_loop()
+        # Drop sessions left behind by finished asyncio.run calls
+        for stale in [other for other in self._sessions if other.is_closed()]:
+            del self._sessions[stale]
+        session = self._sessions.get(loop)
+        if session is None or session.closed:
+            session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=HTTP_MAX_CONNECTIONS,
+                    limit_per_host=HTTP_MAX_CONNECTIONS_PER_HOST,
+                    ttl_dns_cache=300,
+                ),
+                timeout=aiohttp.ClientTimeout(total=HTTP_TIMEOUT),
+            )
+            self._sessions[loop] = session
+        return session
+
+    def provider(self, name: str) -> Provider:
+        key = (asyncio.get_running_loop(), name)
+        if key not in self._providers:
+            self._providers = {
+                k: v for k, v in self._providers.items() if not k[0].is_closed()
+            }
+            limits = self.limits.get(name, self.limits["default"])
+            self._providers[key] = Provider(limits)
+        return self._providers[key]
+
+    def backoff(self, provider: Provider, attempt: int, retry_after=None) -> float:
+        if retry_after:
+            try:
+                return min(float(retry_after), MAX_BACKOFF)
+            except ValueError:
+                pass
+        # Full jitter keeps retries from a burst from landing together
+        return random.uniform(0, min(MAX_BACKOFF, provider.limits.backoff * 2**attempt))
+
+    async def _send(self, provider_name: str, method: str, url: str, handle, **kwargs):
+        # Calls handle(response) under the provider limits, retrying
+        # connection errors and retryable statuses while the budget allows
+        provider = self.provider(provider_name)
+        provider.budget.deposit()
+        attempt = 0
+        while True:
+            await provider.bucket.acquire()
+            current_span().set(attempts=attempt + 1)
+            retry_after = None
+            try:
+                async with provider.semaphore:
+                    async with self.session().request(
+                        method, url, **kwargs
+                    ) as response:
+                        if response.status not in RETRY_STATUSES:
+                            return await handle(response)
+                        retry_after = response.headers.get("Retry-After")
+                        last_error = f"status {response.status}"
+                        last_response = await handle(response)
+            except retry_errors() as e:
+                last_error = e
+                last_response = None
+
+            if attempt >= provider.limits.retries or not provider.budget.withdraw():
+                if last_response is None:
+                    raise last_error
+                return last_response
+            delay = self.backoff(provider, attempt, retry_after)
+            print(
+                f"{provider_name}: retrying {method} {url} in {delay:.1f}s "
+                f"({last_error})"
+            )
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    @contextlib.asynccontextmanager
+    async def limit(self, provider_name: str):
+        # The same rate and concurrency limits for calls made through an SDK
+        provider = self.provider(provider_name)
+        await provider.bucket.acquire()
+        async with provider.semaphore:
+            yield
+
+    async def request(
+        self, provider: str, method: str, url: str, **kwargs
+    ) -> HttpResponse:
+        async def read(response):
+            body = await response.read()
+            current_span().set(status=response.status, bytes=len(body))
+            return HttpResponse(response.status, CIMultiDict(response.headers), body)
+
+        with span(f"http:{provider}", method=method, url=url):
+            return await self._send(provider, method, url, read, **kwargs)
+
+    async def download(self, provider: str, url: str, path: str, **kwargs):
+        # Streams the body to disk, the file only appears once complete
+        partial = f"{path}.part"
+
+        async def write(response):
+            if response.status in RETRY_STATUSES:
+                return response.status
+            response.raise_for_status()
+            written = 0
+            try:
+                with open(partial, "wb") as f:
+                    async for chunk in response.content.iter_chunked(
+                        DOWNLOAD_CHUNK_SIZE
+                    ):
+                        f.write(chunk)
+                        written += len(chunk)
+            except BaseException:
+                # open() itself may be what failed
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(partial)
+                raise
+            os.replace(partial, path)
+            current_span().set(status=response.status, bytes=written)
+            return response.status
+
+        with span(f"http:{provider}", method="GET", url=url):
+            status = await self._send(provider, "GET", url, write, **kwargs)
+        if status in RETRY_STATUSES:
+            raise aiohttp.ClientResponseError(
+                None, (), status=status, message=f"Failed to download {url}"
+            )
+        return path
+
+    async def close(self):
+        loop = asyncio.get_running_loop()
+        session = self._sessions.pop(loop, None)
+        if session:
+            await session.close()
+
+
+http_client = HttpClient()
+
+
+async def request(provider: str, method: str, url: str, **kwargs) -> HttpResponse:
+    return await http_client.request(provider, method, url, **kwargs)
+
+
+async def download(provider: str, url: str, path: str, **kwargs) -> str:
+    return await http_client.download(provider, url, path, **kwargs)
+
+
+def provider_limit(provider: str):
+    return http_client.limit(provider)
+
+
+async def close():
+    await http_client.close()
@@ -1,9 +1,14 @@
 import os
 from typing import Optional
 
-import aiohttp
+from asset_cache import asset_cache, cache_key
+from http_client import request
+from tracing import span
 
 IDEOGRAM_URL = "https://api.ideogram.ai/generate"
+# The response links to images on temporary URLs, a cached response is only
+# used while its URLs still work
+IDEOGRAM_CACHE_TTL = int(os.environ.get("IDEOGRAM_CACHE_TTL", 60 * 60))
 
 IDEOGRAM_HEADERS = {
     "Api-Key": os.getenv("IDEOGRAM_API_KEY"),
@@ -26,8 +31,23 @@ async def generate_ideo_image(prompt: str, starting_image_url: Optional[str] = N
             "frame0": {"type": "image", "url": starting_image_url}
         }
 
-    async with aiohttp.ClientSession() as session:
-        async with session.post(
-            IDEOGRAM_URL, json=image_request, headers=IDEOGRAM_HEADERS
-        ) as response:
-            return await response.json()
+    key = cache_key("ideogram", **image_request)
+    cached = asset_cache.get(key, max_age=IDEOGRAM_CACHE_TTL)
+    if cached:
+        return cached["value"]
+
+    with span("ideogram.generate"):
+        response = await request(
+            "ideogram",
+            "POST",
+            IDEOGRAM_URL,
+            json=image_request,
+            headers=IDEOGRAM_HEADERS,
+        )
+        result = response.json()
+
+    if response.status == 200 and result.get("data"):
+        asset_cache.put(
+            key, source="ideogram", value=result, provider_id=result["data"][0]["url"]
+        )
+    return result
@@ -1,13 +1,59 @@
+import asyncio
+import contextlib
+import contextvars
+import json
+import os
+import statistics
+import tempfile
 import time
-from typing import Optional
+from collections import deque
+from typing import Awaitable, Callable, Dict, NamedTuple, Optional
 
-from lumaai import AsyncLumaAI
 from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_fixed
 
+from asset_cache import asset_cache, cache_key
+from http_client import provider_limit
+from providers import registry
+from tracing import span
+
 MAX_ATTEMPTS = 30
 POLL_INTERVAL = 5
+MIN_POLL_INTERVAL = 1
+BACKOFF_FACTOR = 1.5
+GENERATION_TIMEOUT = MAX_ATTEMPTS * POLL_INTERVAL
+# Generation durations from past runs, hedging learns its deadline from them
+LUMA_STATS_PATH = os.environ.get("LUMA_STATS_PATH", ".cache/luma_durations.json")
+# Duplicate generations a run may submit, hedging is off at 0
+LUMA_HEDGE_BUDGET = int(os.environ.get("LUMA_HEDGE_BUDGET", 0))
+# A generation still pending past this percentile of past durations is hedged
+LUMA_HEDGE_PERCENTILE = float(os.environ.get("LUMA_HEDGE_PERCENTILE", 0.9))
+LUMA_HEDGE_MIN_SAMPLES = int(os.environ.get("LUMA_HEDGE_MIN_SAMPLES", 10))
+
+# Built on first use, see providers.py
+client = registry.lazy("luma")
 
-client = AsyncLumaAI()
+
+def start_keyframes(start_image_url: Optional[str]) -> dict:
+    return (
+        {"frame0": {"type": "image", "url": start_image_url}} if start_image_url else {}
+    )
+
+
+def cached_generation(
+    prompt: Optional[str] = None,
+    start_image_url: Optional[str] = None,
+    aspect_ratio: str = "16:9",
+) -> Optional[str]:
+    # A generation submitted earlier for the same request, possibly by another
+    # job. Its polled duration says nothing about how long generations take.
+    key = cache_key(
+        "luma",
+        prompt=prompt,
+        keyframes=start_keyframes(start_image_url),
+        aspect_ratio=aspect_ratio,
+    )
+    cached = asset_cache.get(key)
+    return cached["value"] if cached else None
 
 
 @retry(
@@ -19,44 +65,349 @@ async def generate_luma_video(
     prompt: Optional[str] = None,
     start_image_url: Optional[str] = None,
     aspect_ratio: str = "16:9",
+    use_cache: bool = True,
 ):
-    generation = await client.generations.create(
-        prompt=prompt,
-        keyframes={"frame0": {"type": "image", "url": start_image_url}}
-        if start_image_url
-        else {},
-        aspect_ratio=aspect_ratio,
-    )
+    # A cached generation id skips creation, polling it returns immediately.
+    # The tracker discards it again if the generation fails or times out.
+    if use_cache:
+        cached = cached_generation(prompt, start_image_url, aspect_ratio)
+        if cached:
+            return cached
+
+    keyframes = start_keyframes(start_image_url)
+    with span("luma.create"):
+        generation = await client.generations.create(
+            prompt=prompt,
+            keyframes=keyframes,
+            aspect_ratio=aspect_ratio,
+        )
+    if use_cache:
+        key = cache_key(
+            "luma", prompt=prompt, keyframes=keyframes, aspect_ratio=aspect_ratio
+        )
+        asset_cache.put(
+            key, source="luma", value=generation.id, provider_id=generation.id
+        )
     return generation.id
 
 
+class PendingGeneration(NamedTuple):
+    future: asyncio.Future
+    submitted_at: float
+    timeout: float
+    # Picked up again by a resumed run, its true duration is unknown
+    reattached: bool = False
+
+
+class GenerationTracker:
+    # Polls every outstanding generation from a single loop, so waiting on one
+    # generation never holds up the others.
+
+    def __init__(
+        self,
+        client,
+        min_interval: float = MIN_POLL_INTERVAL,
+        max_interval: float = POLL_INTERVAL,
+        timeout: float = GENERATION_TIMEOUT,
+        history: int = 50,
+        stats_path: Optional[str] = None,
+    ):
+        self.client = client
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.timeout = timeout
+        self.durations = deque(maxlen=history)
+        self.stats_path = stats_path
+        if stats_path and os.path.exists(stats_path):
+            with open(stats_path) as f:
+                self.durations.extend(json.load(f))
+        self._pending: Dict[str, PendingGeneration] = {}
+        # Callers waiting on each pending generation, jobs that share a
+        # cached generation id share its future
+        self._waiters: Dict[str, int] = {}
+        self._interval = min_interval
+        self._task: Optional[asyncio.Task] = None
+
+    def track(
+        self,
+        generation_id: str,
+        timeout: Optional[float] = None,
+        reattached: bool = False,
+    ):
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done():
+            # Drop anything left over from a previous event loop
+            self._prune(
+                lambda pending: (
+                    pending.future.get_loop() is loop and not pending.future.done()
+                )
+            )
+
+        pending = self._pending.get(generation_id)
+        if pending is None or pending.future.done():
+            pending = PendingGeneration(
+                future=loop.create_future(),
+                submitted_at=time.monotonic(),
+                timeout=self.timeout if timeout is None else timeout,
+                reattached=reattached,
+            )
+            self._pending[generation_id] = pending
+            self._waiters[generation_id] = 0
+        self._waiters[generation_id] += 1
+
+        if self._task is None or self._task.done():
+            self._interval = self.min_interval
+            self._task = loop.create_task(self._run())
+
+        return pending.future
+
+    def forget(self, generation_id: str):
+        # One caller stops waiting, the generation is only cancelled and no
+        # longer polled once nobody waits for it
+        if generation_id not in self._pending:
+            return
+        self._waiters[generation_id] -= 1
+        if self._waiters[generation_id] > 0:
+            return
+        pending = self._pending.pop(generation_id)
+        del self._waiters[generation_id]
+        if not pending.future.done():
+            pending.future.cancel()
+
+    def _prune(self, keep: Callable[[PendingGeneration], bool]):
+        self._pending = {
+            gid: pending for gid, pending in self._pending.items() if keep(pending)
+        }
+        self._waiters = {
+            gid: count for gid, count in self._waiters.items() if gid in self._pending
+        }
+
+    def percentile(self, fraction: float) -> float:
+        durations = sorted(self.durations)
+        return durations[min(len(durations) - 1, int(len(durations) * fraction))]
+
+    def save_durations(self):
+        if not self.stats_path:
+            return
+        directory = os.path.dirname(self.stats_path) or "."
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=directory)
+        with os.fdopen(fd, "w") as f:
+            json.dump(list(self.durations), f)
+        os.replace(temp_path, self.stats_path)
+
+    async def _run(self):
+        while self._pending:
+            await asyncio.sleep(self._next_interval())
+            await self._poll_once()
+
+    def _next_interval(self):
+        if self.durations:
+            expected = statistics.median(self.durations)
+            now = time.monotonic()
+            remaining = min(
+                expected - (now - pending.submitted_at)
+                for pending in self._pending.values()
+            )
+            if remaining > self.min_interval:
+                # Nothing is expected to finish yet, sleep until the earliest
+                # generation is due and poll quickly from there.
+                self._interval = self.min_interval
+                return min(remaining, self.max_interval)
+
+        interval = self._interval
+        self._interval = min(self._interval * BACKOFF_FACTOR, self.max_interval)
+        return interval
+
+    async def _poll_once(self):
+        self._prune(lambda pending: not pending.future.done())
+        generation_ids = list(self._pending)
+        if not generation_ids:
+            return
+        print(f"Polling {len(generation_ids)} pending generations")
+        statuses = await asyncio.gather(
+            *(self.client.generations.get(gid) for gid in generation_ids),
+            return_exceptions=True,
+        )
+
+        now = time.monotonic()
+        for generation_id, status in zip(generation_ids, statuses):
+            pending = self._pending.get(generation_id)
+            if pending is None or pending.future.done():
+                continue
+
+            elapsed = now - pending.submitted_at
+            if isinstance(status, Exception):
+                print(f"Error getting generation status for {generation_id}: {status}")
+            elif status.state == "completed":
+                print(f"Generation {generation_id} completed in {elapsed:.1f}s")
+                if not pending.reattached:
+                    self.durations.append(elapsed)
+                    self.save_durations()
+                pending.future.set_result(status)
+                continue
+            elif status.state == "failed":
+                print(f"Generation {generation_id} failed")
+                asset_cache.discard("luma", generation_id)
+                pending.future.set_exception(
+                    Exception(f"Generation failed: {status.failure_reason}")
+                )
+                continue
+
+            if elapsed > pending.timeout:
+                print(f"Timed out waiting for generation {generation_id}")
+                asset_cache.discard("luma", generation_id)
+                pending.future.set_exception(Exception("Max attempts reached"))
+
+        self._prune(lambda pending: not pending.future.done())
+
+
+tracker = GenerationTracker(client, stats_path=LUMA_STATS_PATH)
+
+
+class HedgePolicy:
+    # When one run duplicates a slow generation, and how many duplicates it
+    # may still submit. Shared by the run's items.
+
+    def __init__(
+        self,
+        budget: int = LUMA_HEDGE_BUDGET,
+        percentile: float = LUMA_HEDGE_PERCENTILE,
+        min_samples: int = LUMA_HEDGE_MIN_SAMPLES,
+    ):
+        self.remaining = budget
+        self.percentile = percentile
+        self.min_samples = min_samples
+
+    def deadline(self) -> Optional[float]:
+        if self.remaining <= 0 or len(tracker.durations) < self.min_samples:
+            return None
+        return tracker.percentile(self.percentile)
+
+    def take(self) -> bool:
+        if self.remaining <= 0:
+            return False
+        self.remaining -= 1
+        return True
+
+    def refund(self):
+        # A hedge that was never submitted does not count
+        self.remaining += 1
+
+
+# Set per job by main.run_job, runs without one never hedge
+current_hedge_policy: contextvars.ContextVar[Optional[HedgePolicy]] = (
+    contextvars.ContextVar("current_hedge_policy", default=None)
+)
+
+
+async def race_generations(futures: Dict[asyncio.Future, str]):
+    # The first generation to complete wins and this caller stops waiting on
+    # the other, which is only dropped once no other job waits for it.
+    # Luma has no cancel and the asset cache may still point at the loser, so
+    # it is left to finish. A failed generation only loses once the other one
+    # has an outcome too.
+    pending = set(futures)
+    error = None
+    while pending:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for future in done:
+            # A generation forgotten by every other waiter loses like a
+            # failed one
+            if future.cancelled():
+                error = error or Exception(
+                    f"Generation {futures[future]} was cancelled"
+                )
+                continue
+            if future.exception() is not None:
+                error = error or future.exception()
+                continue
+            winner = futures[future]
+            for loser in (gid for gid in futures.values() if gid != winner):
+                tracker.forget(loser)
+            print(f"Hedge race won by {winner}")
+            return future.result()
+    raise error
+
+
 async def poll_generation(
     generation_id: str,
-    max_attempts=MAX_ATTEMPTS,
-    delay=POLL_INTERVAL,
+    timeout: float = GENERATION_TIMEOUT,
+    reattached: bool = False,
+    hedge: Optional[Callable[[], Awaitable[str]]] = None,
 ):
-    for attempt in range(max_attempts):
-        print(
-            f"Attempt {attempt + 1}/{max_attempts} to poll generation {generation_id}"
-        )
+    # hedge submits a duplicate of the generation. It is used when the run
+    # has budget left and the generation is still pending past the learned
+    # percentile of past durations.
+    with span("luma.poll", generation=generation_id, reattached=reattached):
+        primary = tracker.track(generation_id, timeout=timeout, reattached=reattached)
         try:
-            status = await client.generations.get(generation_id)
-        except Exception as e:
-            print(f"Error getting generation status: {e}")
-            print(f"Waiting {delay} seconds before next attempt")
-            time.sleep(delay)
-            continue
-
-        print(f"Current status: {status.state}")
-        if status.state == "completed":
-            print(f"Generation {generation_id} completed successfully")
-            return status
-        elif status.state == "failed":
-            print(f"Generation {generation_id} failed")
-            raise Exception(f"Generation failed: {status.failure_reason}")
-
-        print(f"Waiting {delay} seconds before next attempt")
-        time.sleep(delay)
-
-    print(f"Max attempts ({max_attempts}) reached for generation {generation_id}")
-    raise Exception("Max attempts reached")
+            return await wait_generation(
+                primary, generation_id, timeout, reattached, hedge
+            )
+        except asyncio.CancelledError:
+            # Other jobs may wait on the same generation, the tracker only
+            # stops polling it once they have all gone
+            tracker.forget(generation_id)
+            raise
+
+
+async def wait_generation(
+    primary: asyncio.Future,
+    generation_id: str,
+    timeout: float,
+    reattached: bool,
+    hedge: Optional[Callable[[], Awaitable[str]]],
+):
+    # The tracker's future is shared by every caller with this generation id,
+    # so it is always awaited through a shield. Cancelling one caller must
+    # not cancel it for the others.
+    policy = current_hedge_policy.get()
+    if hedge is None or reattached or policy is None:
+        return await asyncio.shield(primary)
+    deadline = policy.deadline()
+    if deadline is None:
+        return await asyncio.shield(primary)
+    try:
+        return await asyncio.wait_for(asyncio.shield(primary), deadline)
+    except asyncio.TimeoutError:
+        pass
+    if not policy.take():
+        return await asyncio.shield(primary)
+
+    print(f"Generation {generation_id} passed {deadline:.0f}s, hedging it")
+    with span("luma.hedge", generation=generation_id) as hedge_span:
+        async with contextlib.AsyncExitStack() as stack:
+            # The duplicate is one more generation in flight on the account.
+            # Its slot is only waited for while the primary is still pending,
+            # since the primary holds a slot of its own.
+            slot = asyncio.ensure_future(
+                stack.enter_async_context(provider_limit("luma"))
+            )
+            try:
+                await asyncio.wait({slot, primary}, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                if primary.done() or not slot.done():
+                    slot.cancel()
+                    await asyncio.gather(slot, return_exceptions=True)
+            if primary.done():
+                policy.refund()
+                hedge_span.set(outcome="no_slot")
+                return await asyncio.shield(primary)
+            try:
+                duplicate = await hedge()
+            except Exception as e:
+                # The primary is still running fine without it
+                print(f"Failed to hedge generation {generation_id}: {e}")
+                policy.refund()
+                hedge_span.set(outcome="failed")
+                return await asyncio.shield(primary)
+            hedge_span.set(duplicate=duplicate)
+            secondary = tracker.track(duplicate, timeout=timeout - deadline)
+            try:
+                return await race_generations(
+                    {primary: generation_id, secondary: duplicate}
+                )
+            except asyncio.CancelledError:
+                tracker.forget(duplicate)
+                raise
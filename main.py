@@ -1,168 +1,652 @@
+import argparse
 import asyncio
+import contextlib
+import functools
 import os
+import shutil
 import time
 from datetime import timedelta
-from typing import List
+from typing import Any, Awaitable, Callable, Dict, List, Optional
 
 import load_env  # noqa: F401
+from asset_cache import CACHE_MODES, asset_cache
+from captions import Cue, caption_window, load_cues
 from cloudflare import upload_to_cloudflare
-from combine_clips import combine_clips
-from generate_audio import generate_audio
+from combine_clips import (
+    CLIP_WORKERS,
+    concat_clips,
+    fetch_clip,
+    prepare_clip,
+    prepare_clip_bounded,
+    segment_cache,
+)
+from events import emit
+from generate_audio import (
+    AUDIO_FORMAT,
+    TTS_CONTEXTS,
+    estimate_duration,
+    generate_transcript,
+    synthesize_audio,
+)
+from http_client import close as close_http
+from http_client import provider_limit
 from ideogram import generate_ideo_image
-from luma import generate_luma_video, poll_generation
+from luma import (
+    HedgePolicy,
+    cached_generation,
+    current_hedge_policy,
+    generate_luma_video,
+    poll_generation,
+)
+from manifest import RunManifest, current_manifest, item_progress, record_item
 from meme import create_meme_backdrop
-from mux_audio_and_video import mux_audio_and_video
+from mux_audio_and_video import AUDIO_FILES, mux_audio_and_video
 from openai_client import (
-    SOURCE_MARKDOWN,
+    ImageUrl,
+    Storyboard,
     StoryboardItem,
-    find_meme,
+    find_memes,
     generate_storyboard,
 )
-from twitter_capture import capture_tweets
-from utils import clear_directory
+from pipeline import Checkpoint, Pipeline, StaleCheckpoint, require_files
+from planner import Slot, dump_slots, load_words, plan_slots
+from providers import registry
+from render import render_single_pass
+from render_profiles import (
+    FINAL_PROFILE,
+    RENDER_PROFILE,
+    RENDER_PROFILES,
+    RenderProfile,
+)
+from replay import replay_session
+from tracing import span, tracer
+from twitter_capture import capture_tweet, create_backdrop
+from workspace import RUNS_DIR, Workspace, current_workspace, workspace
 
 print("Importing modules and loading environment variables")
 start_time = time.time()
 
+SOURCE_PATH = "source.md"
+
+
+async def start_image(
+    item: StoryboardItem, meme_url: Optional[Callable[[], Awaitable[ImageUrl]]]
+) -> str:
+    if item.type == "stock_video":
+        print("Generating ideogram image for stock video")
+        ideogram_response = await generate_ideo_image(item.stock_image_description)
+        return ideogram_response["data"][0]["url"]
+
+    print("Waiting for meme URL")
+    with span("meme.wait"):
+        meme = await meme_url()
+    print("Found meme URL", meme)
+
+    print("Creating meme backdrop")
+    meme_backdrop = await create_meme_backdrop(meme.url)
+    print("Uploading meme to Cloudflare")
+    return await upload_to_cloudflare(meme_backdrop)
+
 
-async def process_item(item: StoryboardItem):
-    item_start_time = time.time()
+async def process_item(
+    item: StoryboardItem,
+    index: int,
+    meme_url: Optional[Callable[[], Awaitable[ImageUrl]]] = None,
+) -> str:
+    # Returns the generated video URL. Every step is recorded in the run
+    # manifest, a resumed run picks up from the last one that finished.
     print(f"Processing item of type: {item.type}")
     if item.type == "twitter_screenshot":
         raise ValueError("Twitter screenshots dont make videos")
-    elif item.type == "stock_video":
-        print("Generating ideogram image for stock video")
-        ideogram_response = await generate_ideo_image(item.stock_image_description)
-        print("Generating Luma video for stock video")
-        luma_video_id = await generate_luma_video(
-            prompt=None, start_image_url=ideogram_response["data"][0]["url"]
-        )
 
-    elif item.type == "meme":
-        print("Finding meme URL")
-        meme_url = find_meme(item.stock_image_description)
-        print("Found meme URL", meme_url)
-
-        print("Creating meme backdrop")
-        meme_backdrop = create_meme_backdrop(meme_url.url)
-        print("Uploading meme to Cloudflare")
-        url = await upload_to_cloudflare(meme_backdrop)
-        print("Generating Luma video for meme")
-        luma_video_id = await generate_luma_video(prompt=None, start_image_url=url)
-    print("Polling for video generation completion")
-    result = await poll_generation(luma_video_id)
-    item_end_time = time.time()
-    print(
-        f"Item processing completed in {timedelta(seconds=item_end_time - item_start_time)}"
-    )
-    return result
+    progress = item_progress(index)
+    if progress.get("video_url"):
+        return progress["video_url"]
+
+    # Generations in flight count against the account, across every job
+    luma_video_id = progress.get("generation_id")
+    if luma_video_id:
+        print(f"Reattaching to Luma generation {luma_video_id}")
+        async with provider_limit("luma"):
+            result = await poll_generation(luma_video_id, reattached=True)
+    else:
+        start_image_url = progress.get("start_image_url")
+        if not start_image_url:
+            start_image_url = await start_image(item, meme_url)
+            record_item(index, start_image_url=start_image_url)
+        async with provider_limit("luma"):
+            # A cached generation is polled like a reattached one, it may
+            # already be done and must not skew the learned durations
+            luma_video_id = cached_generation(
+                prompt=None, start_image_url=start_image_url
+            )
+            cached = luma_video_id is not None
+            if not cached:
+                print(f"Generating Luma video for {item.type}")
+                luma_video_id = await generate_luma_video(
+                    prompt=None, start_image_url=start_image_url
+                )
+            record_item(index, generation_id=luma_video_id)
+            emit("item", index=index, state="generating", generation_id=luma_video_id)
+            print("Polling for video generation completion")
+            # A slow generation may be raced against a fresh duplicate
+            duplicate = functools.partial(
+                generate_luma_video,
+                prompt=None,
+                start_image_url=start_image_url,
+                use_cache=False,
+            )
+            result = await poll_generation(
+                luma_video_id, reattached=cached, hedge=duplicate
+            )
+    print(f"Item processing completed for {luma_video_id}")
+    record_item(index, video_url=result.assets.video)
+    emit("item", index=index, state="generated", video_url=result.assets.video)
+    return result.assets.video
+
 
+async def capture_tweet_backdrop(tweet_url: str) -> Optional[str]:
+    filename = await capture_tweet(tweet_url)
+    if not filename:
+        return None
+    # ffmpeg reads the backdrop from disk when the clip is prepared
+    output_filename = f"{os.path.splitext(filename)[0]}_backdrop.png"
+    with open(output_filename, "wb") as f:
+        f.write(await create_backdrop(filename))
+    return output_filename
 
-async def fetch_all_resources(processed_items: List[StoryboardItem]):
-    fetch_start_time = time.time()
-    print("Fetching all resources")
-    tweet_urls = [
-        item.twitter_url
-        for item in processed_items
-        if item.type == "twitter_screenshot"
+
+def clip_step(
+    slot: Slot,
+    single_pass: bool,
+    profile: RenderProfile,
+    cues: Optional[List[Cue]],
+):
+    # The single pass render encodes straight from the fetched sources
+    if single_pass:
+        return "fetched", fetch_clip, None
+    captions = caption_window(cues, slot.start, slot.duration) if cues else None
+    step = functools.partial(prepare_clip, profile=profile, captions=captions)
+    return f"prepared:{profile.name}", step, captions
+
+
+async def produce_clip(
+    slot: Slot,
+    work_dir: str,
+    limiter: asyncio.Semaphore,
+    single_pass: bool = False,
+    meme_url: Optional[Callable[[], Awaitable[ImageUrl]]] = None,
+    profile: RenderProfile = FINAL_PROFILE,
+    cues: Optional[List[Cue]] = None,
+    sources: Optional[Dict[int, Dict[str, Any]]] = None,
+):
+    # Each clip is downloaded and prepared as soon as its own resource is
+    # ready. The source of every clip that made it is kept in sources.
+    item, index = slot.item, slot.index
+    sources = {} if sources is None else sources
+    with span("item", index=index, type=item.type):
+        kind, step, captions = clip_step(slot, single_pass, profile, cues)
+
+        progress = item_progress(index)
+        if (
+            progress.get("clip_kind") == kind
+            and progress["clip"]["duration"] == slot.duration
+            and progress.get("captions") == captions
+            and os.path.exists(progress["clip_path"])
+        ):
+            print(f"Reusing clip {progress['clip_path']}")
+            emit("item", index=index, state="reused")
+            sources[index] = progress["clip"]
+            if not single_pass:
+                return progress["clip_path"]
+            return {**progress["clip"], "url": progress["clip_path"]}
+
+        emit("item", index=index, type=item.type, state="started")
+        clip = None
+        try:
+            if item.type == "twitter_screenshot":
+                if item.twitter_url:
+                    backdrop = await capture_tweet_backdrop(item.twitter_url)
+                    if backdrop:
+                        clip = {
+                            "type": "image",
+                            "url": backdrop,
+                            "duration": slot.duration,
+                        }
+            elif item.type in ["stock_video", "meme"]:
+                video_url = await process_item(item, index, meme_url)
+                print(f"Adding video: {video_url}")
+                clip = {"type": "video", "url": video_url, "duration": slot.duration}
+        except Exception as e:
+            # A failed generation or meme lookup only loses this item, its
+            # slot is filled by hold_clip
+            error = f"{type(e).__name__}: {e}"
+            print(f"Item {index} ({item.type}) failed: {error}")
+            emit("item", index=index, state="failed", error=error)
+            return None
+        if clip is None:
+            emit("item", index=index, state="skipped")
+            return None
+
+        path = await prepare_clip_bounded(clip, index, work_dir, limiter, step=step)
+        if path is not None:
+            sources[index] = clip
+            record_item(
+                index, clip=clip, clip_path=path, clip_kind=kind, captions=captions
+            )
+        emit("item", index=index, state="failed" if path is None else "completed")
+        if path is None or not single_pass:
+            return path
+        return {**clip, "url": path}
+
+
+async def hold_clip(
+    slot: Slot,
+    slots: List[Slot],
+    sources: Dict[int, Dict[str, Any]],
+    work_dir: str,
+    limiter: asyncio.Semaphore,
+    single_pass: bool,
+    profile: RenderProfile,
+    cues: Optional[List[Cue]],
+):
+    # Fills a slot whose own clip failed with the nearest clip before it, or
+    # after it, for the slot's duration. Dropping the slot would leave the
+    # video shorter than the narration, and -shortest would cut its end.
+    # The filler is not recorded, a resumed run tries the item again.
+    position = slots.index(slot)
+    neighbours = [s.index for s in reversed(slots[:position])] + [
+        s.index for s in slots[position + 1 :]
     ]
-    image_items = [
-        item for item in processed_items if item.type in ["stock_video", "meme"]
+    _, step, _ = clip_step(slot, single_pass, profile, cues)
+    for neighbour in (index for index in neighbours if index in sources):
+        clip = {**sources[neighbour], "duration": slot.duration}
+        print(f"Holding clip {neighbour} over the failed slot {slot.index}")
+        path = await prepare_clip_bounded(clip, slot.index, work_dir, limiter, step)
+        if path is None:
+            continue
+        emit("item", index=slot.index, state="held", source=neighbour)
+        return path if not single_pass else {**clip, "url": path}
+    raise RuntimeError(f"No clip could fill the slot of item {slot.index}")
+
+
+async def produce_clips(
+    slots: List[Slot],
+    work_dir: str,
+    single_pass: bool = False,
+    profile: RenderProfile = FINAL_PROFILE,
+    captions_path: Optional[str] = None,
+):
+    print(f"Producing {len(slots)} clips")
+    limiter = asyncio.Semaphore(CLIP_WORKERS)
+    # Each prepared clip gets the captions spoken over it burned in
+    cues = None
+    if captions_path and profile.burn_captions and not single_pass:
+        cues = load_cues(captions_path)
+    # Every meme is resolved by one batched call while the other clips start,
+    # leaving out memes a resumed run already has a start image for
+    meme_indices = [
+        slot.index
+        for slot in slots
+        if slot.item.type == "meme"
+        and not item_progress(slot.index).get("start_image_url")
     ]
+    memes = asyncio.ensure_future(
+        find_memes(
+            [
+                slot.item.stock_image_description
+                for slot in slots
+                if slot.index in meme_indices
+            ]
+        )
+    )
 
-    print(f"Found {len(tweet_urls)} tweet URLs and {len(image_items)} image items")
+    def meme_url(index: int) -> Callable[[], Awaitable[ImageUrl]]:
+        async def wait() -> ImageUrl:
+            return (await memes)[meme_indices.index(index)]
 
-    tweet_tasks = [capture_tweets(tweet_urls)] if tweet_urls else []
-    image_tasks = [process_item(item) for item in image_items]
-    print("Gathering all tasks")
-    results = await asyncio.gather(*tweet_tasks, *image_tasks)
+        return wait
 
-    tweet_files = results[0] if tweet_urls else []
-    video_results = results[1:] if image_items else []
+    sources: Dict[int, Dict[str, Any]] = {}
+    try:
+        clips = await asyncio.gather(
+            *(
+                produce_clip(
+                    slot,
+                    work_dir,
+                    limiter,
+                    single_pass,
+                    meme_url(slot.index) if slot.item.type == "meme" else None,
+                    profile,
+                    cues,
+                    sources,
+                )
+                for slot in slots
+            )
+        )
+    finally:
+        memes.cancel()
+    # The slots add up to the narration exactly, every one of them needs a clip
+    return [
+        clip
+        or await hold_clip(
+            slot, slots, sources, work_dir, limiter, single_pass, profile, cues
+        )
+        for slot, clip in zip(slots, clips)
+    ]
 
-    print(
-        f"Fetched {len(tweet_files)} tweet files and {len(video_results)} video results"
-    )
-    fetch_end_time = time.time()
-    print(
-        f"Resource fetching completed in {timedelta(seconds=fetch_end_time - fetch_start_time)}"
-    )
-    return tweet_files, video_results
 
+def build_pipeline(
+    source_markdown: str,
+    work_dir: str,
+    single_pass: bool = False,
+    audio_format: str = AUDIO_FORMAT,
+    tts_contexts: int = TTS_CONTEXTS,
+    job_workspace: Optional[Workspace] = None,
+    manifest: Optional[RunManifest] = None,
+    render_profile: str = RENDER_PROFILE,
+) -> Pipeline:
+    # Providers write into the current workspace, see run_job
+    pipeline = Pipeline(manifest)
+    ws = job_workspace or workspace()
+    profile = RENDER_PROFILES[render_profile]
 
-async def main():
-    main_start_time = time.time()
-    print("Starting main function")
-    print("Generating storyboard")
-    duration_seconds = await generate_audio(SOURCE_MARKDOWN)
-    storyboard = generate_storyboard(SOURCE_MARKDOWN, duration_seconds)
-
-    print("Generated storyboard")
-    tweet_files, video_results = await fetch_all_resources(storyboard.items)
-
-    combined_resources = []
-
-    tweet_index = 0
-    image_index = 0
-
-    print("Processing storyboard items")
-    for item in storyboard.items:
-        if item.type == "twitter_screenshot" and item.twitter_url:
-            tweet_id = item.twitter_url.split("/")[-1]
-
-            if not any(tweet_id in tweet_file for tweet_file in tweet_files):
-                continue
-            url = tweet_files[tweet_index]
-            print(f"Adding tweet screenshot: {url}")
-            combined_resources.append(
-                {
-                    "type": "image",
-                    "url": url,
-                    "duration": 2,
-                }
+    async def storyboard_stage(transcript):
+        # Plan from the estimated narration length so the storyboard does not
+        # wait for speech synthesis to finish.
+        duration_seconds = estimate_duration(transcript)
+        print(f"Estimated {duration_seconds:.1f} seconds of narration")
+        storyboard = await generate_storyboard(source_markdown, int(duration_seconds))
+        if manifest:
+            # Item progress is only meaningful for the storyboard it came from
+            manifest.reset_items()
+        return storyboard
+
+    async def plan_stage(audio, storyboard):
+        # Cuts between the words of the real narration, only planned slots
+        # are sent out for generation
+        if manifest:
+            # Prepared clips were cut for the old plan, generated videos only
+            # depend on the storyboard and are kept
+            manifest.reset_items("clip", "clip_path", "clip_kind", "captions")
+        return plan_slots(storyboard.items, audio, load_words(ws.words))
+
+    async def clips_stage(plan):
+        return await produce_clips(plan, work_dir, single_pass, profile, ws.captions)
+
+    async def render_stage(audio, clips):
+        audio_path = ws.audio(audio_format)
+        if single_pass:
+            await render_single_pass(
+                clips,
+                audio_path=audio_path,
+                captions_path=ws.captions,
+                output_file=ws.final_output,
+                profile=profile,
             )
-            tweet_index += 1
-        elif item.type in ["stock_video", "meme"]:
-            print(f"Adding video: {video_results[image_index].assets.video}")
-            combined_resources.append(
-                {
-                    "type": "video",
-                    "url": video_results[image_index].assets.video,
-                    "duration": 2,
-                }
+        else:
+            print("Combining clips")
+            await concat_clips(clips, output_file=ws.output)
+            print("Finished combining clips")
+            await mux_audio_and_video(
+                audio_path, ws.output, ws.captions, ws.final_output, profile
             )
-            image_index += 1
+        print("Clearing directories")
+        ws.clear_intermediates()
+        return {"profile": profile.name, "output": ws.final_output}
 
-    memes_dir = "memes"
-    tweets_dir = "tweets"
+    def dump_audio(duration):
+        return {
+            "duration": duration,
+            "audio_path": ws.audio(audio_format),
+            "captions_path": ws.captions,
+            "words_path": ws.words,
+        }
 
-    print("Clearing directories")
-    if os.path.exists(memes_dir):
-        clear_directory(memes_dir)
-        print(f"Cleared contents of {memes_dir} directory")
-    else:
-        print(f"{memes_dir} directory does not exist")
+    def load_slots(saved):
+        return [
+            Slot(
+                slot["index"],
+                StoryboardItem.model_validate(slot["item"]),
+                slot["start"],
+                slot["duration"],
+            )
+            for slot in saved
+        ]
 
-    if os.path.exists(tweets_dir):
-        clear_directory(tweets_dir)
-        print(f"Cleared contents of {tweets_dir} directory")
-    else:
-        print(f"{tweets_dir} directory does not exist")
+    def load_audio(saved):
+        if saved["audio_path"] != ws.audio(audio_format):
+            raise StaleCheckpoint(f"No {audio_format} narration was saved")
+        require_files(saved["audio_path"], saved["captions_path"])
+        return saved["duration"]
+
+    # Single pass renders from fetched sources, the others from clips
+    # prepared for the render profile
+    clip_kind = "fetched" if single_pass else f"prepared:{profile.name}"
+
+    def dump_clips(clips):
+        return {"kind": clip_kind, "clips": clips}
+
+    def load_clips(saved):
+        if saved["kind"] != clip_kind:
+            raise StaleCheckpoint(f"The clips were not {clip_kind}")
+        clips = saved["clips"]
+        require_files(*(clip["url"] if single_pass else clip for clip in clips))
+        return clips
+
+    def load_render(saved):
+        # An approved draft is rendered again with the final profile
+        if saved["profile"] != profile.name:
+            raise StaleCheckpoint(f"The last render was a {saved['profile']}")
+        require_files(saved["output"])
+        return saved
+
+    pipeline.add(
+        "transcript",
+        lambda: generate_transcript(source_markdown),
+        checkpoint=Checkpoint(),
+    )
+    pipeline.add(
+        "audio",
+        lambda transcript: synthesize_audio(transcript, audio_format, tts_contexts),
+        deps=["transcript"],
+        checkpoint=Checkpoint(dump_audio, load_audio),
+    )
+    pipeline.add(
+        "storyboard",
+        storyboard_stage,
+        deps=["transcript"],
+        checkpoint=Checkpoint(
+            lambda storyboard: storyboard.model_dump(), Storyboard.model_validate
+        ),
+    )
+    pipeline.add(
+        "plan",
+        plan_stage,
+        deps=["audio", "storyboard"],
+        checkpoint=Checkpoint(dump_slots, load_slots),
+    )
+    pipeline.add(
+        "clips",
+        clips_stage,
+        deps=["plan"],
+        checkpoint=Checkpoint(dump_clips, load_clips),
+    )
+    pipeline.add(
+        "render",
+        render_stage,
+        deps=["audio", "clips"],
+        checkpoint=Checkpoint(load=load_render),
+    )
+    return pipeline
+
+
+async def run_job(
+    source_markdown: str,
+    job_workspace: Workspace,
+    single_pass: bool = False,
+    audio_format: str = AUDIO_FORMAT,
+    tts_contexts: int = TTS_CONTEXTS,
+    resume: bool = False,
+    render_profile: str = RENDER_PROFILE,
+) -> Pipeline:
+    # Sets the workspace, manifest and hedging budget for this task only, so
+    # concurrent jobs each see their own
+    current_workspace.set(job_workspace.create())
+    current_hedge_policy.set(HedgePolicy())
+    manifest = RunManifest.open(job_workspace.manifest, source_markdown, resume)
+    current_manifest.set(manifest)
+    os.makedirs(job_workspace.clips, exist_ok=True)
+    pipeline = build_pipeline(
+        source_markdown,
+        job_workspace.clips,
+        single_pass,
+        audio_format,
+        tts_contexts,
+        job_workspace,
+        manifest,
+        render_profile,
+    )
+    with span(
+        "run",
+        single_pass=single_pass,
+        audio_format=audio_format,
+        profile=render_profile,
+    ):
+        await pipeline.run()
+    shutil.rmtree(job_workspace.clips, ignore_errors=True)
+    return pipeline
 
-    print("Combining clips")
-    combine_clips(combined_resources, output_file="output.mp4")
-    print("Finished combining clips")
-    await mux_audio_and_video()
+
+async def main(
+    single_pass: bool = False,
+    audio_format: str = AUDIO_FORMAT,
+    tts_contexts: int = TTS_CONTEXTS,
+    resume: Optional[str] = None,
+    render_profile: str = RENDER_PROFILE,
+):
+    main_start_time = time.time()
+    print("Starting main function")
+    with open(SOURCE_PATH) as f:
+        source_markdown = f.read()
+    run_id = resume or time.strftime("%Y%m%d-%H%M%S")
+    run_workspace = Workspace(os.path.join(RUNS_DIR, run_id))
+    print(f"Run {run_id}, resume it with --resume {run_id}")
+    try:
+        pipeline = await run_job(
+            source_markdown,
+            run_workspace,
+            single_pass,
+            audio_format,
+            tts_contexts,
+            resume=resume is not None,
+            render_profile=render_profile,
+        )
+        shutil.copyfile(run_workspace.final_output, "final_output.mp4")
+        if render_profile != "final":
+            print(f"Render the final cut with --resume {run_id} --profile final")
+    finally:
+        await close_http()
+        tracer.finish()
     main_end_time = time.time()
     print(
         f"Main function completed in {timedelta(seconds=main_end_time - main_start_time)}"
     )
+    return pipeline
+
+
+def check_config(source_path: str = SOURCE_PATH) -> bool:
+    # Keys, packages and tools every provider needs, without any network call
+    problems = registry.check()
+    problems["source"] = (
+        [] if os.path.exists(source_path) else [f"{source_path} does not exist"]
+    )
+    for name, found in problems.items():
+        print(f"{name:>12}: {'; '.join(found) if found else 'ok'}")
+    return not any(problems.values())
 
 
 if __name__ == "__main__":
     script_start_time = time.time()
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--single-pass",
+        action="store_true",
+        help="Concat, mux and burn in captions with a single encode",
+    )
+    parser.add_argument(
+        "--cache",
+        choices=CACHE_MODES,
+        default=asset_cache.mode,
+        help="Asset and segment cache mode: off bypasses them, refresh regenerates",
+    )
+    parser.add_argument(
+        "--audio-format",
+        choices=list(AUDIO_FILES),
+        default=AUDIO_FORMAT,
+        help="Encode narration while it streams (s16, m4a) or keep raw floats (pcm)",
+    )
+    parser.add_argument(
+        "--tts-contexts",
+        type=int,
+        default=TTS_CONTEXTS,
+        help="Synthesize the transcript on this many Cartesia contexts in parallel",
+    )
+    replay_group = parser.add_mutually_exclusive_group()
+    replay_group.add_argument(
+        "--record", metavar="DIR", help="Record every provider call into a fixture"
+    )
+    replay_group.add_argument(
+        "--replay",
+        metavar="DIR",
+        help="Answer provider calls from a recorded fixture instead of the network",
+    )
+    parser.add_argument(
+        "--trace",
+        metavar="PATH",
+        default=tracer.path,
+        help="Write a Chrome trace of the run and update the latency summary",
+    )
+    parser.add_argument(
+        "--profile",
+        choices=list(RENDER_PROFILES),
+        default=RENDER_PROFILE,
+        help="draft renders small and fast to check timing and captions",
+    )
+    parser.add_argument(
+        "--resume",
+        metavar="RUN",
+        help=f"Continue a failed run from its manifest in {RUNS_DIR}/RUN",
+    )
+    parser.add_argument(
+        "--check",
+        action="store_true",
+        help="Validate provider configuration and exit without rendering",
+    )
+    args = parser.parse_args()
+    if args.check:
+        raise SystemExit(0 if check_config() else 1)
+    asset_cache.mode = args.cache
+    segment_cache.mode = args.cache
+    if args.trace:
+        tracer.enable(args.trace)
     print("Starting script")
-    asyncio.run(main())
+    if args.record or args.replay:
+        session = replay_session(
+            "record" if args.record else "replay", args.record or args.replay
+        )
+    else:
+        session = contextlib.nullcontext()
+    with session:
+        asyncio.run(
+            main(
+                single_pass=args.single_pass,
+                audio_format=args.audio_format,
+                tts_contexts=args.tts_contexts,
+                resume=args.resume,
+                render_profile=args.profile,
+            )
+        )
     script_end_time = time.time()
     print(
         f"Script completed in {timedelta(seconds=script_end_time - script_start_time)}"
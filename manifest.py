@@ -0,0 +1,112 @@
+import contextvars
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from typing import Any, Dict, Iterable, Optional
+
+MANIFEST_VERSION = 1
+
+
+def source_hash(source_markdown: str) -> str:
+    return hashlib.sha256(source_markdown.encode()).hexdigest()
+
+
+class RunManifest:
+    # What a run has produced so far: the result of every finished stage and
+    # per storyboard item progress (start image, Luma generation, video and
+    # clip). Saved after every change so a failed run can be resumed.
+
+    def __init__(self, path: str, data: Optional[Dict[str, Any]] = None):
+        self.path = path
+        self.data = data or {
+            "version": MANIFEST_VERSION,
+            "created_at": time.time(),
+            "source_hash": None,
+            "stages": {},
+            "items": {},
+        }
+        self._lock = threading.Lock()
+
+    @classmethod
+    def open(cls, path: str, source_markdown: str, resume: bool = False):
+        digest = source_hash(source_markdown)
+        if resume and os.path.exists(path):
+            with open(path) as f:
+                data = json.load(f)
+            if data.get("version") != MANIFEST_VERSION:
+                raise ValueError(f"Unsupported run manifest version in {path}")
+            if data["source_hash"] != digest:
+                raise ValueError(f"{path} belongs to a different source document")
+            manifest = cls(path, data)
+            print(f"Resuming run with stages {list(data['stages'])} completed")
+        else:
+            manifest = cls(path)
+            manifest.data["source_hash"] = digest
+        manifest.save()
+        return manifest
+
+    def completed(self, stage: str) -> bool:
+        return stage in self.data["stages"]
+
+    def stage_result(self, stage: str) -> Any:
+        return self.data["stages"][stage]["result"]
+
+    def complete_stage(self, stage: str, result: Any):
+        with self._lock:
+            self.data["stages"][stage] = {"result": result, "completed_at": time.time()}
+            self.save()
+
+    def discard_stages(self, stages: Iterable[str]):
+        with self._lock:
+            for stage in stages:
+                self.data["stages"].pop(stage, None)
+            self.save()
+
+    def item(self, index: int) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self.data["items"].get(str(index), {}))
+
+    def update_item(self, index: int, **fields):
+        with self._lock:
+            self.data["items"].setdefault(str(index), {}).update(fields)
+            self.save()
+
+    def reset_items(self, *fields: str):
+        # Item progress belongs to one storyboard, only the given fields are
+        # dropped when some are named
+        with self._lock:
+            if fields:
+                for item in self.data["items"].values():
+                    for field in fields:
+                        item.pop(field, None)
+            else:
+                self.data["items"] = {}
+            self.save()
+
+    def save(self):
+        directory = os.path.dirname(self.path) or "."
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(self.data, f, indent=2)
+        os.replace(temp_path, self.path)
+
+
+# Set per job next to the workspace, None when running without a manifest
+current_manifest: contextvars.ContextVar[Optional[RunManifest]] = (
+    contextvars.ContextVar("current_manifest", default=None)
+)
+
+
+def item_progress(index: int) -> Dict[str, Any]:
+    manifest = current_manifest.get()
+    return manifest.item(index) if manifest else {}
+
+
+def record_item(index: int, **fields):
+    manifest = current_manifest.get()
+    if manifest:
+        manifest.update_item(index, **fields)
@@ -0,0 +1,145 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+from airtable import MEME_CATALOG_PATH, meme_catalog
+from providers import lazy_import
+
+np = lazy_import("numpy")
+
+MEME_INDEX_PATH = os.environ.get(
+    "MEME_INDEX_PATH", os.path.splitext(MEME_CATALOG_PATH)[0] + "_index.npz"
+)
+HASH_DIMENSIONS = 2**12
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: str) -> List[str]:
+    words = TOKEN_PATTERN.findall(text.lower())
+    # Bigrams keep a little word order, e.g. "distracted boyfriend"
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+def hash_tokens(tokens: List[str], dimensions: int = HASH_DIMENSIONS) -> "np.ndarray":
+    return np.array(
+        [zlib.crc32(token.encode()) % dimensions for token in tokens], dtype=np.int64
+    )
+
+
+def fingerprint(memes: Dict[str, Dict[str, str]]) -> str:
+    # Only what is indexed, image URLs change on every full catalog sync
+    documents = {name: meme_document(name, meme) for name, meme in memes.items()}
+    return hashlib.sha256(json.dumps(documents, sort_keys=True).encode()).hexdigest()
+
+
+def meme_document(name: str, meme: Dict[str, str]) -> str:
+    # The name is repeated so it outweighs incidental words in the notes
+    return f"{name} {name} {meme.get('notes', '')}"
+
+
+class MemeIndex:
+    # Hashed TF-IDF vectors for every meme, searched with a single matrix
+    # product against the query vector.
+
+    def __init__(
+        self,
+        names: List[str],
+        matrix: "np.ndarray",
+        idf: "np.ndarray",
+        fingerprint: str,
+    ):
+        self.names = names
+        self.matrix = matrix
+        self.idf = idf
+        self.fingerprint = fingerprint
+
+    @classmethod
+    def build(cls, memes: Dict[str, Dict[str, str]]) -> "MemeIndex":
+        names = list(memes)
+        counts = np.zeros((len(names), HASH_DIMENSIONS), dtype=np.float32)
+        for row, name in enumerate(names):
+            columns = hash_tokens(tokenize(meme_document(name, memes[name])))
+            np.add.at(counts[row], columns, 1)
+
+        document_frequency = np.count_nonzero(counts, axis=0)
+        idf = np.log((1 + len(names)) / (1 + document_frequency)) + 1
+        matrix = np.log1p(counts) * idf
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        matrix /= np.where(norms == 0, 1, norms)
+        return cls(
+            names, matrix.astype(np.float32), idf.astype(np.float32), fingerprint(memes)
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "MemeIndex":
+        with np.load(path) as data:
+            return cls(
+                names=data["names"].tolist(),
+                matrix=data["matrix"],
+                idf=data["idf"],
+                fingerprint=str(data["fingerprint"]),
+            )
+
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # np.savez appends .npz to paths without it, so write through a handle
+        with open(path, "wb") as f:
+            np.savez(
+                f,
+                names=np.array(self.names),
+                matrix=self.matrix,
+                idf=self.idf,
+                fingerprint=np.array(self.fingerprint),
+            )
+
+    def vectorize(self, text: str) -> "np.ndarray":
+        vector = np.zeros(HASH_DIMENSIONS, dtype=np.float32)
+        np.add.at(vector, hash_tokens(tokenize(text)), 1)
+        vector = np.log1p(vector) * self.idf
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def search(self, query: str, k: int = 5) -> List[Tuple[str, float]]:
+        if not self.names:
+            return []
+        scores = self.matrix @ self.vectorize(query)
+        k = min(k, len(self.names))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self.names[i], float(scores[i])) for i in top]
+
+
+_index: Optional[MemeIndex] = None
+_index_lock = threading.Lock()
+
+
+def load_meme_index(
+    memes: Dict[str, Dict[str, str]], path: str = MEME_INDEX_PATH
+) -> MemeIndex:
+    # Reuses the persisted index as long as the catalog hasn't changed
+    current = fingerprint(memes)
+    try:
+        index = MemeIndex.load(path)
+        if index.fingerprint == current:
+            return index
+    except (FileNotFoundError, ValueError, KeyError, OSError):
+        pass
+
+    print(f"Building meme index for {len(memes)} memes")
+    index = MemeIndex.build(memes)
+    index.save(path)
+    return index
+
+
+def meme_index() -> MemeIndex:
+    global _index
+    with _index_lock:
+        memes = meme_catalog.memes()
+        if _index is None or _index.fingerprint != fingerprint(memes):
+            _index = load_meme_index(memes)
+        return _index
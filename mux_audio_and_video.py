@@ -1,38 +1,76 @@
-import asyncio
+import os
+import subprocess
+
+from combine_clips import run_command
+from render_profiles import FINAL_PROFILE, RenderProfile
 
 sample_rate = 44100
 
+# Where generate_audio writes the narration for each audio format
+AUDIO_FILES = {"pcm": "audio.pcm", "s16": "audio.s16", "m4a": "audio.m4a"}
 
-async def mux_audio_and_video():
-    print("Encoding video file...")
 
+def audio_input_args(audio_path: str):
+    # Raw sample files carry no header, so their layout has to be spelled out
+    raw_formats = {".pcm": "f32le", ".s16": "s16le"}
+    raw_format = raw_formats.get(os.path.splitext(audio_path)[1])
+    if raw_format is None:
+        return ["-i", audio_path]
     # fmt: off
-    ffmpeg_command = [
-        "ffmpeg",
-        "-i", "output.mp4",
-        "-f", "f32le",
+    return [
+        "-f", raw_format,
         "-ar", f"{sample_rate}",
         "-ac", "1",
-        "-i", "audio.pcm",
-        "-vf", "subtitles=captions.srt:force_style='FontSize=26,PrimaryColour=&HFFFFFF&'",
-        "-c:a", "aac",
-        "-b:a", "192k",
-        "-c:v", "libx264",
-        "-preset", "medium",
-        "-crf", "23",
-        "-shortest",
-        "final_output.mp4"
+        "-i", audio_path,
     ]
     # fmt: on
 
-    process = await asyncio.create_subprocess_exec(
-        *ffmpeg_command, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
-    )
 
-    stdout, stderr = await process.communicate()
+def audio_codec_args(audio_path: str, profile: RenderProfile = FINAL_PROFILE):
+    # Narration that was already encoded to AAC while streaming is copied
+    if audio_path.endswith(".m4a"):
+        return ["-c:a", "copy"]
+    return ["-c:a", "aac", "-b:a", profile.audio_bitrate]
+
+
+async def mux_audio_and_video(
+    audio_path: str = "audio.pcm",
+    video_path: str = "output.mp4",
+    captions_path: str = "captions.srt",
+    output_file: str = "final_output.mp4",
+    profile: RenderProfile = FINAL_PROFILE,
+):
+    print("Muxing video file...")
+
+    # The prepared clips are already in the profile's format, so the video is
+    # copied. Captions were burned into them, or go in as a subtitle track.
+    if profile.burn_captions:
+        video_args = ["-c:v", "copy"]
+    else:
+        # fmt: off
+        video_args = [
+            "-i", captions_path,
+            "-map", "0:v", "-map", "1:a", "-map", "2:s",
+            "-c:v", "copy", "-c:s", "mov_text",
+        ]
+        # fmt: on
+
+    # fmt: off
+    ffmpeg_command = [
+        "ffmpeg", "-y",
+        "-i", video_path,
+        *audio_input_args(audio_path),
+        *video_args,
+        *audio_codec_args(audio_path, profile),
+        "-shortest",
+        output_file
+    ]
+    # fmt: on
 
-    if process.returncode != 0:
-        print(f"Error running FFmpeg command: {stderr.decode()}")
+    try:
+        await run_command(ffmpeg_command)
+    except subprocess.CalledProcessError as e:
+        print(f"Error running FFmpeg command: {e.stderr.decode()}")
         raise RuntimeError("FFmpeg command failed")
 
     print("Done.")
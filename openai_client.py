@@ -1,35 +1,23 @@
+import asyncio
 import json
 import os
-from typing import List, Literal, Union
+from typing import Dict, List, Literal, Union
 
-from openai import OpenAI
-from pyairtable import Api
 from pydantic import BaseModel, Field
 
-api = Api(os.environ["AIRTABLE_API_KEY"])
-table = api.table("appi0R6F1ckhy8JpZ", "table1")
+from airtable import meme_catalog
+from http_client import provider_limit
+from meme_index import meme_index
+from planner import SLOT_SECONDS, storyboard_size
+from providers import registry
+from tracing import span
 
-client = OpenAI()
-# Reformat the data
-records = table.all()
+client = registry.lazy("openai")
 
-# Reformat the data
-reformatted_data = {}
-
-for record in records:
-    name = record["fields"].get("Name", "")
-    notes = record["fields"].get("Notes", "")
-    image_url = ""
-
-    # Get the first image URL if available
-    if "image" in record["fields"] and record["fields"]["image"]:
-        image_url = record["fields"]["image"][0].get("url", "")
-
-    reformatted_data[name] = {"notes": notes, "image_url": image_url}
-
-
-with open("source.md", "r") as file:
-    SOURCE_MARKDOWN = file.read()
+# Number of local index candidates sent to the LLM for reranking
+MEME_SHORTLIST = int(os.environ.get("MEME_SHORTLIST", 8))
+# With reranking off the best local match is used without an LLM call
+MEME_RERANK = os.environ.get("MEME_RERANK", "1") == "1"
 
 STORYBOARD_PROMPT = """
 I will provide you with a source string that represents a news article.
@@ -40,8 +28,10 @@ The storyboard should be an array of objects, where each object represents a sta
 
 Don't put two of the same type in a row, and use at least one of each type.
 
-I will also supply a total duration for the video, generate enough frames to fill the duration given a duration of 2 seconds for each frame. Print out the total number of frames you will generate.
-"""
+I will also supply a total duration for the video and the number of frames to generate, each frame is shown for about {slot_seconds:g} seconds. Print out the total number of frames you will generate.
+
+Never use the same tweet twice.
+""".format(slot_seconds=SLOT_SECONDS)
 
 TYPE_DESCRIPTION = {
     "meme": "a meme image, that will be animated",
@@ -77,22 +67,24 @@ class Storyboard(BaseModel):
     )
 
 
-def generate_storyboard(source_markdown: str, total_duration: int) -> Storyboard:
-    # TODO: Here we need ensure that the number of storyboard items is the total duration / 2
-    # Often there will not be enough content to fill the duration.
-    # Also we should ensure that tweets don't get repeated.
-    response = client.beta.chat.completions.parse(
-        model="gpt-4o-2024-08-06",
-        messages=[
-            {"role": "system", "content": STORYBOARD_PROMPT},
-            {"role": "user", "content": source_markdown},
-            {
-                "role": "user",
-                "content": f"The total duration of the video is {total_duration} seconds, you must generate at least {total_duration // 2} storyboard items.",
-            },
-        ],
-        response_format=Storyboard,
-    )
+async def generate_storyboard(source_markdown: str, total_duration: int) -> Storyboard:
+    # A few more items than slots are asked for, planner.plan_slots picks the
+    # ones that get generated once the real narration length is known
+    frames = storyboard_size(total_duration)
+    async with provider_limit("openai"):
+        with span("openai.storyboard", duration=total_duration):
+            response = await client.beta.chat.completions.parse(
+                model="gpt-4o-2024-08-06",
+                messages=[
+                    {"role": "system", "content": STORYBOARD_PROMPT},
+                    {"role": "user", "content": source_markdown},
+                    {
+                        "role": "user",
+                        "content": f"The total duration of the video is {total_duration} seconds, you must generate at least {frames} storyboard items.",
+                    },
+                ],
+                response_format=Storyboard,
+            )
 
     return response.choices[0].message.parsed
 
@@ -101,18 +93,79 @@ class ImageUrl(BaseModel):
     url: str
 
 
-def find_meme(meme_description: str) -> str:
-    dict_memes = json.dumps(reformatted_data)
-    model_response = client.beta.chat.completions.parse(
-        model="gpt-4o-2024-08-06",
-        messages=[
-            {"role": "system", "content": "You are a helpful assistant"},
+class MemeMatch(BaseModel):
+    index: int = Field(..., description="The index of the meme description")
+    url: str = Field(..., description="The closest matching meme URL")
+
+
+class MemeMatches(BaseModel):
+    matches: List[MemeMatch]
+
+
+async def find_memes(meme_descriptions: List[str]) -> List[ImageUrl]:
+    # Resolves every description with a single LLM call, results come back in
+    # the order of the descriptions
+    if not meme_descriptions:
+        return []
+    # Both may sync the catalog from Airtable or rebuild the index, which
+    # blocks, so they run off the event loop like in RenderDaemon.warm
+    memes = await asyncio.to_thread(meme_catalog.memes)
+    index = await asyncio.to_thread(meme_index)
+    shortlists = [
+        [name for name, _ in index.search(description, k=MEME_SHORTLIST)]
+        for description in meme_descriptions
+    ]
+    if not all(shortlists):
+        raise ValueError("The meme catalog is empty")
+    # The best local match stands in for anything the model leaves out
+    names = [shortlist[0] for shortlist in shortlists]
+    if MEME_RERANK:
+        await rerank_memes(meme_descriptions, memes, shortlists, names)
+    # Only the chosen memes need image URLs that still work
+    urls = await asyncio.to_thread(meme_catalog.image_urls, names)
+    return [ImageUrl(url=url) for url in urls]
+
+
+async def rerank_memes(
+    meme_descriptions: List[str],
+    memes: Dict[str, Dict[str, str]],
+    shortlists: List[List[str]],
+    names: List[str],
+):
+    # Lets the model pick among each shortlist, updating names in place
+    dict_requests = json.dumps(
+        [
             {
-                "role": "user",
-                "content": f"Given the following memes {dict_memes}, give the closest matching meme URL to {meme_description}",
-            },
-        ],
-        response_format=ImageUrl,
+                "index": i,
+                "description": description,
+                "memes": {name: memes[name] for name in shortlist},
+            }
+            for i, (description, shortlist) in enumerate(
+                zip(meme_descriptions, shortlists)
+            )
+        ]
     )
-    meme_url = model_response.choices[0].message.parsed
-    return meme_url
+    async with provider_limit("openai"):
+        with span("openai.find_memes", memes=len(meme_descriptions)):
+            model_response = await client.beta.chat.completions.parse(
+                model="gpt-4o-2024-08-06",
+                messages=[
+                    {"role": "system", "content": "You are a helpful assistant"},
+                    {
+                        "role": "user",
+                        "content": f"For each of the following meme descriptions, give the URL of the closest matching meme among its candidate memes: {dict_requests}",
+                    },
+                ],
+                response_format=MemeMatches,
+            )
+    for match in model_response.choices[0].message.parsed.matches:
+        if 0 <= match.index < len(names):
+            candidates = {
+                memes[name]["image_url"]: name for name in shortlists[match.index]
+            }
+            if match.url in candidates:
+                names[match.index] = candidates[match.url]
+
+
+async def find_meme(meme_description: str) -> ImageUrl:
+    return (await find_memes([meme_description]))[0]
@@ -0,0 +1,155 @@
+import asyncio
+import os
+import time
+from datetime import timedelta
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterable,
+    NamedTuple,
+    Optional,
+    Set,
+    Tuple,
+)
+
+from events import emit
+from tracing import span
+
+
+class StaleCheckpoint(LookupError):
+    pass
+
+
+def identity(value):
+    return value
+
+
+def require_files(*paths: str):
+    for path in paths:
+        if not os.path.exists(path):
+            raise StaleCheckpoint(f"{path} no longer exists")
+
+
+class Checkpoint(NamedTuple):
+    # How a stage result is written to and restored from the run manifest.
+    # load raises StaleCheckpoint when the saved result can't be used, say a
+    # file it points at is gone, and the stage runs again.
+    dump: Callable[[Any], Any] = identity
+    load: Callable[[Any], Any] = identity
+
+
+class Stage(NamedTuple):
+    fn: Callable[..., Awaitable[Any]]
+    deps: Tuple[str, ...]
+    checkpoint: Optional[Checkpoint] = None
+
+
+class Pipeline:
+    # Runs stages as a dependency graph: every stage starts as soon as the
+    # stages it depends on have finished, and receives their results as
+    # keyword arguments. With a run manifest, checkpointed stages save their
+    # results and a resumed run restores them instead of running them again,
+    # as long as every stage they depend on was restored too.
+
+    def __init__(self, manifest=None):
+        self.stages: Dict[str, Stage] = {}
+        self.timings: Dict[str, float] = {}
+        self.manifest = manifest
+        self.restored: Set[str] = set()
+
+    def add(
+        self,
+        name: str,
+        fn: Callable[..., Awaitable[Any]],
+        deps: Iterable[str] = (),
+        checkpoint: Optional[Checkpoint] = None,
+    ):
+        if name in self.stages:
+            raise ValueError(f"Stage {name} is already defined")
+        self.stages[name] = Stage(fn, tuple(deps), checkpoint)
+
+    def order(self):
+        ordered = []
+        visiting = set()
+
+        def visit(name):
+            if name in ordered:
+                return
+            if name not in self.stages:
+                raise ValueError(f"Unknown stage {name}")
+            if name in visiting:
+                raise ValueError(f"Stage {name} depends on itself")
+            visiting.add(name)
+            for dep in self.stages[name].deps:
+                visit(dep)
+            visiting.discard(name)
+            ordered.append(name)
+
+        for name in self.stages:
+            visit(name)
+        return ordered
+
+    def dependents(self, name: str) -> Set[str]:
+        # Every stage that uses the result of this one, directly or not
+        found: Set[str] = set()
+        for other in self.order():
+            stage = self.stages[other]
+            if name in stage.deps or found.intersection(stage.deps):
+                found.add(other)
+        return found
+
+    async def run(self) -> Dict[str, Any]:
+        tasks: Dict[str, asyncio.Task] = {}
+        for name in self.order():
+            tasks[name] = asyncio.create_task(self._run_stage(name, tasks))
+
+        try:
+            await asyncio.gather(*tasks.values())
+        except BaseException:
+            for task in tasks.values():
+                task.cancel()
+            await asyncio.gather(*tasks.values(), return_exceptions=True)
+            raise
+
+        return {name: task.result() for name, task in tasks.items()}
+
+    async def _run_stage(self, name: str, tasks: Dict[str, asyncio.Task]):
+        stage = self.stages[name]
+        checkpointed = self.manifest is not None and stage.checkpoint is not None
+        inputs = {dep: await tasks[dep] for dep in stage.deps}
+        if checkpointed and self.manifest.completed(name):
+            # A result computed from inputs that have since changed is stale
+            rerun = [dep for dep in stage.deps if dep not in self.restored]
+            try:
+                if rerun:
+                    raise StaleCheckpoint(f"{', '.join(rerun)} ran again")
+                result = stage.checkpoint.load(self.manifest.stage_result(name))
+            except StaleCheckpoint as e:
+                print(f"Rerunning stage {name}: {e}")
+            else:
+                self.timings[name] = 0.0
+                self.restored.add(name)
+                print(f"Stage {name} restored from the run manifest")
+                emit("stage", stage=name, state="restored")
+                return result
+
+        if self.manifest is not None:
+            # A run that fails before they rerun must not restore them later
+            self.manifest.discard_stages(self.dependents(name))
+        print(f"Starting stage {name}")
+        emit("stage", stage=name, state="started")
+        start_time = time.time()
+        try:
+            with span(f"stage:{name}"):
+                result = await stage.fn(**inputs)
+        except Exception as e:
+            emit("stage", stage=name, state="failed", error=f"{type(e).__name__}: {e}")
+            raise
+        self.timings[name] = time.time() - start_time
+        if checkpointed:
+            self.manifest.complete_stage(name, stage.checkpoint.dump(result))
+        print(f"Stage {name} completed in {timedelta(seconds=self.timings[name])}")
+        emit("stage", stage=name, state="completed", seconds=self.timings[name])
+        return result
@@ -0,0 +1,146 @@
+import json
+import math
+import os
+import re
+from typing import Any, Dict, List, NamedTuple
+
+from render_profiles import FRAME_RATE
+
+# Target length of one clip, the storyboard is asked for this many per second
+# of narration plus STORYBOARD_MARGIN spares for the planner to drop
+SLOT_SECONDS = float(os.environ.get("SLOT_SECONDS", 2))
+MIN_SLOT_SECONDS = 1.0
+# How far a cut may move from its even spacing to land between two words
+SNAP_SECONDS = SLOT_SECONDS / 2
+STORYBOARD_MARGIN = 0.25
+
+
+class Word(NamedTuple):
+    text: str
+    start: float
+    end: float
+
+
+class Slot(NamedTuple):
+    # One clip of the final video: the storyboard item it shows, by its
+    # position in the storyboard, and the stretch of narration it covers
+    index: int
+    item: Any
+    start: float
+    duration: float
+
+
+def slot_count(duration: float) -> int:
+    return max(1, round(duration / SLOT_SECONDS))
+
+
+def storyboard_size(duration: float) -> int:
+    count = slot_count(duration)
+    return count + max(1, round(count * STORYBOARD_MARGIN))
+
+
+def save_words(path: str, words: List[Word]):
+    with open(path, "w") as f:
+        json.dump([word._asdict() for word in words], f)
+
+
+def load_words(path: str) -> List[Word]:
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return [Word(**word) for word in json.load(f)]
+
+
+def tweet_key(url: str) -> str:
+    # x.com and twitter.com links, tracking parameters and trailing slashes
+    # all name the same tweet
+    match = re.search(r"/status(?:es)?/(\d+)", url)
+    return match.group(1) if match else url.split("?")[0].rstrip("/").lower()
+
+
+def usable_items(items: List[Any]) -> List[int]:
+    # Positions of the items worth a clip: tweets need a url and are shown once
+    seen_tweets = set()
+    usable = []
+    for i, item in enumerate(items):
+        if item.type == "twitter_screenshot":
+            if not item.twitter_url:
+                continue
+            key = tweet_key(item.twitter_url)
+            if key in seen_tweets:
+                print(f"Dropping repeated tweet {item.twitter_url}")
+                continue
+            seen_tweets.add(key)
+        usable.append(i)
+    return usable
+
+
+def on_frame(seconds: float) -> float:
+    return round(seconds * FRAME_RATE) / FRAME_RATE
+
+
+def pauses(words: List[Word]) -> List[float]:
+    # The frame closest to the middle of each pause between two words, pauses
+    # shorter than a frame have none
+    cut_points = []
+    for word, following in zip(words, words[1:]):
+        first = math.ceil(word.end * FRAME_RATE) / FRAME_RATE
+        last = math.floor(following.start * FRAME_RATE) / FRAME_RATE
+        if first <= last:
+            middle = on_frame((word.end + following.start) / 2)
+            cut_points.append(min(max(middle, first), last))
+    return cut_points
+
+
+def plan_cuts(duration: float, count: int, words: List[Word]) -> List[float]:
+    # Evenly spaced cuts moved to the nearest pause between two words, every
+    # cut on a frame so the clip durations add up to the narration exactly
+    count = max(1, min(count, int(duration // MIN_SLOT_SECONDS)))
+    boundaries = pauses(words)
+    cuts = [0.0]
+    for k in range(1, count):
+        ideal = duration * k / count
+        earliest = cuts[-1] + MIN_SLOT_SECONDS
+        latest = duration - (count - k) * MIN_SLOT_SECONDS
+        options = [
+            boundary
+            for boundary in boundaries
+            if earliest <= boundary <= latest and abs(boundary - ideal) <= SNAP_SECONDS
+        ]
+        if options:
+            cuts.append(min(options, key=lambda b: abs(b - ideal)))
+        else:
+            cuts.append(on_frame(min(max(ideal, earliest), latest)))
+    cuts.append(duration)
+    return cuts
+
+
+def plan_slots(items: List[Any], duration: float, words: List[Word]) -> List[Slot]:
+    usable = usable_items(items)
+    if not usable:
+        raise ValueError("The storyboard has no usable items")
+    count = slot_count(duration)
+    if len(usable) < count:
+        print(f"Storyboard has {len(usable)} usable items for {count} slots")
+    cuts = plan_cuts(duration, min(count, len(usable)), words)
+    slots = [
+        Slot(index, items[index], start, end - start)
+        for index, start, end in zip(usable, cuts, cuts[1:])
+    ]
+    print(
+        f"Planned {len(slots)} slots for {duration:.2f}s of narration "
+        f"from {len(items)} storyboard items"
+    )
+    return slots
+
+
+def dump_slots(slots: List[Slot]) -> List[Dict[str, Any]]:
+    return [
+        {
+            "index": slot.index,
+            "item": slot.item.model_dump(),
+            "start": slot.start,
+            "duration": slot.duration,
+        }
+        for slot in slots
+    ]
@@ -0,0 +1,148 @@
+import importlib
+import importlib.util
+import os
+import shutil
+import threading
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+
+class LazyModule:
+    # A heavy dependency imported on first attribute access, so importing the
+    # pipeline only pays for the modules a run actually uses
+
+    def __init__(self, name: str):
+        self.__dict__["_name"] = name
+        self.__dict__["_module"] = None
+
+    def __getattr__(self, attribute: str):
+        module = self.__dict__["_module"]
+        if module is None:
+            module = importlib.import_module(self.__dict__["_name"])
+            self.__dict__["_module"] = module
+        return getattr(module, attribute)
+
+
+def lazy_import(name: str) -> LazyModule:
+    return LazyModule(name)
+
+
+class Provider(NamedTuple):
+    factory: Optional[Callable[[], Any]]
+    # Environment variables that must be set, "A|B" takes either
+    env: Tuple[str, ...]
+    packages: Tuple[str, ...]
+    tools: Tuple[str, ...]
+
+
+class LazyClient:
+    # Stands in for a module level client until its first attribute access
+    def __init__(self, registry: "Registry", name: str):
+        self._registry = registry
+        self._name = name
+
+    def __getattr__(self, attribute: str):
+        return getattr(self._registry.get(self._name), attribute)
+
+
+class Registry:
+    # Every external service the pipeline talks to: what it needs to be
+    # configured and, for shared clients, how to build one. Clients are built
+    # the first time they are used, never at import.
+
+    def __init__(self):
+        self.providers: Dict[str, Provider] = {}
+        self._instances: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def register(
+        self,
+        name: str,
+        factory: Optional[Callable[[], Any]] = None,
+        env: Tuple[str, ...] = (),
+        packages: Tuple[str, ...] = (),
+        tools: Tuple[str, ...] = (),
+    ):
+        self.providers[name] = Provider(factory, env, packages, tools)
+
+    def get(self, name: str):
+        if name not in self._instances:
+            with self._lock:
+                if name not in self._instances:
+                    self._instances[name] = self.providers[name].factory()
+        return self._instances[name]
+
+    def lazy(self, name: str) -> LazyClient:
+        return LazyClient(self, name)
+
+    def created(self) -> List[str]:
+        return list(self._instances)
+
+    def check(self) -> Dict[str, List[str]]:
+        # Configuration problems per provider, found without any network call
+        problems: Dict[str, List[str]] = {}
+        for name, provider in self.providers.items():
+            found = []
+            for variable in provider.env:
+                options = variable.split("|")
+                if not any(os.environ.get(option) for option in options):
+                    found.append(f"{' or '.join(options)} is not set")
+            for package in provider.packages:
+                if importlib.util.find_spec(package) is None:
+                    found.append(f"package {package} is not installed")
+            for tool in provider.tools:
+                if shutil.which(tool) is None:
+                    found.append(f"{tool} is not on PATH")
+            if not found and provider.factory is not None:
+                try:
+                    self.get(name)
+                except Exception as e:
+                    found.append(f"client failed to build: {type(e).__name__}: {e}")
+            problems[name] = found
+        return problems
+
+
+def build_openai():
+    from openai import AsyncOpenAI
+
+    return AsyncOpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
+
+
+def build_luma():
+    from lumaai import AsyncLumaAI
+
+    return AsyncLumaAI()
+
+
+def build_airtable():
+    from pyairtable import Api
+
+    return Api(os.environ["AIRTABLE_API_KEY"])
+
+
+registry = Registry()
+registry.register("openai", build_openai, env=("OPENAI_API_KEY",), packages=("openai",))
+registry.register("luma", build_luma, env=("LUMAAI_API_KEY",), packages=("lumaai",))
+registry.register("cartesia", env=("CARTESIA_API_KEY",), packages=("cartesia",))
+registry.register("ideogram", env=("IDEOGRAM_API_KEY",))
+registry.register(
+    "airtable",
+    build_airtable,
+    env=("AIRTABLE_API_KEY",),
+    packages=("pyairtable",),
+)
+registry.register(
+    "r2",
+    env=(
+        "R2_ACCESS_KEY_ID",
+        "R2_SECRET_ACCESS_KEY",
+        "R2_BUCKET_NAME",
+        "R2_ACCOUNT_ID|R2_ENDPOINT_URL",
+    ),
+    packages=("boto3",),
+)
+registry.register("twitter", packages=("tweetcapture", "selenium"))
+registry.register("ffmpeg", tools=("ffmpeg",))
+
+
+def client(name: str):
+    return registry.get(name)
@@ -0,0 +1,74 @@
+from typing import Dict, List, Union
+
+from combine_clips import run_command
+from mux_audio_and_video import audio_codec_args, audio_input_args
+from render_profiles import FINAL_PROFILE, RenderProfile, subtitles_filter
+
+
+def build_single_pass_command(
+    clips: List[Dict[str, Union[str, float]]],
+    audio_path: str,
+    captions_path: str,
+    output_file: str,
+    profile: RenderProfile = FINAL_PROFILE,
+) -> List[str]:
+    # Clip urls must point at local files, see combine_clips.fetch_clip
+    inputs = []
+    filters = []
+    for i, clip in enumerate(clips):
+        if clip["type"] == "image":
+            inputs += ["-loop", "1", "-t", str(clip["duration"]), "-i", clip["url"]]
+            clip_filter = profile.clip_filter()
+        else:
+            inputs += ["-t", str(clip["duration"]), "-i", clip["url"]]
+            clip_filter = profile.clip_filter(clip["duration"])
+        filters.append(f"[{i}:v]{clip_filter}[v{i}]")
+
+    audio_index = len(clips)
+    inputs += audio_input_args(audio_path)
+
+    concat_inputs = "".join(f"[v{i}]" for i in range(len(clips)))
+    filters.append(f"{concat_inputs}concat=n={len(clips)}:v=1:a=0[cat]")
+    if profile.burn_captions:
+        filters.append(f"[cat]{subtitles_filter(captions_path)}[out]")
+        caption_args = []
+    else:
+        # A draft skips libass and carries the captions as a subtitle track
+        filters.append("[cat]null[out]")
+        inputs += ["-i", captions_path]
+        caption_args = ["-map", f"{audio_index + 1}:s", "-c:s", "mov_text"]
+
+    # fmt: off
+    return [
+        "ffmpeg", "-y",
+        *inputs,
+        "-filter_complex", ";".join(filters),
+        "-map", "[out]",
+        "-map", f"{audio_index}:a",
+        *caption_args,
+        *profile.video_codec_args(),
+        *audio_codec_args(audio_path, profile),
+        "-shortest",
+        output_file,
+    ]
+    # fmt: on
+
+
+async def render_single_pass(
+    clips: List[Dict[str, Union[str, float]]],
+    audio_path: str = "audio.pcm",
+    captions_path: str = "captions.srt",
+    output_file: str = "final_output.mp4",
+    profile: RenderProfile = FINAL_PROFILE,
+):
+    # Concat, caption burn-in and audio mux in a single libx264 encode
+    if not clips:
+        raise ValueError("No clips to render")
+
+    print(f"Rendering {len(clips)} clips in a single {profile.name} pass...")
+    await run_command(
+        build_single_pass_command(
+            clips, audio_path, captions_path, output_file, profile
+        )
+    )
+    print("Done.")
@@ -0,0 +1,66 @@
+import os
+from typing import List, NamedTuple, Optional
+
+FRAME_RATE = 30
+
+SUBTITLE_STYLE = "FontSize=26,PrimaryColour=&HFFFFFF&"
+
+
+class RenderProfile(NamedTuple):
+    # How hard the render path works on the video. final is the 1080x1920
+    # output we publish. draft is for checking timing and captions: clips are
+    # encoded small and fast and the captions go in as a subtitle track.
+    # Either way every clip is encoded once while it is prepared, so the
+    # concat and mux copy the video.
+    name: str
+    width: int
+    height: int
+    preset: str
+    crf: int
+    audio_bitrate: str
+    # Captions are burned into each clip as it is prepared
+    burn_captions: bool
+
+    @property
+    def scale(self) -> str:
+        return f"scale={self.width}:{self.height}"
+
+    def video_codec_args(self) -> List[str]:
+        return ["-c:v", "libx264", "-preset", self.preset, "-crf", str(self.crf)]
+
+    def clip_filter(self, duration: Optional[float] = None) -> str:
+        # Common format for clips that are concatenated with a stream copy.
+        # With a duration, footage that runs short holds its last frame.
+        fit = ""
+        if duration is not None:
+            fit = f"tpad=stop_mode=clone:stop_duration={duration},trim=duration={duration},setpts=PTS-STARTPTS,"
+        return f"{fit}{self.scale},setsar=1,fps={FRAME_RATE},format=yuv420p"
+
+
+def subtitles_filter(captions_path: str) -> str:
+    return f"subtitles={captions_path}:force_style='{SUBTITLE_STYLE}'"
+
+
+RENDER_PROFILES = {
+    "final": RenderProfile(
+        "final",
+        width=1080,
+        height=1920,
+        preset="medium",
+        crf=23,
+        audio_bitrate="192k",
+        burn_captions=True,
+    ),
+    "draft": RenderProfile(
+        "draft",
+        width=360,
+        height=640,
+        preset="ultrafast",
+        crf=30,
+        audio_bitrate="96k",
+        burn_captions=False,
+    ),
+}
+
+RENDER_PROFILE = os.environ.get("RENDER_PROFILE", "final")
+FINAL_PROFILE = RENDER_PROFILES["final"]
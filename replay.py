@@ -0,0 +1,489 @@
+import asyncio
+import contextlib
+import hashlib
+import importlib
+import inspect
+import json
+import math
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Union
+
+from asset_cache import cache_key
+from tracing import span
+
+FIXTURE_VERSION = 1
+FIXTURE_FILE = "fixture.json"
+REPLAY_MODES = ["record", "replay"]
+
+
+class MissingRecording(LookupError):
+    pass
+
+
+class Latency(NamedTuple):
+    # How long a replayed call takes. "recorded" uses the latency measured
+    # while recording, the others sample around `median` seconds.
+    distribution: str = "recorded"
+    median: float = 0.0
+    spread: float = 0.0
+
+    def sample(self, recorded: float, rng: random.Random) -> float:
+        if self.distribution == "recorded":
+            return recorded
+        if self.distribution == "fixed":
+            return self.median
+        if self.distribution == "uniform":
+            low = max(0.0, self.median - self.spread)
+            return rng.uniform(low, self.median + self.spread)
+        if self.distribution == "lognormal":
+            # spread is sigma of the underlying normal, 0.3 gives a p95 of
+            # about 1.6x the median
+            return rng.lognormvariate(math.log(max(self.median, 1e-6)), self.spread)
+        raise ValueError(f"Unknown latency distribution {self.distribution}")
+
+
+def parse_latency(spec: str) -> Dict[str, Latency]:
+    # "luma.poll_generation=lognormal:60:0.3,openai_client=fixed:2" maps a
+    # provider, or every provider in a module, to a distribution
+    latencies = {}
+    for part in filter(None, (part.strip() for part in spec.split(","))):
+        provider, _, value = part.partition("=")
+        distribution, *numbers = value.split(":")
+        latencies[provider] = Latency(distribution, *(float(n) for n in numbers))
+    return latencies
+
+
+def file_digest(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class Fixture:
+    # A recorded run: fixture.json lists the calls made to each provider,
+    # keyed by their arguments, and artifacts/ holds the files they produced.
+    # Entries without a key match any call to their provider and are handed
+    # out in turn, which is how synthetic fixtures are written.
+
+    def __init__(self, root: str):
+        self.root = root
+        self.calls: Dict[str, List[Dict[str, Any]]] = {}
+        self._cursors: Dict[tuple, int] = {}
+        path = os.path.join(root, FIXTURE_FILE)
+        if os.path.exists(path):
+            with open(path) as f:
+                data = json.load(f)
+            if data.get("version") != FIXTURE_VERSION:
+                raise ValueError(f"Unsupported fixture version in {path}")
+            self.calls = data["calls"]
+
+    def artifact(self, name: str) -> str:
+        return os.path.join(self.root, "artifacts", name)
+
+    def add_artifact(self, source: Union[str, bytes], suffix: str = "") -> str:
+        # Artifacts are named by content hash, repeated outputs share a file
+        os.makedirs(os.path.join(self.root, "artifacts"), exist_ok=True)
+        if isinstance(source, bytes):
+            name = hashlib.sha256(source).hexdigest()[:32] + suffix
+            with open(self.artifact(name), "wb") as f:
+                f.write(source)
+        else:
+            suffix = suffix or os.path.splitext(source)[1]
+            name = file_digest(source)[:32] + suffix
+            shutil.copyfile(source, self.artifact(name))
+        return name
+
+    def add(
+        self,
+        provider: str,
+        key: Optional[str],
+        value: Any,
+        latency: float = 0.0,
+        artifacts: Optional[Dict[str, str]] = None,
+    ):
+        entry = {"key": key, "value": value, "latency": latency}
+        if artifacts:
+            entry["artifacts"] = artifacts
+        self.calls.setdefault(provider, []).append(entry)
+
+    def find(self, provider: str, key: str) -> Dict[str, Any]:
+        entries = self.calls.get(provider, [])
+        for match_key in (key, None):
+            matches = [entry for entry in entries if entry["key"] == match_key]
+            if matches:
+                cursor = self._cursors.get((provider, match_key), 0)
+                self._cursors[(provider, match_key)] = cursor + 1
+                return matches[cursor % len(matches)]
+        raise MissingRecording(f"No recording of {provider} for key {key}")
+
+    def save(self):
+        os.makedirs(self.root, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=self.root, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump({"version": FIXTURE_VERSION, "calls": self.calls}, f, indent=2)
+        os.replace(temp_path, os.path.join(self.root, FIXTURE_FILE))
+
+
+# Encoders turn a provider result into (JSON value, artifacts) while
+# recording, decoders rebuild the result from them. Both receive the call's
+# bound arguments and may be coroutines.
+
+
+def encode_value(result, arguments, fixture):
+    return result, None
+
+
+def decode_value(value, artifacts, arguments, fixture):
+    return value
+
+
+def encode_storyboard(result, arguments, fixture):
+    return result.model_dump(), None
+
+
+def decode_storyboard(value, artifacts, arguments, fixture):
+    from openai_client import Storyboard
+
+    return Storyboard.model_validate(value)
+
+
+def encode_memes(result, arguments, fixture):
+    return [url.model_dump() for url in result], None
+
+
+def decode_memes(value, artifacts, arguments, fixture):
+    from openai_client import ImageUrl
+
+    # Synthetic fixtures list a few memes and reuse them for every description
+    count = len(arguments["meme_descriptions"])
+    return [ImageUrl(**value[i % len(value)]) for i in range(count)]
+
+
+def encode_audio(result, arguments, fixture):
+    from workspace import workspace
+
+    audio_format = arguments["audio_format"]
+    artifacts = {
+        "audio": fixture.add_artifact(workspace().audio(audio_format)),
+        "captions": fixture.add_artifact(workspace().captions),
+    }
+    if os.path.exists(workspace().words):
+        artifacts["words"] = fixture.add_artifact(workspace().words)
+    return {"duration": result, "audio_format": audio_format}, artifacts
+
+
+async def decode_audio(value, artifacts, arguments, fixture):
+    from combine_clips import run_command
+    from generate_audio import ENCODER_ARGS
+    from mux_audio_and_video import audio_input_args, sample_rate
+    from workspace import workspace
+
+    audio_format = arguments["audio_format"]
+    source = fixture.artifact(artifacts["audio"])
+    shutil.copyfile(fixture.artifact(artifacts["captions"]), workspace().captions)
+    # Older recordings have no word timings, the planner then cuts evenly
+    if "words" in artifacts:
+        shutil.copyfile(fixture.artifact(artifacts["words"]), workspace().words)
+    if value["audio_format"] == audio_format:
+        shutil.copyfile(source, workspace().audio(audio_format))
+    else:
+        output_args = ENCODER_ARGS.get(audio_format, ["-f", "f32le"])
+        # fmt: off
+        await run_command([
+            "ffmpeg", "-y",
+            *audio_input_args(source),
+            "-ac", "1", "-ar", f"{sample_rate}",
+            *output_args,
+            workspace().audio(audio_format),
+        ])
+        # fmt: on
+    return value["duration"]
+
+
+async def encode_generation(result, arguments, fixture):
+    from http_client import HttpClient, http_client
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        # Called on the class so the download is not recorded as a call of its own
+        path = await HttpClient.download(
+            http_client,
+            "downloads",
+            result.assets.video,
+            os.path.join(temp_dir, "video.mp4"),
+        )
+        video = fixture.add_artifact(path)
+    return {"id": result.id, "state": result.state}, {"video": video}
+
+
+def decode_generation(value, artifacts, arguments, fixture):
+    # Just the fields the pipeline reads, the video is a local file that
+    # ffmpeg opens in place of the CDN url
+    video = os.path.abspath(fixture.artifact(artifacts["video"]))
+    return SimpleNamespace(**value, assets=SimpleNamespace(video=video))
+
+
+def encode_upload(result, arguments, fixture):
+    return result, None
+
+
+def encode_tweet(result, arguments, fixture):
+    if not result:
+        return None, None
+    return result, {"screenshot": fixture.add_artifact(result)}
+
+
+def decode_tweet(value, artifacts, arguments, fixture):
+    from twitter_capture import tweet_filename
+
+    if not artifacts:
+        return None
+    filename = tweet_filename(arguments["url"])
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    shutil.copyfile(fixture.artifact(artifacts["screenshot"]), filename)
+    return filename
+
+
+def encode_response(result, arguments, fixture):
+    value = {"status": result.status, "headers": dict(result.headers)}
+    return value, {"body": fixture.add_artifact(result.body)}
+
+
+def decode_response(value, artifacts, arguments, fixture):
+    from multidict import CIMultiDict
+
+    from http_client import HttpResponse
+
+    with open(fixture.artifact(artifacts["body"]), "rb") as f:
+        body = f.read()
+    return HttpResponse(value["status"], CIMultiDict(value["headers"]), body)
+
+
+def encode_download(result, arguments, fixture):
+    return None, {"body": fixture.add_artifact(result)}
+
+
+def decode_download(value, artifacts, arguments, fixture):
+    shutil.copyfile(fixture.artifact(artifacts["body"]), arguments["path"])
+    return arguments["path"]
+
+
+class ProviderSpec(NamedTuple):
+    # "module:attribute" or "module:object.attribute"
+    target: str
+    encode: Callable = encode_value
+    decode: Callable = decode_value
+    # Arguments left out of the key, like credentials and request headers
+    ignore: tuple = ()
+
+
+PROVIDERS: Dict[str, ProviderSpec] = {
+    "openai_client.generate_storyboard": ProviderSpec(
+        "openai_client:generate_storyboard", encode_storyboard, decode_storyboard
+    ),
+    "openai_client.find_memes": ProviderSpec(
+        "openai_client:find_memes", encode_memes, decode_memes
+    ),
+    "generate_audio.generate_transcript": ProviderSpec(
+        "generate_audio:generate_transcript"
+    ),
+    "generate_audio.synthesize_audio": ProviderSpec(
+        "generate_audio:synthesize_audio", encode_audio, decode_audio, ("contexts",)
+    ),
+    "ideogram.generate_ideo_image": ProviderSpec("ideogram:generate_ideo_image"),
+    "luma.generate_luma_video": ProviderSpec(
+        "luma:generate_luma_video", ignore=("use_cache",)
+    ),
+    "luma.poll_generation": ProviderSpec(
+        "luma:poll_generation",
+        encode_generation,
+        decode_generation,
+        ("timeout", "reattached", "hedge"),
+    ),
+    "airtable.memes": ProviderSpec("airtable:meme_catalog.memes"),
+    "cloudflare.upload_to_cloudflare": ProviderSpec(
+        "cloudflare:upload_to_cloudflare", encode_upload
+    ),
+    "twitter_capture.capture_tweet": ProviderSpec(
+        "twitter_capture:capture_tweet", encode_tweet, decode_tweet
+    ),
+    # Meme images and clip downloads go through the shared transport
+    "http_client.request": ProviderSpec(
+        "http_client:http_client.request",
+        encode_response,
+        decode_response,
+        ("headers",),
+    ),
+    "http_client.download": ProviderSpec(
+        "http_client:http_client.download", encode_download, decode_download
+    ),
+}
+
+
+def call_key(provider: str, arguments: Dict[str, Any], ignore=()) -> str:
+    params = {}
+    for name, value in arguments.items():
+        if name in ignore:
+            continue
+        # Uploaded images are keyed by content
+        if isinstance(value, bytes):
+            value = hashlib.sha256(value).hexdigest()
+        params[name] = value
+    return cache_key(provider, **params)
+
+
+async def resolve(value):
+    if inspect.isawaitable(value):
+        return await value
+    return value
+
+
+class Replay:
+    # Swaps every provider entry point for a wrapper that either records the
+    # real call into the fixture or answers it from the fixture after a
+    # sampled delay. Names imported elsewhere with `from x import y` are
+    # swapped too.
+
+    def __init__(
+        self,
+        mode: str,
+        fixture_dir: str,
+        latency: Optional[Dict[str, Latency]] = None,
+        time_scale: float = 1.0,
+        seed: int = 0,
+        providers: Dict[str, ProviderSpec] = PROVIDERS,
+    ):
+        if mode not in REPLAY_MODES:
+            raise ValueError(f"Unknown replay mode {mode}, expected {REPLAY_MODES}")
+        self.mode = mode
+        self.fixture = Fixture(fixture_dir)
+        self.latency = latency or {}
+        self.time_scale = time_scale
+        self.rng = random.Random(seed)
+        self.providers = providers
+        self._restore: List[Callable[[], None]] = []
+
+    def delay(self, provider: str, recorded: float) -> float:
+        module = provider.split(".")[0]
+        latency = (
+            self.latency.get(provider)
+            or self.latency.get(module)
+            or self.latency.get("*")
+            or Latency()
+        )
+        return latency.sample(recorded, self.rng) * self.time_scale
+
+    def wrap(self, provider: str, spec: ProviderSpec, original: Callable):
+        signature = inspect.signature(original)
+        fixture = self.fixture
+
+        def bind(args, kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            return dict(bound.arguments)
+
+        if inspect.iscoroutinefunction(original):
+
+            async def wrapper(*args, **kwargs):
+                arguments = bind(args, kwargs)
+                key = call_key(provider, arguments, spec.ignore)
+                if self.mode == "record":
+                    start = time.perf_counter()
+                    result = await original(*args, **kwargs)
+                    latency = time.perf_counter() - start
+                    value, artifacts = await resolve(
+                        spec.encode(result, arguments, fixture)
+                    )
+                    fixture.add(provider, key, value, latency, artifacts)
+                    return result
+
+                entry = fixture.find(provider, key)
+                with span(provider, replayed=True):
+                    await asyncio.sleep(self.delay(provider, entry["latency"]))
+                    return await resolve(
+                        spec.decode(
+                            entry["value"], entry.get("artifacts"), arguments, fixture
+                        )
+                    )
+
+        else:
+
+            def wrapper(*args, **kwargs):
+                # Synchronous providers block their caller for the delay, as
+                # the real call would
+                arguments = bind(args, kwargs)
+                key = call_key(provider, arguments, spec.ignore)
+                if self.mode == "record":
+                    start = time.perf_counter()
+                    result = original(*args, **kwargs)
+                    latency = time.perf_counter() - start
+                    value, artifacts = spec.encode(result, arguments, fixture)
+                    fixture.add(provider, key, value, latency, artifacts)
+                    return result
+
+                entry = fixture.find(provider, key)
+                with span(provider, replayed=True):
+                    time.sleep(self.delay(provider, entry["latency"]))
+                    return spec.decode(
+                        entry["value"], entry.get("artifacts"), arguments, fixture
+                    )
+
+        return wrapper
+
+    def install(self):
+        for provider, spec in self.providers.items():
+            module_name, _, path = spec.target.partition(":")
+            module = importlib.import_module(module_name)
+            *owner_path, attribute = path.split(".")
+            if owner_path:
+                # A method on a module level instance, shadowed on the instance
+                owner = module
+                for name in owner_path:
+                    owner = getattr(owner, name)
+                wrapper = self.wrap(provider, spec, getattr(owner, attribute))
+                setattr(owner, attribute, wrapper)
+                self._restore.append(
+                    lambda owner=owner, attribute=attribute: delattr(owner, attribute)
+                )
+                continue
+
+            original = getattr(module, attribute)
+            wrapper = self.wrap(provider, spec, original)
+            for other in list(sys.modules.values()):
+                if getattr(other, attribute, None) is original:
+                    setattr(other, attribute, wrapper)
+                    self._restore.append(
+                        lambda other=other, attribute=attribute, original=original: (
+                            setattr(other, attribute, original)
+                        )
+                    )
+
+    def uninstall(self):
+        while self._restore:
+            self._restore.pop()()
+
+
+@contextlib.contextmanager
+def replay_session(
+    mode: str,
+    fixture_dir: str,
+    latency: Optional[Dict[str, Latency]] = None,
+    time_scale: float = 1.0,
+    seed: int = 0,
+):
+    session = Replay(mode, fixture_dir, latency, time_scale, seed)
+    session.install()
+    try:
+        yield session
+    finally:
+        session.uninstall()
+        if mode == "record":
+            session.fixture.save()
+            print(f"Recorded provider calls to {fixture_dir}")
@@ -0,0 +1,48 @@
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+# The modules live at the top of the repo, not in a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import luma  # noqa: E402
+from asset_cache import AssetCache  # noqa: E402
+
+
+class FakeGenerations:
+    # Luma's generations API, tests decide when each generation finishes
+    def __init__(self):
+        self.states = {}
+        self.polls = []
+
+    async def get(self, generation_id):
+        self.polls.append(generation_id)
+        return SimpleNamespace(
+            id=generation_id,
+            state=self.states.get(generation_id, "dreaming"),
+            failure_reason="boom",
+            assets=SimpleNamespace(video=f"https://example.com/{generation_id}.mp4"),
+        )
+
+
+@pytest.fixture
+def generations():
+    return FakeGenerations()
+
+
+@pytest.fixture
+def tracker(monkeypatch, generations):
+    tracker = luma.GenerationTracker(
+        SimpleNamespace(generations=generations), min_interval=0.001, max_interval=0.001
+    )
+    monkeypatch.setattr(luma, "tracker", tracker)
+    return tracker
+
+
+@pytest.fixture
+def asset_cache(monkeypatch, tmp_path):
+    cache = AssetCache(str(tmp_path / "assets"))
+    monkeypatch.setattr(luma, "asset_cache", cache)
+    return cache
@@ -0,0 +1,57 @@
+import time
+
+from airtable import MemeCatalog
+
+
+class FakeTable:
+    # Airtable's table API, attachment URLs change on every fetch
+    def __init__(self):
+        self.formulas = []
+        self.fetches = 0
+
+    def record(self, record_id, name):
+        attachments = [
+            {"id": f"{record_id}-{kind}", "url": f"{record_id}-{kind}-{self.fetches}"}
+            for kind in ["meme", "template"]
+        ]
+        if self.fetches > 1:
+            # Later fetches list the attachments in another order
+            attachments.reverse()
+        return {
+            "id": record_id,
+            "fields": {"Name": name, "Notes": f"notes on {name}", "image": attachments},
+        }
+
+    def all(self, formula=None):
+        self.fetches += 1
+        self.formulas.append(formula)
+        records = [self.record("rec1", "doge"), self.record("rec2", "wojak")]
+        if formula and formula.startswith("OR("):
+            return [record for record in records if record["id"] in formula]
+        return records
+
+
+def catalog(tmp_path, **kwargs):
+    catalog = MemeCatalog(str(tmp_path / "catalog.json"), **kwargs)
+    catalog._table = FakeTable()
+    return catalog
+
+
+def test_refresh_within_full_sync_is_incremental(tmp_path):
+    memes = catalog(tmp_path, ttl=0, full_sync=24 * 60 * 60, url_ttl=60 * 60)
+    memes.memes()
+    memes.memes()
+    first, second = memes._table.formulas
+    assert first is None
+    assert second.startswith("IS_AFTER(LAST_MODIFIED_TIME(),")
+
+
+def test_image_urls_refresh_only_stale_records(tmp_path):
+    memes = catalog(tmp_path, ttl=60 * 60, url_ttl=60 * 60)
+    assert memes.image_urls(["doge"]) == ["rec1-meme-1"]
+    assert memes._table.formulas == [None]
+
+    records = memes.snapshot()["records"]
+    records["rec1"]["url_fetched_at"] = time.time() - 2 * 60 * 60
+    assert memes.image_urls(["doge", "wojak"]) == ["rec1-meme-2", "rec2-meme-1"]
+    assert memes._table.formulas[1] == "OR(RECORD_ID()='rec1')"
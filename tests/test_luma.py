@@ -0,0 +1,92 @@
+import asyncio
+
+import pytest
+
+import luma
+
+
+async def settle():
+    # Long enough for the tracker to poll a few times
+    await asyncio.sleep(0.02)
+
+
+def test_cancelled_caller_leaves_shared_generation(tracker, generations):
+    async def scenario():
+        first = asyncio.ensure_future(luma.poll_generation("g1"))
+        second = asyncio.ensure_future(luma.poll_generation("g1"))
+        await settle()
+        first.cancel()
+        await settle()
+        generations.states["g1"] = "completed"
+        return first, await asyncio.wait_for(second, 1)
+
+    first, result = asyncio.run(scenario())
+    assert first.cancelled()
+    assert result.id == "g1"
+
+
+def test_last_cancelled_caller_stops_polling(tracker, generations):
+    async def scenario():
+        caller = asyncio.ensure_future(luma.poll_generation("g1"))
+        await settle()
+        caller.cancel()
+        await asyncio.gather(caller, return_exceptions=True)
+        polls = len(generations.polls)
+        await settle()
+        return polls
+
+    polls = asyncio.run(scenario())
+    assert "g1" not in tracker._pending
+    assert len(generations.polls) == polls
+
+
+def test_race_counts_cancelled_generation_as_lost(tracker):
+    async def scenario():
+        loop = asyncio.get_running_loop()
+        lost, won = loop.create_future(), loop.create_future()
+        lost.cancel()
+        loop.call_later(0.01, won.set_result, "video")
+        return await luma.race_generations({lost: "g1", won: "g2"})
+
+    assert asyncio.run(scenario()) == "video"
+
+
+def test_one_poll_per_generation_per_round(tracker, generations):
+    async def scenario():
+        waiters = [tracker.track("g1") for _ in range(3)] + [tracker.track("g2")]
+        await settle()
+        generations.states.update(g1="completed", g2="completed")
+        return await asyncio.wait_for(asyncio.gather(*waiters), 1)
+
+    results = asyncio.run(scenario())
+    assert [result.id for result in results] == ["g1", "g1", "g1", "g2"]
+    # Every round polls both ids once, however many callers wait on them
+    assert generations.polls.count("g1") == generations.polls.count("g2")
+
+
+def test_waiters_share_one_result(tracker, generations):
+    async def scenario():
+        first, second = tracker.track("g1"), tracker.track("g1")
+        generations.states["g1"] = "completed"
+        return first, await asyncio.wait_for(asyncio.gather(first, second), 1)
+
+    future, (first, second) = asyncio.run(scenario())
+    assert first is second
+    assert future.result() is first
+
+
+def test_timeout_discards_cached_generation(tracker, asset_cache):
+    asset_cache.put("key", source="luma", value="g1", provider_id="g1")
+
+    with pytest.raises(Exception, match="Max attempts reached"):
+        asyncio.run(luma.poll_generation("g1", timeout=0.005))
+    assert asset_cache.get("key") is None
+
+
+def test_failure_discards_cached_generation(tracker, generations, asset_cache):
+    asset_cache.put("key", source="luma", value="g1", provider_id="g1")
+    generations.states["g1"] = "failed"
+
+    with pytest.raises(Exception, match="Generation failed: boom"):
+        asyncio.run(luma.poll_generation("g1"))
+    assert asset_cache.get("key") is None
@@ -0,0 +1,50 @@
+import asyncio
+import json
+
+import tracing
+from tracing import Span, Tracer
+
+
+def trace(tracer: Tracer, name: str):
+    return Span(tracer, name, {})
+
+
+def test_child_tasks_get_their_own_lane(tmp_path):
+    tracer = Tracer(stats_path=str(tmp_path / "stats.json"))
+    tracer.enable(str(tmp_path / "trace.json"))
+
+    async def child():
+        with trace(tracer, "child"):
+            await asyncio.sleep(0)
+
+    async def parent():
+        with trace(tracer, "parent"):
+            await asyncio.gather(child(), child())
+        with trace(tracer, "parent"):
+            pass
+
+    asyncio.run(parent())
+    tracer.finish()
+
+    with open(tmp_path / "trace.json") as f:
+        events = json.load(f)
+    lanes = {}
+    for event in events:
+        if event["ph"] == "X":
+            lanes.setdefault(event["name"], set()).add(event["tid"])
+    assert len(lanes["parent"]) == 1
+    assert len(lanes["child"]) == 2
+    assert not lanes["parent"] & lanes["child"]
+
+
+def test_samples_are_capped(tmp_path, monkeypatch):
+    monkeypatch.setattr(tracing, "TRACE_SAMPLES", 3)
+    tracer = Tracer(stats_path=str(tmp_path / "stats.json"))
+    tracer.enable(str(tmp_path / "trace.json"))
+    for _ in range(10):
+        with trace(tracer, "step"):
+            pass
+
+    assert len(tracer.durations()["step"]) == 3
+    assert tracer.events == 11
+    tracer.close()
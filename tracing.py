@@ -0,0 +1,212 @@
+import asyncio
+import contextvars
+import itertools
+import json
+import os
+import statistics
+import tempfile
+import threading
+import time
+import weakref
+from collections import deque
+from typing import IO, Any, Deque, Dict, List, Optional, Tuple
+
+# Chrome trace output, tracing is off unless this is set
+TRACE_PATH = os.environ.get("TRACE")
+TRACE_STATS_PATH = os.environ.get("TRACE_STATS_PATH", ".cache/trace_stats.json")
+# Runs kept per span name for the rolling percentiles
+TRACE_STATS_WINDOW = int(os.environ.get("TRACE_STATS_WINDOW", 50))
+# Recent durations kept per span name for this run's medians, events
+# themselves go straight to the trace file so a long lived daemon stays flat
+TRACE_SAMPLES = int(os.environ.get("TRACE_SAMPLES", 1000))
+
+
+class NullSpan:
+    # Returned by span() while tracing is off, so instrumented code pays for
+    # one attribute check and nothing else
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def set(self, **attributes):
+        pass
+
+
+NULL_SPAN = NullSpan()
+
+
+class Span:
+    def __init__(self, tracer: "Tracer", name: str, attributes: Dict[str, Any]):
+        self.tracer = tracer
+        self.name = name
+        self.attributes = attributes
+        self.start = 0.0
+        self._token = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        self._token = self.tracer.current.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = time.perf_counter()
+        self.tracer.current.reset(self._token)
+        if exc_type is not None:
+            self.attributes["error"] = exc_type.__name__
+        self.tracer.record(self, end)
+        return False
+
+
+class Tracer:
+    # Writes nested spans as Chrome trace "complete" events while they
+    # finish. Every asyncio task and thread gets its own lane, so concurrent
+    # items show up side by side and the spans within a lane nest.
+
+    def __init__(
+        self, path: Optional[str] = TRACE_PATH, stats_path: str = TRACE_STATS_PATH
+    ):
+        self.path = path
+        self.stats_path = stats_path
+        self.enabled = bool(path)
+        self.origin = time.perf_counter()
+        self.events = 0
+        self.samples: Dict[str, Deque[float]] = {}
+        self.current: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar(
+            "current_span", default=None
+        )
+        # The task or thread a lane belongs to next to its number. Child tasks
+        # inherit the variable, so the owner tells them to take a lane of
+        # their own, and numbers are never reused like object ids are
+        self.current_lane: contextvars.ContextVar[Optional[Tuple[weakref.ref, int]]] = (
+            contextvars.ContextVar("trace_lane", default=None)
+        )
+        self._lane_ids = itertools.count(1)
+        self._file: Optional[IO[str]] = None
+        self._lock = threading.Lock()
+
+    def enable(self, path: str, stats_path: Optional[str] = None):
+        # Absolute so a run that changes directory still writes here
+        self.path = os.path.abspath(path)
+        self.stats_path = os.path.abspath(stats_path or self.stats_path)
+        self.enabled = True
+        self.origin = time.perf_counter()
+        self.events = 0
+        self.samples = {}
+
+    def write(self, event: Dict[str, Any]):
+        # Chrome's JSON array format, viewers accept it without the closing
+        # bracket so a trace of a process that died is still readable
+        line = json.dumps(event)
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.path, "w")
+                self._file.write("[\n")
+            self._file.write(line + ",\n")
+            self.events += 1
+
+    def lane(self) -> int:
+        try:
+            task = asyncio.current_task()
+        except RuntimeError:
+            task = None
+        owner = task if task is not None else threading.current_thread()
+        current = self.current_lane.get()
+        if current is not None and current[0]() is owner:
+            return current[1]
+        lane = next(self._lane_ids)
+        self.current_lane.set((weakref.ref(owner), lane))
+        label = task.get_name() if task else owner.name
+        self.write(
+            {
+                "name": "thread_name",
+                "ph": "M",
+                "pid": os.getpid(),
+                "tid": lane,
+                "args": {"name": label},
+            }
+        )
+        return lane
+
+    def record(self, span: Span, end: float):
+        event = {
+            "name": span.name,
+            "cat": span.name.split(".")[0].split(":")[0],
+            "ph": "X",
+            "ts": (span.start - self.origin) * 1e6,
+            "dur": (end - span.start) * 1e6,
+            "pid": os.getpid(),
+            "tid": self.lane(),
+            "args": {key: str(value) for key, value in span.attributes.items()},
+        }
+        self.write(event)
+        with self._lock:
+            samples = self.samples.setdefault(span.name, deque(maxlen=TRACE_SAMPLES))
+            samples.append(end - span.start)
+
+    def durations(self) -> Dict[str, List[float]]:
+        with self._lock:
+            return {name: list(samples) for name, samples in self.samples.items()}
+
+    def close(self):
+        with self._lock:
+            if self._file is None:
+                return
+            # Ends the array on an event rather than a trailing comma
+            name = {"name": "luma-hack"}
+            last = {"name": "process_name", "ph": "M", "pid": os.getpid(), "args": name}
+            self._file.write(json.dumps(last) + "]\n")
+            self._file.close()
+            self._file = None
+        print(f"Wrote trace with {self.events} events to {self.path}")
+
+    def update_stats(self, path: Optional[str] = None, window=TRACE_STATS_WINDOW):
+        # Each run adds its per-name median, the summary is over recent runs
+        path = path or self.stats_path
+        stats = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                stats = json.load(f)
+        for name, durations in self.durations().items():
+            history = stats.setdefault(name, [])
+            history.append(statistics.median(durations))
+            del history[:-window]
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".")
+        with os.fdopen(fd, "w") as f:
+            json.dump(stats, f)
+        os.replace(temp_path, path)
+        return stats
+
+    def finish(self):
+        if not self.enabled:
+            return
+        self.close()
+        self.enabled = False
+        stats = self.update_stats()
+        print(f"{'span':<36} {'runs':>5} {'p50':>9} {'p95':>9}")
+        for name in sorted(stats):
+            history = sorted(stats[name])
+            p50 = history[len(history) // 2]
+            p95 = history[min(len(history) - 1, int(len(history) * 0.95))]
+            print(f"{name:<36} {len(history):>5} {p50:8.2f}s {p95:8.2f}s")
+
+
+tracer = Tracer()
+
+
+def span(name: str, **attributes):
+    if not tracer.enabled:
+        return NULL_SPAN
+    return Span(tracer, name, attributes)
+
+
+def current_span():
+    if not tracer.enabled:
+        return NULL_SPAN
+    return tracer.current.get() or NULL_SPAN
@@ -1,91 +1,207 @@
 import asyncio
+import atexit
+import contextvars
 import os
-from typing import List
-
-from PIL import Image
-from tweetcapture import TweetCapture
+from typing import List, Optional
 
+from asset_cache import asset_cache, cache_key
 from cloudflare import upload_to_cloudflare
+from compositing import compose_tweet_backdrop, run_in_process
+from providers import lazy_import
+from tracing import span
+from workspace import workspace
 
+BROWSER_POOL_SIZE = int(os.environ.get("BROWSER_POOL_SIZE", 3))
+# Browsers are restarted after this many captures to keep memory in check
+BROWSER_MAX_USES = int(os.environ.get("BROWSER_MAX_USES", 50))
+BROWSER_BASE_PORT = 9222
 
-async def capture_tweet(url, port):
-    try:
-        tweet = TweetCapture()
-        tweet.add_chrome_argument(f"--remote-debugging-port={port}")
+tweetcapture = lazy_import("tweetcapture")
+tweetcapture_screenshot = lazy_import("tweetcapture.screenshot")
+# tweetcapture's own get_driver, saved when the pool is installed
+create_driver = None
+current_pool = contextvars.ContextVar("current_pool", default=None)
 
-        # Create 'tweets' directory if it doesn't exist
-        os.makedirs("tweets", exist_ok=True)
 
-        # Generate a filename based on the URL and username
-        username = url.split("/")[
-            -3
-        ]  # Assuming the URL format is twitter.com/username/status/id
-        filename = f"tweets/{username}_{url.split('/')[-1]}.png"
+class PooledDriver:
+    # Stands in for the selenium driver inside TweetCapture.screenshot, which
+    # quits the driver when it is done. Quitting hands the browser back to the
+    # pool instead.
 
-        await tweet.screenshot(url, path=filename, overwrite=True)
+    def __init__(self, pool: "BrowserPool", driver, port: int):
+        self.pool = pool
+        self.driver = driver
+        self.port = port
+        self.uses = 0
 
-        return filename
-    except Exception as e:
-        print(f"Error capturing tweet {url}: {str(e)}")
-        return None
+    def __getattr__(self, name):
+        return getattr(self.driver, name)
+
+    def quit(self):
+        self.pool.release(self)
+
+    def healthy(self) -> bool:
+        try:
+            self.driver.execute_script("return 1")
+            return True
+        except Exception:
+            return False
+
+
+class BrowserPool:
+    # Keeps up to `size` warm Chrome instances and reuses them across
+    # captures, replacing any that crash or reach `max_uses`.
+
+    def __init__(
+        self,
+        size: int = BROWSER_POOL_SIZE,
+        max_uses: int = BROWSER_MAX_USES,
+        base_port: int = BROWSER_BASE_PORT,
+    ):
+        self.size = size
+        self.max_uses = max_uses
+        self.free_ports = list(range(base_port, base_port + size))
+        self.idle: List[PooledDriver] = []
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loop = None
+
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        # The pool outlives event loops in long-running processes
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.size)
+            self._loop = loop
+        return self._semaphore
+
+    async def screenshot(self, url: str, path: str) -> str:
+        async with self.semaphore:
+            install_pooled_driver()
+            token = current_pool.set(self)
+            try:
+                tweet = tweetcapture.TweetCapture()
+                return await tweet.screenshot(url, path=path, overwrite=True)
+            finally:
+                current_pool.reset(token)
+
+    async def acquire(
+        self, custom_options=None, driver_path=None, gui=False, scale=1.0
+    ):
+        while self.idle:
+            pooled = self.idle.pop()
+            if pooled.healthy():
+                pooled.uses += 1
+                return pooled
+            self.discard(pooled)
+
+        port = self.free_ports.pop()
+        options = list(custom_options or []) + [f"--remote-debugging-port={port}"]
+        print(f"Starting browser on port {port}")
+        driver = await create_driver(options, driver_path, gui, scale)
+        if driver is None:
+            self.free_ports.append(port)
+            return None
+        pooled = PooledDriver(self, driver, port)
+        pooled.uses += 1
+        return pooled
+
+    def release(self, pooled: PooledDriver):
+        if pooled.uses >= self.max_uses or not pooled.healthy():
+            self.discard(pooled)
+            return
+        try:
+            pooled.driver.delete_all_cookies()
+            pooled.driver.get("about:blank")
+        except Exception:
+            self.discard(pooled)
+            return
+        self.idle.append(pooled)
+
+    def discard(self, pooled: PooledDriver):
+        print(f"Recycling browser on port {pooled.port}")
+        try:
+            pooled.driver.quit()
+        except Exception as e:
+            print(f"Error closing browser: {e}")
+        self.free_ports.append(pooled.port)
 
+    def close(self):
+        while self.idle:
+            self.discard(self.idle.pop())
 
-def create_backdrop(tweet_image_path, output_path):
-    tweet_image = Image.open(tweet_image_path)
-    tweet_width, tweet_height = tweet_image.size
 
-    # Add padding
-    padding = 50
-    tweet_width_padded = tweet_width + 2 * padding
-    tweet_height_padded = tweet_height + 2 * padding
+async def pooled_get_driver(
+    custom_options=None, driver_path=None, gui=False, scale=1.0
+):
+    pool = current_pool.get()
+    if pool is None:
+        return await create_driver(custom_options, driver_path, gui, scale)
+    return await pool.acquire(custom_options, driver_path, gui, scale)
 
-    # Create a 9:16 backdrop
-    backdrop_width = max(tweet_width_padded, int(tweet_height_padded * 9 / 16))
-    backdrop_height = max(tweet_height_padded, int(tweet_width_padded * 16 / 9))
 
-    # Determine background color based on tweet image
-    tweet_colors = tweet_image.getcolors(tweet_image.size[0] * tweet_image.size[1])
-    avg_color = sum(color[0] * color[1][0] for color in tweet_colors) / sum(
-        color[0] for color in tweet_colors
-    )
-    bg_color = "white" if avg_color < 128 else "black"
+def install_pooled_driver():
+    # TweetCapture.screenshot looks get_driver up on its module for every
+    # capture. Patched on the first capture, importing selenium is slow.
+    global create_driver
+    if create_driver is None:
+        create_driver = tweetcapture_screenshot.get_driver
+        tweetcapture_screenshot.get_driver = pooled_get_driver
 
-    backdrop = Image.new("RGB", (backdrop_width, backdrop_height), bg_color)
 
-    # Calculate position to center the tweet
-    x = (backdrop_width - tweet_width_padded) // 2
-    y = (backdrop_height - tweet_height_padded) // 2
+browser_pool = BrowserPool()
+atexit.register(browser_pool.close)
 
-    # Create a new image with padding for shadow
-    padded_tweet = Image.new(
-        "RGBA", (tweet_width_padded, tweet_height_padded), (0, 0, 0, 0)
-    )
 
-    # Paste the original tweet image
-    padded_tweet.paste(tweet_image, (padding, padding))
+def tweet_filename(url):
+    # Generate a filename based on the URL and username
+    username = url.split("/")[
+        -3
+    ]  # Assuming the URL format is twitter.com/username/status/id
+    return os.path.join(workspace().tweets, f"{username}_{url.split('/')[-1]}.png")
+
+
+async def capture_tweet(url):
+    try:
+        # Create 'tweets' directory if it doesn't exist
+        os.makedirs(workspace().tweets, exist_ok=True)
+
+        filename = tweet_filename(url)
+
+        key = cache_key("tweet", url=url)
+        cached = asset_cache.get(key)
+        if cached:
+            return asset_cache.copy_to(cached, filename)
+
+        with span("tweet.screenshot", url=url):
+            await browser_pool.screenshot(url, filename)
+
+        with open(filename, "rb") as f:
+            asset_cache.put(
+                key, source="tweet", data=f.read(), provider_id=url, suffix=".png"
+            )
+
+        return filename
+    except Exception as e:
+        print(f"Error capturing tweet {url}: {str(e)}")
+        return None
 
-    # Paste the padded tweet onto the backdrop
-    backdrop.paste(padded_tweet, (x, y), padded_tweet)
 
-    backdrop.save(output_path)
-    return output_path
+async def create_backdrop(tweet_image_path) -> bytes:
+    # Returns the letterboxed tweet as PNG bytes
+    with span("composite.tweet"):
+        return await run_in_process(compose_tweet_backdrop, tweet_image_path)
 
 
 async def capture_tweets(tweet_urls: List[str | None]):
-    port = 9222
-    tasks = []
-    for url in tweet_urls:
-        tasks.append(asyncio.create_task(capture_tweet(url, port)))
-        port += 1
+    tasks = [asyncio.create_task(capture_tweet(url)) for url in tweet_urls]
 
     filenames = []
     for task in asyncio.as_completed(tasks):
         try:
             filename = await task
             if filename:
-                output_filename = f"{os.path.splitext(filename)[0]}_backdrop.png"
-                backdrop_filename = create_backdrop(filename, output_filename)
-                url = await upload_to_cloudflare(backdrop_filename)
+                backdrop = await create_backdrop(filename)
+                url = await upload_to_cloudflare(backdrop)
                 filenames.append(url)
         except Exception as e:
             print(f"Error processing task: {str(e)}")
@@ -0,0 +1,79 @@
+import contextvars
+import os
+
+from mux_audio_and_video import AUDIO_FILES
+from utils import clear_directory
+
+# Where main.py keeps one workspace per run, so a failed run can be resumed
+RUNS_DIR = os.environ.get("RUNS_DIR", "runs")
+
+
+class Workspace:
+    # Where one render keeps its narration, captions, intermediate videos and
+    # screenshots, along with the run manifest. Every run of main.py gets its
+    # own under RUNS_DIR, batch jobs each get one so they can run side by side.
+
+    def __init__(self, root: str = "."):
+        self.root = root
+
+    def path(self, *parts: str) -> str:
+        return os.path.join(self.root, *parts)
+
+    def audio(self, audio_format: str) -> str:
+        return self.path(AUDIO_FILES[audio_format])
+
+    @property
+    def captions(self) -> str:
+        return self.path("captions.srt")
+
+    @property
+    def words(self) -> str:
+        # Narration word timings, see generate_audio.SrtWriter
+        return self.path("words.json")
+
+    @property
+    def output(self) -> str:
+        return self.path("output.mp4")
+
+    @property
+    def final_output(self) -> str:
+        return self.path("final_output.mp4")
+
+    @property
+    def manifest(self) -> str:
+        return self.path("manifest.json")
+
+    @property
+    def clips(self) -> str:
+        # Prepared clips outlive a failed run, they are removed after render
+        return self.path("clips")
+
+    @property
+    def memes(self) -> str:
+        return self.path("memes")
+
+    @property
+    def tweets(self) -> str:
+        return self.path("tweets")
+
+    def create(self):
+        os.makedirs(self.root, exist_ok=True)
+        return self
+
+    def clear_intermediates(self):
+        for directory in [self.memes, self.tweets]:
+            if os.path.exists(directory):
+                clear_directory(directory)
+                print(f"Cleared contents of {directory} directory")
+            else:
+                print(f"{directory} directory does not exist")
+
+
+# Each job's task sets its own workspace, providers that write files read it
+current_workspace: contextvars.ContextVar[Workspace] = contextvars.ContextVar(
+    "current_workspace", default=Workspace()
+)
+
+
+def workspace() -> Workspace:
+    return current_workspace.get()